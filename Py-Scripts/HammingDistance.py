@@ -1,62 +1,212 @@
-#! /usr/local/bin/python
+#! /usr/local/bin/python3
 
 import re
 import os
 import sys
-import random
+import csv
+import mmap
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+import fastaIndex as fi
+
+#
+# Distanza di Hamming (case insensitive) tra sequenze fasta.
+# I file sono mappati in memoria (mmap, o decompressi se gzip/BGZF) e le sequenze, individuate con
+# l'indice di fastaIndex (.pai), sono confrontate come array uint8 a blocchi di chunkBases basi:
+# maiuscole/minuscole sono unificate con una tabella di lookup e i fine riga sono esclusi con una
+# vista (righe x lineBytes)[:, :lineBases] senza copiare il file. I blocchi sono distribuiti su
+# threads thread (numpy rilascia il GIL), quindi anche una sola coppia molto lunga e' parallela.
+# Le sequenze di lunghezza diversa sono confrontate sulle prime min(lenA, lenB) basi. Un file senza
+# header e' confrontato come una sola sequenza; un file senza basi e' un errore.
+#
+# Usage: HammingDistance.py [-t threads] sequence1 sequence2
+#            confronta la i-esima sequenza di sequence1 con la i-esima di sequence2
+#        HammingDistance.py [-t threads] [-o out.csv] -d dataset.fasta [...]
+#            per ogni dataset multi coppia (DatasetBuilder) distanza di ogni coppia A-B e media del dataset
+#
+
+chunkBases = 16 * 1024 * 1024
+
+foldTable = np.arange(256, dtype=np.uint8)
+foldTable[ord('a'):ord('z') + 1] -= ord('a') - ord('A')
 
 
+def hamming_distance(seq1: str, seq2: str) -> int:
+    n = min(len(seq1), len(seq2))
+    a = np.frombuffer(seq1[:n].encode(), dtype=np.uint8)
+    b = np.frombuffer(seq2[:n].encode(), dtype=np.uint8)
+    return int(np.count_nonzero(foldTable[a] != foldTable[b]))
+
+
+
+
+# basi [start, start + size) del record come array uint8 (vista sul file quando le basi sono contigue)
+def basesView(buf, record: fi.FastaRecord, start: int, size: int):
+    end = min(start + size, record.length)
+    (lineBases, lineBytes) = (record.lineBases, record.lineBytes)
+    if (start >= end):
+        return buf[0:0]
+    if (lineBytes == lineBases):
+        return buf[record.offset + start:record.offset + end]
+
+    parts = []
+    if (start % lineBases != 0):
+        # resto della prima riga
+        n = min(lineBases - start % lineBases, end - start)
+        p = record.offset + (start // lineBases) * lineBytes + start % lineBases
+        parts.append(buf[p:p + n])
+        start += n
+    nLines = (end - start) // lineBases
+    if (nLines > 0 and start + nLines * lineBases >= record.length):
+        nLines -= 1     # l'ultima riga del record puo' non avere il fine riga
+    if (nLines > 0):
+        p = record.offset + (start // lineBases) * lineBytes
+        parts.append(buf[p:p + nLines * lineBytes].reshape(nLines, lineBytes)[:, :lineBases].ravel())
+        start += nLines * lineBases
+    if (start < end):
+        p = record.offset + (start // lineBases) * lineBytes
+        parts.append(buf[p:p + end - start])
+    return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+
+def chunkDistance(task):
+    (buf1, record1, buf2, record2, start, size) = task
+    a = basesView(buf1, record1, start, size)
+    b = basesView(buf2, record2, start, size)
+    return int(np.count_nonzero(foldTable[a] != foldTable[b]))
+
+
+# distanze delle coppie [(bufA, recordA, bufB, recordB), ...]: ritorna [(distanza, lenA, lenB), ...]
+def pairDistances(pairs: list, threads: int = 1):
+    tasks = []
+    owners = []
+    for (i, (buf1, r1, buf2, r2)) in enumerate(pairs):
+        n = min(r1.length, r2.length)
+        for start in range(0, n, chunkBases):
+            tasks.append((buf1, r1, buf2, r2, start, min(chunkBases, n - start)))
+            owners.append(i)
+
+    dists = [0] * len(pairs)
+    if (threads <= 1):
+        results = map(chunkDistance, tasks)
+    else:
+        executor = ThreadPoolExecutor(max_workers=threads)
+        results = executor.map(chunkDistance, tasks)
+    for (i, d) in zip(owners, results):
+        dists[i] += d
+    if (threads > 1):
+        executor.shutdown()
+    return [ (dists[i], r1.length, r2.length) for (i, (buf1, r1, buf2, r2)) in enumerate(pairs)]
 
 
-def hamming_distance(seq1: str, seq2: str) -> int:
-    seq1 = seq1.upper()
-    seq2 = seq2.upper()
-    d = sum([ c1 != c2 for c1, c2 in zip(seq1, seq2)])
-    return d
 
-def hamming_distance2(seq1: str, seq2: str) -> int:
-    return len(list(filter(lambda x : ord(x[0])^ord(x[1]), zip(seq1, seq2))))
 
+# record unico per un file senza header: tutto il contenuto (senza i fine riga) e' la sequenza
+def headerlessRecord(name: str, data, buf):
+    (length, lineBases, lineBytes) = fi.recordLayout(name, data, buf, 0, len(data))
+    return fi.FastaRecord(name, 1, '-', 0, length, lineBases, lineBytes)
 
 
-# parametri sulla linea di comando
-# inputSeqence theta
-def CompareSequences():
 
-    (dist, tot1, tot2) = (0, 0, 0)
 
-    if (len(sys.argv) == 3):
-        inputFile1 = sys.argv[1]
-        inputFile2 = sys.argv[2]
-    else:
-        print("Errore nei parametri:\nUsage: %s sequence1 sequence2" % os.path.basename(sys.argv[0]))
-        exit(-1)
+class MappedFasta:
+    def __init__(self, fastaFile: str):
+        if (os.path.getsize(fi.localPath(fastaFile)) == 0):
+            raise ValueError("%s: empty file" % fastaFile)
+        self.records = fi.loadIndex(fastaFile)
+        self.data = fi.localData(fi.localPath(fastaFile))
+        self.buf = np.frombuffer(self.data, dtype=np.uint8)
+        if (len(self.records) == 0):
+            self.records = [ headerlessRecord(os.path.basename(fastaFile), self.data, self.buf)]
+        if (sum(r.length for r in self.records) == 0):
+            self.close()
+            raise ValueError("%s: no sequence data" % fastaFile)
 
-    with open(inputFile1, "r") as inFile1, open(inputFile2, "r") as inFile2:
-        while( True):
-            # skip all comment lines from file1
-            while (True):
-                line1 = inFile1.readline()
-                if (not line1.startswith(">")):
-                    break
+    def close(self):
+        del self.buf
+        if (isinstance(self.data, mmap.mmap)):
+            self.data.close()
 
-            while (True):
-                line2 = inFile2.readline()
-                if (not line2.startswith(">")):
-                    break
-            if (line1 == "" and line2 == ""):
-                # entrambi i file sono terminati
-                break
+    def __enter__(self):
+        return self
 
-            dist += hamming_distance( line1, line2)
-            tot1 += len(line1) - 1 # \n
-            tot2 += len(line2) - 1 # \n
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+        return False
 
-        inFile2.close()
-    print("Hamming distance: %s (%d) vs %s (%d) = %d (%.2f%%)" % (inputFile1, tot1, inputFile2, tot2, dist, dist/tot1*100))
 
 
 
-if __name__ == "__main__":
-    CompareSequences()
+def CompareSequences(inputFile1: str, inputFile2: str, threads: int = 1):
+    with MappedFasta(inputFile1) as f1, MappedFasta(inputFile2) as f2:
+        if (len(f1.records) != len(f2.records)):
+            print("Warning: %s has %d sequences, %s has %d" % (inputFile1, len(f1.records), inputFile2, len(f2.records)))
+        results = pairDistances([ (f1.buf, r1, f2.buf, r2) for (r1, r2) in zip(f1.records, f2.records)], threads)
+
+    dist = sum(r[0] for r in results)
+    tot1 = sum(r.length for r in f1.records)
+    tot2 = sum(r.length for r in f2.records)
+    print("Hamming distance: %s (%d) vs %s (%d) = %d (%.2f%%)" % (inputFile1, tot1, inputFile2, tot2, dist, dist / max(tot1, 1) * 100))
+    return (dist, tot1, tot2)
+
+
+# distanze di tutte le coppie (A, B) di un dataset: [(seqId, lenA, lenB, distanza), ...]
+def DatasetDistances(dataset: str, threads: int = 1):
+    with MappedFasta(dataset) as f:
+        pairs = fi.indexPairs(f.records)
+        results = pairDistances([ (f.buf, a, f.buf, b) for (a, b) in pairs], threads)
+    return [ (a.seqId, lenA, lenB, d) for ((a, b), (d, lenA, lenB)) in zip(pairs, results)]
+
 
+
+
+def main():
+    args = sys.argv[1:]
+    threads = 1
+    outFile = None
+    datasets = False
+    while (len(args) > 0 and args[0].startswith('-')):
+        if (args[0] == '-t' and len(args) > 1):
+            threads = int(args[1]) if int(args[1]) > 0 else os.cpu_count()
+            args = args[2:]
+        elif (args[0] == '-o' and len(args) > 1):
+            outFile = args[1]
+            args = args[2:]
+        elif (args[0] == '-d'):
+            datasets = True
+            args = args[1:]
+        else:
+            break
+
+    if ((not datasets and len(args) != 2) or (datasets and len(args) == 0)):
+        print("Errore nei parametri:\nUsage: %s [-t threads] sequence1 sequence2\n       %s [-t threads] [-o out.csv] -d dataset.fasta [...]" %
+              (os.path.basename(sys.argv[0]), os.path.basename(sys.argv[0])))
+        exit(-1)
+
+    if (not datasets):
+        try:
+            CompareSequences(args[0], args[1], threads)
+        except ValueError as e:
+            print("Errore: %s" % e, file=sys.stderr)
+            exit(-1)
+        return
+
+    out = open(outFile, 'w', newline='') if outFile is not None else sys.stdout
+    try:
+        csvWriter = csv.writer(out)
+        csvWriter.writerow(['dataset', 'seqId', 'lenA', 'lenB', 'distance', 'normDistance'])
+        for dataset in args:
+            rows = DatasetDistances(dataset, threads)
+            for (seqId, lenA, lenB, d) in rows:
+                csvWriter.writerow([os.path.basename(dataset), seqId, lenA, lenB, d, d / max(min(lenA, lenB), 1)])
+            mean = np.mean([ d / max(min(lenA, lenB), 1) for (seqId, lenA, lenB, d) in rows]) if len(rows) > 0 else 0.0
+            print("****** %s: %d pairs, mean Hamming distance = %.6f ******" % (dataset, len(rows), mean), file=sys.stderr)
+    finally:
+        if (outFile is not None):
+            out.close()
+
+
+
+if __name__ == "__main__":
+    main()
@@ -15,7 +15,8 @@ import numpy
 import numpy as np
 import py_kmc_api as kmc
 
-import splitFasta
+import pairGenerator as pgen
+import fastaIndex
 
 hdfsPrefixPath = 'hdfs://master2:9000/user/cattaneo/data'
 hdfsPrefixPath = '/Users/pipp8/Universita/Src/IdeaProjects/PowerStatistics/data'
@@ -72,12 +73,6 @@ def checkPathExists(path: str) -> bool:
     return fs.exists(sc._jvm.org.apache.hadoop.fs.Path(path))
 
 
-def hamming_distance(seq1: str, seq2: str) -> int:
-    return sum(c1 != c2 for c1, c2 in zip(seq1, seq2))
-
-def hamming_distance2(seq1: str, seq2: str) -> int:
-    return len(list(filter(lambda x : ord(x[0])^ord(x[1]), zip(seq1, seq2))))
-
 
 # load histogram for both sequences (for counter based measures such as D2)
 def loadHistogram(kmerDict: dict, histFile: str, pairId: str):
@@ -541,58 +536,109 @@ def saveSingleSequence(prefix, seq, header, sequence):
 
 
 
-# processo una coppia del tipo (id, (hdrA, seqA), (hdrB, seqB))
-def processPairs(pair):
+# istogramma dei k-mer (k <= 32) di una sequenza in memoria (array di basi):
+# codici a 2 bit ordinati e relativi contatori, come kmc -b -ci0 sul file della sequenza
+# (i k-mer che contengono basi diverse da A, C, G, T sono scartati)
+def sequenceHistogram(seq, k):
+    codeTable = np.zeros(256, dtype=np.uint64)
+    codeTable[np.frombuffer(b'ACGT', dtype=np.uint8)] = np.arange(4, dtype=np.uint64)
+    isBase = np.zeros(256, dtype=bool)
+    isBase[np.frombuffer(b'ACGT', dtype=np.uint8)] = True
+    values = codeTable[seq]
+    n = max(0, len(seq) - k + 1)
+    codes = np.zeros(n, dtype=np.uint64)
+    for j in range(k):
+        codes = (codes << np.uint64(2)) | values[j:j + n]
+    invalid = np.concatenate(([0], np.cumsum(~isBase[seq])))
+    return np.unique(codes[invalid[k:k + n] == invalid[:n]], return_counts=True)
+
+
 
-    tempDir = os.path.dirname(pair[0])
-    filename = os.path.splitext(os.path.basename(pair[0]))[0]
-    filename = filename[:len(filename)-2]
 
-    # dataset = seqPair[0]
-    m = re.search(r'^(.*)-(\d+)\.(\d+)(.*)', filename)
+def runMashStreams(fastaA, fastaB, k, tempDir):
+    # come runMash ma le sequenze sono passate a mash sullo stdin
+    mashValues = []
+    for i in range(len(sketchSizes)):
+        sketches = []
+        for (id, fasta) in [('A', fastaA), ('B', fastaB)]:
+            mashout = "%s/mash-%s" % (tempDir, id)
+            cmd = "/usr/local/bin/mash sketch -s %d -k %d -o %s -" % (sketchSizes[i], k, mashout)
+            p = subprocess.Popen(cmd.split(), stdin=subprocess.PIPE)
+            p.communicate(fasta)
+            sketches.append(mashout + '.msh')
+
+        cmd = "/usr/local/bin/mash dist %s %s" % (sketches[0], sketches[1])
+        out = subprocess.check_output(cmd.split())
+        mashValues.append( MashData( out))
+        for f in sketches:
+            os.remove(f)
+
+    data2 = []
+    for i in range(len(sketchSizes)):
+        data2.append( mashValues[i].Pv)
+        data2.append( mashValues[i].dist)
+        data2.append( mashValues[i].A)
+        data2.append( mashValues[i].N)
+
+    return data2
+
+
+
+
+# come processLocalPair per una coppia prodotta da pairGenerator (o letta con l'indice del dataset): nessun file intermedio
+# (conteggio dei k-mer in memoria, sequenze passate a mash sullo stdin)
+def processGeneratedPair(pair, k, tempDir):
+
+    (model, seqId, gamma, seqA, seqB) = pair
+    data0 = [model, gamma, len(seqA), seqId, k]
+
+    (codesA, cntA) = sequenceHistogram(seqA, k)
+    (codesB, cntB) = sequenceHistogram(seqB, k)
+
+    codes = np.union1d(codesA, codesB)
+    cnts = np.zeros( shape=(2, len(codes)), dtype='int32')
+    cnts[0, np.searchsorted(codes, codesA)] = cntA
+    cnts[1, np.searchsorted(codes, codesB)] = cntB
+
+    entropySeq = []
+    for c in (cntA, cntB):
+        prob = c / float(c.sum())
+        entropySeq.append( EntropyData( len(c), int(c.sum()), -float(np.dot(prob, np.log2(prob)))))
+
+    (zScoreLeft, zScoreRight) = ZScoreNormalization( cnts, k)
+    (bothCnt, leftCnt, rightCnt) = extractStatistics(cnts)
+
+    dati3 = runCountBasedMeasures(cnts, k, zScoreLeft, zScoreRight)
+    cnts = None
+
+    dati1 = runPresentAbsent(bothCnt, leftCnt, rightCnt, k)
+
+    fasta = pgen.fastaPair(model, seqId, gamma, seqA, seqB)
+    split = fasta.index(b'>', 1)
+    dati2 = runMashStreams(fasta[:split], fasta[split:], k, tempDir)
+
+    dati4 = entropyData(entropySeq[0], entropySeq[1])
+
+    return data0 + dati1 + dati2 + dati3 + dati4
+
+
+
+
+# coppie di un dataset lette direttamente (mmap) tramite l'indice .pai, senza dividerlo in file
+def datasetPairs(ds):
+    m = re.search(r'^(.*)-(\d+)\.(\d+)(.*).fasta', os.path.basename(ds))
     if (m is None):
-        raise ValueError("Malformed sequences pair (name=<%s>)" % filename)
-    else:
-        model = m.group(1)
-        seqId = int(m.group(2))
-        seqLen = int(m.group(3))
-        gamma = m.group(4)
+        raise ValueError("Malformed file name <%s>" % ds)
+    model = m.group(1)
+    gamma = m.group(4)
+    g = float(gamma[3:]) if (len(gamma) > 0) else 0.0
 
-    # header = seqPair[1][0]
-    # m = re.search(r'^>(.+)\.(\d+)(.*)-([AB]$)', header)
-    # if (m is not None):
-    #     # seqName = m.group(1)
-    #     seqId = int(m.group(2))
-    #     # gValue = m.group(3)
-    #     pairId = m.group(4)
-    #
-    # # process local file system temporary directory
-    # tempDir = tempfile.mkdtemp()
-
-    # common prefix
-    fileNamePrefix = "%s/%s-%04d.%d%s" % (tempDir, model, seqId, seqLen, gamma)
-    # save sequence seqId-A
-    # saveSingleSequence(fileNamePrefix, 'A', seqPair[1][0], seqPair[1][1])
-    # save sequence seqId-B
-    # saveSingleSequence(fileNamePrefix, 'B', seqPair[2][0], seqPair[2][1])
-
-    results = []
-    for k in range( minK, maxK+1, stepK):
-        print("**** starting local computation for k = %d *****" % k)
-        # run kmc on both the sequences and eval A, B, C, D + Mash + Entropy
-        g = float(gamma[3:]) if (len(gamma) > 0) else 0.0
-        results.append(processLocalPair(fileNamePrefix, model, seqId, seqLen, g, k))
-
-    # clean up
-    # do not remove dataset on hdfs
-    # remove histogram files (A & B) + mash sketch file and kmc temporary files
-    try:
-        print("Cleaning temporary directory %s" % (tempDir))
-        shutil.rmtree(tempDir)
-    except OSError as e:
-        print("Error removing: %s: %s" % (tempDir, e.strerror))
+    with fastaIndex.FastaReader(ds) as reader:
+        for (recA, recB) in fastaIndex.indexPairs(fastaIndex.loadIndex(ds)):
+            seqA = np.frombuffer(reader.sequence(recA), dtype=np.uint8)
+            seqB = np.frombuffer(reader.sequence(recB), dtype=np.uint8)
+            yield (model, recA.seqId, g, seqA, seqB)
 
-    return results
 
 
 
@@ -646,7 +692,17 @@ def main():
     global hdfsDataDir, hdfsPrefixPath,  outFilePrefix, spark
 
     argNum = len(sys.argv)
-    if (argNum < 2 or argNum > 3):
+    generate = argNum >= 4 and sys.argv[2] == 'generate'
+    if (generate):
+        """
+            Usage: LocalPresentAbsent4 seqLength generate nPairs [seed]
+            le coppie NM, T1, MR e PT (per i valori di gamma di pairGenerator) sono generate in memoria
+        """
+        seqLen = int(sys.argv[1])
+        nPairs = int(sys.argv[3])
+        seed = int(sys.argv[4]) if (argNum > 4) else None
+        outFile = '%s-generated-%d.%d.csv' % (outFilePrefix, nPairs, seqLen)
+    elif (argNum < 2 or argNum > 3):
         """
             Usage: PySparkPresentAbsent4 seqLength [dataMode]
         """
@@ -656,9 +712,9 @@ def main():
         hdfsDataDir = '%s/%s/len=%d' % (hdfsPrefixPath, dataMode, seqLen)
         outFile = '%s/%s/%s-%s.%d.csv' % (hdfsPrefixPath, dataMode, outFilePrefix, dataMode, seqLen)
 
-    print("hdfsDataDir = %s" % hdfsDataDir)
-
-    inputDataset = '%s/%s' % (hdfsDataDir, inputRE)
+    if (not generate):
+        print("hdfsDataDir = %s" % hdfsDataDir)
+        inputDataset = '%s/%s' % (hdfsDataDir, inputRE)
 
     columns0 = ['model', 'gamma', 'seqLen', 'pairId', 'k'] # dati 0
     columns1 = [ 'A', 'B', 'C', 'D', 'N',
@@ -678,28 +734,42 @@ def main():
     columns4 = ['NKeysA', '2*totalCntA', 'deltaA', 'HkA', 'errorA',
                 'NKeysB', '2*totalCntB', 'deltaB', 'HkB', 'errorB']
 
-    import splitFasta
-
     with open(outFile, 'w', encoding='UTF8', newline='') as f:
         writer = csv.writer(f)
 
         # write the header
         writer.writerow(columns0 + columns1 + columns2 + columns3 + columns4)
 
+        if (generate):
+            tempDir = tempfile.mkdtemp()
+            for pair in pgen.generateDataset(seqLen, nPairs, seed=seed):
+                for k in range( minK, maxK+1, stepK):
+                    print("**** %s-%04d k = %d *****" % (pair[0], pair[1], k))
+                    writer.writerow(processGeneratedPair(pair, k, tempDir))
+            shutil.rmtree(tempDir)
+            return
+
         inputDataset = glob.glob( '%s/%s' % (hdfsDataDir, inputRE))
         inputDataset.sort()   # necessario perchè glob produce un output disordinato
         dataset = iter(inputDataset)
+        tempDir = tempfile.mkdtemp()
         for ds in dataset:    # processa la lista a coppie
             # write multiple rows
-            tmpDir = 'seqDists'
-            pair = splitFasta.splitFastaSequences(ds,tmpDir)
-            writer.writerows(processPairs(pair))
+            for pair in datasetPairs(ds):
+                for k in range( minK, maxK+1, stepK):
+                    print("**** %s-%04d k = %d *****" % (pair[0], pair[1], k))
+                    writer.writerow(processGeneratedPair(pair, k, tempDir))
+        shutil.rmtree(tempDir)
 
 
 
 # data program profile:
-# main ->   splitPairs
-#           processPairs -> processLocalPair -> extractKmers(A)
+# main ->   datasetPairs (o pgen.generateDataset)
+#           processGeneratedPair -> sequenceHistogram(A), sequenceHistogram(B) -> ZScoreNormalization()
+#                                -> runCountBasedMeasures(), extractStatistics(), runPresentAbsent()
+#                                -> runMashStreams(), entropyData()
+# processLocalPair (file A/B su disco)
+#                                            -> extractKmers(A)
 #                                            -> extractKmers(B)
 #                                            -> loadHistogram(A)    -> kmerDict(kmer, (cnt1, 0))
 #                                            -> loadHistogram(B)    -> kmerDict(kmer, (cnt1, cnt2))
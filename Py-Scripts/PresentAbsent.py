@@ -7,7 +7,7 @@ import glob
 import subprocess
 import csv
 import math
-from filelock import Timeout, FileLock
+import resultSink
 import numpy as np
 
 libPath = '/home/cattaneo/spark/power_statistics/scripts'
@@ -30,6 +30,13 @@ minK = 4
 maxK = 32
 sketchSize = 1000
 outFile = 'PresentAbsentData.csv'
+header = ['model', 'gamma', 'seqLen', 'pairId', 'k', 'A', 'B', 'C', 'D', 'N',
+          'Anderberg', 'Antidice', 'Dice', 'Gower', 'Hamman', 'Hamming',
+          'Jaccard', 'jaccardDistance', 'Kulczynski', 'Matching', 'Ochiai',
+          'Phi', 'Russel', 'Sneath', 'Tanimoto', 'Yule',
+          'Mash Pv', 'Mash Distance', 'A/N',
+          'NKeys', '2*totalCnt', 'delta', 'Hk', 'error']
+sink = None
 
 # variabili globali per il calcolo dell'entropia
 Hk = 0.0
@@ -275,31 +282,8 @@ def runPresentAbsent( ds, k):
             mashResults[2], mashResults[3], mashResults[4],
             nKeys, 2*totalCnt, delta, Hk, delta/Hk ]
 
-    lock = FileLock(outFile + '.lck')
-    try:
-        lock.acquire(5)
-        print("Lock acquired.")
-        print( data)
-        if (not os.path.exists( outFile)):
-            f = open(outFile, 'w')
-            writer = csv.writer(f)
-            header = ['model', 'gamma', 'seqLen', 'pairId', 'k', 'A', 'B', 'C', 'D', 'N',
-                      'Anderberg', 'Antidice', 'Dice', 'Gower', 'Hamman', 'Hamming',
-                      'Jaccard', 'jaccardDistance', 'Kulczynski', 'Matching', 'Ochiai',
-                      'Phi', 'Russel', 'Sneath', 'Tanimoto', 'Yule',
-                      'Mash Pv', 'Mash Distance', 'A/N',
-                      'NKeys', '2*totalCnt', 'delta', 'Hk', 'error']
-            writer.writerow(header)
-        else:
-            f = open(outFile, 'a')
-            writer = csv.writer(f)
-
-        writer.writerow(data)
-        f.close()
-        lock.release()
-
-    except Timeout:
-        print("Another instance of this application currently holds the lock.")
+    print( data)
+    sink.write(data)
 
     # clean up remove kmc temporary files
     for f in glob.glob('%s/*%s-*' % (tempDir, ds)):
@@ -308,40 +292,44 @@ def runPresentAbsent( ds, k):
 
 
 def main():
+    global sink
 
     # process private temporary directory
     os.mkdir(tempDir)
 
-    for seqLen in lengths:
-        for model in models:
-            gammas = [ ' ' ]  if model.startswith('Uniform') else gVals        
-            for g in gammas:
-                # PatTransf-U-1000.9600000.G=0.100.fasta oppure Uniform-1000.1000000.fasta
-                gamma = '' if g == ' ' else '.G=0.%03d' % g
-                dataset = '%s-%d.%d%s.fasta' % (model, nPairs, seqLen, gamma)
-                
-                # download from hdfs the dataset
-                cmd = "hdfs dfs -get %s/%s ." % (hdfsDataDir, dataset) 
-                p = subprocess.Popen(cmd.split())
-                p.wait()
-                print("cmd: %s returned: %s" % (cmd, p.returncode))
-                
-                splitFasta.splitFastaSequences( dataset)
-            
-                for seqId in range(1, nTests+1):
-                    
-                    ds = '%s-%04d.%d%s' % (model, seqId, seqLen, gamma)
-                    for k in range(4, 33, 4):
-                        
-                        # run kmc on both the sequences and eval A, B, C, D + Mash + Entropy
-                        runPresentAbsent(ds, k)
-
-                # clean up
-                # posso rimnuovere il dataset se importato altrimenti non cancellare !!!!
-                os.remove( dataset)
-                # remove histogram files (A & B) + mash sketch files
-                for f in glob.glob('%s/%s-*' % (splitFasta.seqDistDir, model)):
-                    os.remove(f)
+    # righe nello shard del processo (nessuna perdita se un passo fallisce), unite a outFile da
+    # scripts/runPresentAbsentKmc.sh quando tutti i processi sono terminati
+    with resultSink.ShardedSink(outFile, header) as sink:
+        for seqLen in lengths:
+            for model in models:
+                gammas = [ ' ' ]  if model.startswith('Uniform') else gVals        
+                for g in gammas:
+                    # PatTransf-U-1000.9600000.G=0.100.fasta oppure Uniform-1000.1000000.fasta
+                    gamma = '' if g == ' ' else '.G=0.%03d' % g
+                    dataset = '%s-%d.%d%s.fasta' % (model, nPairs, seqLen, gamma)
+
+                    # download from hdfs the dataset
+                    cmd = "hdfs dfs -get %s/%s ." % (hdfsDataDir, dataset) 
+                    p = subprocess.Popen(cmd.split())
+                    p.wait()
+                    print("cmd: %s returned: %s" % (cmd, p.returncode))
+
+                    splitFasta.splitFastaSequences( dataset)
+
+                    for seqId in range(1, nTests+1):
+
+                        ds = '%s-%04d.%d%s' % (model, seqId, seqLen, gamma)
+                        for k in range(4, 33, 4):
+
+                            # run kmc on both the sequences and eval A, B, C, D + Mash + Entropy
+                            runPresentAbsent(ds, k)
+
+                    # clean up
+                    # posso rimnuovere il dataset se importato altrimenti non cancellare !!!!
+                    os.remove( dataset)
+                    # remove histogram files (A & B) + mash sketch files
+                    for f in glob.glob('%s/%s-*' % (splitFasta.seqDistDir, model)):
+                        os.remove(f)
 
 
 
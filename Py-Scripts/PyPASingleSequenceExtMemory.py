@@ -0,0 +1,341 @@
+#! /usr/local/bin/python3
+
+import os
+import os.path
+from pathlib import Path
+import sys
+import shutil
+import subprocess
+import math
+import csv
+import time
+import makeDistance as mkd
+import compressedFasta as cf
+from singleSequenceCommon import (dumpChunkSize, EntropyData, HistogramMoments, MashSketches, runMash,
+                                  runPresentAbsent, extractKmers, parseDumpBlock, standardizedMeasures, writeHeader)
+
+import numpy as np
+
+#
+# Versione single machine (senza HDFS e Spark) di PyPASingleSequenceOutMemory.py:
+# gli istogrammi prodotti da kmc vengono codificati come interi (2 bit per base, k <= 32),
+# ordinati in run di dimensione limitata da memoryBudget e salvati sul disco locale,
+# poi fusi in un unico file ordinato per sequenza. Il confronto tra A e B e' un merge
+# in streaming dei due file (memory mapped) a blocchi di dimensione fissa.
+# Misure, kmc, mash e parsing dei dump sono condivisi (singleSequenceCommon.py).
+#
+
+nTests = 1000
+minK = 4
+maxK = 32
+stepK = 4
+thetaValue = 0.0
+
+outFilePrefix = 'PresentAbsentRealGenomeData'
+
+memoryBudget = 8 * 1024 * 1024 * 1024  # bytes (RAM disponibile per run e merge)
+entryBytes = 8 + 4  # codice uint64 + contatore uint32
+
+
+
+# istogramma ordinato sul disco locale: prefix-codes.npy (uint64) e prefix-counts.npy (uint32)
+# con i momenti dei contatori e l'entropia calcolati durante il dump
+class SortedHistogram(HistogramMoments):
+    def __init__(self, prefix: str, totalKmerCnt: int):
+        super().__init__()
+        self.prefix = prefix
+        self.totalKmerCnt = totalKmerCnt
+        self.Hk = 0.0
+        self.totalProb = 0.0
+
+    def update(self, cnts):
+        super().update(cnts)
+        # calcola i valori dell'entropia in-line per non rileggere l'istogramma
+        prob = cnts[cnts > 0] / float(self.totalKmerCnt)
+        self.totalProb += float(prob.sum())
+        self.Hk += float(np.dot(prob, np.log2(prob)))
+
+    def codesFile(self):
+        return self.prefix + '-codes.npy'
+
+    def countsFile(self):
+        return self.prefix + '-counts.npy'
+
+    def open(self):
+        return (np.load(self.codesFile(), mmap_mode='r'), np.load(self.countsFile(), mmap_mode='r'))
+
+    def remove(self):
+        os.remove(self.codesFile())
+        os.remove(self.countsFile())
+
+
+
+
+# numero di elementi di un run: lascia spazio per le copie temporanee di concatenate/argsort
+def runCapacity():
+    return max(1, memoryBudget // (4 * entryBytes))
+
+
+
+
+# salva un run ordinato sul disco locale
+def spillRun(codes, cnts, runPrefix: str):
+    order = np.argsort(codes, kind='stable')
+    np.save(runPrefix + '-codes.npy', codes[order])
+    np.save(runPrefix + '-counts.npy', cnts[order])
+    return runPrefix
+
+
+
+
+# fonde i run ordinati (codici distinti) nell'istogramma hist.
+# Ad ogni passo da ciascun run si legge al piu' un blocco e si emettono solo i codici
+# <= del minimo tra gli ultimi codici dei blocchi letti: la memoria resta limitata a runCapacity()
+def mergeRuns(runs: list, hist: SortedHistogram):
+    if (len(runs) == 1):
+        os.replace(runs[0] + '-codes.npy', hist.codesFile())
+        os.replace(runs[0] + '-counts.npy', hist.countsFile())
+        return
+
+    outCodes = np.lib.format.open_memmap(hist.codesFile(), mode='w+', dtype=np.uint64, shape=(hist.nKeys,))
+    outCnts = np.lib.format.open_memmap(hist.countsFile(), mode='w+', dtype=np.uint32, shape=(hist.nKeys,))
+
+    srcs = [(np.load(r + '-codes.npy', mmap_mode='r'), np.load(r + '-counts.npy', mmap_mode='r')) for r in runs]
+    pos = [0] * len(srcs)
+    block = max(1, runCapacity() // len(srcs))
+    o = 0
+    while True:
+        active = [i for i in range(len(srcs)) if pos[i] < len(srcs[i][0])]
+        if (len(active) == 0):
+            break
+        bound = min(srcs[i][0][min(pos[i] + block, len(srcs[i][0])) - 1] for i in active)
+        codeParts = []
+        cntParts = []
+        for i in active:
+            (codes, cnts) = srcs[i]
+            end = min(pos[i] + block, len(codes))
+            end = pos[i] + int(np.searchsorted(codes[pos[i]:end], bound, side='right'))
+            codeParts.append(codes[pos[i]:end])
+            cntParts.append(cnts[pos[i]:end])
+            pos[i] = end
+        c = np.concatenate(codeParts)
+        order = np.argsort(c, kind='stable')
+        outCodes[o:o + len(c)] = c[order]
+        outCnts[o:o + len(c)] = np.concatenate(cntParts)[order]
+        o += len(c)
+
+    outCodes.flush()
+    outCnts.flush()
+    del outCodes, outCnts, srcs
+    for r in runs:
+        os.remove(r + '-codes.npy')
+        os.remove(r + '-counts.npy')
+
+
+
+
+# dump dell'istogramma kmc in run ordinati di al piu' runCapacity() k-mer e merge finale
+def loadHistogramLocal(histFile: str, k: int, totalKmerCnt: int):
+    print(f"****** Dumping & Sorting {histFile} ******")
+    hist = SortedHistogram(histFile, totalKmerCnt)
+    dump = subprocess.Popen(['/usr/local/bin/kmc_dump_x', histFile, 'stdout'], stdout=subprocess.PIPE)
+
+    runs = []
+    codeParts = []
+    cntParts = []
+    buffered = 0
+    tail = b''
+    while True:
+        chunk = dump.stdout.read(dumpChunkSize)
+        block = tail + chunk
+        if (chunk):
+            nl = block.rfind(b'\n') + 1
+            (block, tail) = (block[:nl], block[nl:])
+        elif (len(block) > 0 and not block.endswith(b'\n')):
+            block += b'\n'
+        (hi, codes, cnts) = parseDumpBlock(block, k)
+        cnts = cnts.astype(np.uint32)
+        hist.update(cnts)
+        codeParts.append(codes)
+        cntParts.append(cnts)
+        buffered += len(codes)
+        if (buffered >= runCapacity() or (not chunk and buffered > 0)):
+            runs.append(spillRun(np.concatenate(codeParts), np.concatenate(cntParts), f"{histFile}-run{len(runs)}"))
+            codeParts = []
+            cntParts = []
+            buffered = 0
+        if (not chunk):
+            break
+    dump.wait()
+
+    os.remove(histFile +'.kmc_pre') # remove kmc output prefix file
+    os.remove(histFile +'.kmc_suf') # remove kmc output suffix file
+
+    if (len(runs) == 0):
+        runs.append(spillRun(np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.uint32), f"{histFile}-run0"))
+    mergeRuns(runs, hist)
+    print(f"****** {histFile}: {hist.nKeys:,} distinct kmers, {len(runs)} runs ******")
+    return hist
+
+
+
+
+# merge in streaming dei due istogrammi ordinati: ritorna (|A intersecato B|, D2)
+def intersectHistograms(histA: SortedHistogram, histB: SortedHistogram):
+    (codesA, cntsA) = histA.open()
+    (codesB, cntsB) = histB.open()
+    block = max(1, runCapacity() // 2)
+    (i, j) = (0, 0)
+    both = D2 = 0
+    while (i < len(codesA) and j < len(codesB)):
+        iEnd = min(i + block, len(codesA))
+        jEnd = min(j + block, len(codesB))
+        # entrambe le finestre contengono tutti e soli i codici <= bound
+        bound = min(codesA[iEnd - 1], codesB[jEnd - 1])
+        iEnd = i + int(np.searchsorted(codesA[i:iEnd], bound, side='right'))
+        jEnd = j + int(np.searchsorted(codesB[j:jEnd], bound, side='right'))
+        ca = codesA[i:iEnd]
+        cb = codesB[j:jEnd]
+        if (len(ca) > 0 and len(cb) > 0):
+            idx = np.minimum(np.searchsorted(cb, ca), len(cb) - 1)
+            hit = cb[idx] == ca
+            both += int(np.count_nonzero(hit))
+            D2 += int(np.dot(cntsA[i:iEnd][hit].astype(np.uint64), cntsB[j:jEnd][idx[hit]].astype(np.uint64)))
+        (i, j) = (iEnd, jEnd)
+
+    return (both, D2)
+
+
+
+
+def processLocalPair(seqFile1: str, seqFile2: str, k: int, theta: float, tempDir: str):
+    if (k > 32):
+        raise ValueError(f"k = {k} > 32 not supported by 64 bit kmer codes")
+
+    start = time.time()
+
+    baseSeq1 = Path(seqFile1).stem
+    kmcOutputPrefixA = f"{tempDir}/{baseSeq1}-k={k}"
+    # kmc usa al piu' memoryBudget GB (-m -sm)
+    memGB = max(1, memoryBudget // (1024 * 1024 * 1024))
+    (totDistinctKmerA, totKmerA) = extractKmers(seqFile1, k, tempDir, kmcOutputPrefixA, memGB, strictMemory=True)
+    histA = loadHistogramLocal(kmcOutputPrefixA, k, totKmerA)
+
+    baseSeq2 = Path(seqFile2).stem
+    kmcOutputPrefixB = f"{tempDir}/{baseSeq2}-k={k}"
+    (totDistinctKmerB, totKmerB) = extractKmers(seqFile2, k, tempDir, kmcOutputPrefixB, memGB, strictMemory=True)
+    histB = loadHistogramLocal(kmcOutputPrefixB, k, totKmerB)
+
+    (Acnt, totD2) = intersectHistograms(histA, histB)
+    Bcnt = histA.nKeys - Acnt
+    Ccnt = histB.nKeys - Acnt
+
+    # sum (c2 - c1)^2 sull'unione = sumSqA + sumSqB - 2 D2
+    totEuclid = histA.sumSq + histB.sumSq - 2 * totD2
+    (totD2Z, totEuclidZ) = standardizedMeasures(totD2, Acnt + Bcnt + Ccnt, histA, histB)
+
+    if round(histA.totalProb,0) != 1.0:
+        print(f"****** Somma(Pa) = {round(histA.totalProb, 0):.2f} must be 1.0!!! ******")
+
+    entropySeqA = EntropyData( totDistinctKmerA, totKmerA, histA.Hk)
+
+    if round(histB.totalProb,0) != 1.0:
+        print(f"****** Somma(Pb) = {round(histB.totalProb, 0):.2f} must be 1.0!!! ******")
+
+    entropySeqB = EntropyData( totDistinctKmerB, totKmerB, histB.Hk)
+
+    euclideanDistance = math.sqrt(totEuclid)
+    euclideanDistanceZ = math.sqrt(totEuclidZ)
+    print(f"****** Euclidean = {euclideanDistance:.4f}, EuclideanZ = {euclideanDistanceZ:.4f} ******")
+    print(f"****** D2 = {totD2:,} D2Z = {totD2Z:.4f} ******")
+    print(f"****** Present/Absent = {Acnt:,}, {Bcnt:,}, {Ccnt:,} ******")
+
+    dati3 =  [totD2, totD2Z, euclideanDistance, euclideanDistanceZ]
+
+    dati1 = runPresentAbsent(Acnt, Bcnt, Ccnt, k)
+
+    mashA = MashSketches(seqFile1, k, kmcOutputPrefixA)
+    mashB = MashSketches(seqFile2, k, kmcOutputPrefixB)
+    dati2 = runMash(mashA, mashB, k)
+
+    # dati4 = dati entropia
+    dati4 = entropySeqA.toString() + entropySeqB.toString()
+
+    delay = time.time()-start
+    dati0 = [baseSeq1, baseSeq2, start, delay, theta, k]
+
+    histA.remove()
+    histB.remove()
+    mashA.remove()
+    mashB.remove()
+
+    return dati0 + dati1 + dati2 + dati3 + dati4    # nuovo record output
+
+
+
+
+# processa localmente una coppia di sequenze seqFile1 e seqFile2
+def processPairs(seqFile1: str, seqFile2: str, theta: float):
+    # run e istogrammi ordinati sono salvati nella directory temporanea ttt
+    tempDir = os.path.dirname( seqFile1)+'/ttt'
+    if (not os.path.isdir(tempDir)):
+        os.mkdir(tempDir)
+
+    # local file system result file
+    outFile = f"{os.path.dirname( seqFile1)}/{Path(seqFile1).stem}-{Path(seqFile2).stem}-T={theta:.3f}-{int(time.time())}.csv"
+    with open(outFile, 'w') as file:
+        csvWriter = csv.writer(file)
+        writeHeader(csvWriter)
+        file.flush()
+
+        if (seqFile2 == "synthetic"):
+            # produce il file allontanato da seqFile1 di un fattore theta
+            (f, ext) = cf.splitExt(seqFile1)
+            seqFile2 = f"{f}-{theta:.3f}{ext}"
+            mkd.MoveAwaySequence(seqFile1, seqFile2, theta, workers=os.cpu_count())
+
+        for k in range( minK, maxK+1, stepK):
+            print(f"****** Starting {Path(seqFile1).stem} vs {Path(seqFile2).stem} k = {k} T = {theta:.3f} ******")
+            res = processLocalPair(seqFile1, seqFile2, k, theta, tempDir)
+            csvWriter.writerow( res)
+            file.flush()
+
+    # clean up
+    try:
+        print(f"****** Cleaning temporary directory {tempDir} ******")
+        shutil.rmtree(tempDir)
+    except OSError as e:
+        print(f"Error removing: {tempDir}: {e.strerror}")
+
+
+
+
+def main():
+    global thetaValue, memoryBudget, minK, maxK
+
+    argNum = len(sys.argv)
+    if (argNum < 5 or argNum > 6):
+        print(f"Usage: {Path(sys.argv[0]).name} Sequence1 Sequence2 theta memoryGB [kValue]")
+        exit(-1)
+
+    # theta viene utilizzato SOLO se Sequence2 == "synthetic" altrimenti viene ignorato
+    thetaValue = float(sys.argv[3])
+    memoryBudget = int(float(sys.argv[4]) * 1024 * 1024 * 1024)
+
+    if (argNum == 6):
+        # use just one k value instead of all values from minK to maxK (step)
+        minK = int(sys.argv[5])
+        maxK = int(sys.argv[5])
+
+    seqFile1 = sys.argv[1]
+    seqFile2 = sys.argv[2]
+
+    print(f"****** Comparing: {Path(seqFile1).stem} vs {Path(seqFile2).stem} with {minK} <= k <= {maxK}, memory budget = {memoryBudget:,} bytes ******")
+
+    processPairs(seqFile1, seqFile2, thetaValue)
+
+
+
+
+if __name__ == "__main__":
+    main()
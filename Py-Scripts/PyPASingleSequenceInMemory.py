@@ -11,9 +11,11 @@ import copy
 import subprocess
 import math
 import csv
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import py_kmc_api as kmc
+from hdfsBulkWriter import HdfsBulkWriter
 
 from operator import add
 import pyspark
@@ -71,12 +73,6 @@ def checkPathExists(path: str) -> bool:
     return fs.exists(sc._jvm.org.apache.hadoop.fs.Path(path))
 
 
-def hamming_distance(seq1: str, seq2: str) -> int:
-    return sum(c1 != c2 for c1, c2 in zip(seq1, seq2))
-
-def hamming_distance2(seq1: str, seq2: str) -> int:
-    return len(list(filter(lambda x : ord(x[0])^ord(x[1]), zip(seq1, seq2))))
-
 
 
 
@@ -346,33 +342,28 @@ def loadHistogramOnHDFS(histFile: str, destFile: str, totKmer: int):
     totalProb = 0.0
     Hk = 0.0
 
-    URI = sc._gateway.jvm.java.net.URI
-    Path = sc._gateway.jvm.org.apache.hadoop.fs.Path
-    FileSystem = sc._gateway.jvm.org.apache.hadoop.fs.FileSystem
-    conf = sc._jsc.hadoopConfiguration()
-    fs = Path(destFile).getFileSystem(sc._jsc.hadoopConfiguration())
-    ostream = fs.create(Path(destFile))
-    writer = sc._gateway.jvm.java.io.BufferedWriter(sc._jvm.java.io.OutputStreamWriter(ostream))
-    print("HDFS Writer: %s opened" % destFile)
-
-    # histFile contiene il DB con l'istogramma di una sola sequenza prodotto con kmc 3
-    kmcFile.RestartListing()
-    while(kmcFile.ReadNextKmer( kmer, cnt)):
-        strKmer = kmer.__str__()
-        count = cnt.value
-        totalKmerCnt += count
-        totDistinct += 1
-
-        # write on HDFS the kmer with its counter
-        writer.write('%s\t%d\n' % (strKmer, count))
-        # print('%s, %d' % (strKmer, count))
-        if (count > 0):
-            prob = count / float(totKmer) # numero totale dei kmer cme contato da KMC
-            totalProb = totalProb + prob
-            Hk = Hk + prob * math.log(prob, 2)
-            # print( "prob(%s) = %f log(prob) = %f" % (key, prob, math.log(prob, 2)))
-
-    writer.close()
+    # le righe sono scritte a blocchi (e non con una chiamata py4j per k-mer): se il listing fallisce
+    # il file parziale viene rimosso dall'HDFS
+    with HdfsBulkWriter(destFile) as writer:
+        print("HDFS Writer: %s opened" % destFile)
+
+        # histFile contiene il DB con l'istogramma di una sola sequenza prodotto con kmc 3
+        kmcFile.RestartListing()
+        while(kmcFile.ReadNextKmer( kmer, cnt)):
+            strKmer = kmer.__str__()
+            count = cnt.value
+            totalKmerCnt += count
+            totDistinct += 1
+
+            # write on HDFS the kmer with its counter
+            writer.write('%s\t%d\n' % (strKmer, count))
+            # print('%s, %d' % (strKmer, count))
+            if (count > 0):
+                prob = count / float(totKmer) # numero totale dei kmer cme contato da KMC
+                totalProb = totalProb + prob
+                Hk = Hk + prob * math.log(prob, 2)
+                # print( "prob(%s) = %f log(prob) = %f" % (key, prob, math.log(prob, 2)))
+
     print("totKmerCnt = %d, totDistinct = %d" % (totalKmerCnt, totDistinct))
     
     if (round(totalProb,0) != 1.0):
@@ -461,13 +452,16 @@ def processLocalPair(seqFile1: str, seqFile2: str, k: int):
     kmcOutputPrefixB = "%s/k=%d-%s" % (tempDir, k, baseSeq2)
     totKmerB = extractKmers(seqFile2, k, tempDir, kmcOutputPrefixB)
 
-    # load kmers statistics from histogram files
+    # load kmers statistics from histogram files (upload di A e B in parallelo)
     destFilenameA = '%s/k=%d-%s.txt' % (hdfsDataDir, k, baseSeq1)
-    (totalDistinctA, totalKmerCntA, HkA) = loadHistogramOnHDFS(kmcOutputPrefixA, destFilenameA, totKmerA)
-    entropySeqA = EntropyData( totalDistinctA, totalKmerCntA, HkA)
-
     destFilenameB = '%s/k=%d-%s.txt' % (hdfsDataDir,k, baseSeq2)
-    (totalDistinctB, totalKmerCntB, HkB) = loadHistogramOnHDFS(kmcOutputPrefixB, destFilenameB, totKmerB)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        loadA = executor.submit(loadHistogramOnHDFS, kmcOutputPrefixA, destFilenameA, totKmerA)
+        loadB = executor.submit(loadHistogramOnHDFS, kmcOutputPrefixB, destFilenameB, totKmerB)
+        (totalDistinctA, totalKmerCntA, HkA) = loadA.result()
+        (totalDistinctB, totalKmerCntB, HkB) = loadB.result()
+
+    entropySeqA = EntropyData( totalDistinctA, totalKmerCntA, HkA)
     entropySeqB = EntropyData( totalDistinctB, totalKmerCntB, HkB)
 
         
@@ -11,8 +11,14 @@ import math
 import csv
 import time
 import makeDistance as mkd
+import compressedFasta as cf
+from singleSequenceCommon import (sketchSizes, dumpChunkSize, codeTable, isKmerBase, EntropyData, HistogramMoments,
+                                  MashSketches, runMash, runPresentAbsent, extractKmers, parseDumpBlock,
+                                  standardizedMeasures, writeHeader)
 
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 from operator import add
 import pyspark
@@ -34,60 +40,14 @@ nTests = 1000
 minK = 4
 maxK = 32
 stepK = 4
-sketchSizes = [1000, 10000, 100000]
-# sketchSizes = [10000]
 
 outFilePrefix = 'PresentAbsentRealGenomeData'
 
-# global broadcast variables
-totDistinctKmerAAcc = []
-totDistinctKmerBAcc = []
-totKmerAAcc = []
-totKmerBAcc = []
-kmerStats = []
+# suffisso del file di metadati (momenti dell'istogramma) salvato accanto all'istogramma sull'HDFS
+momentsSuffix = '.stats'
 
 
 
-class EntropyData:
-    def __init__(self, nKeys, totalKmerCnt, Hk):
-        self.nKeys = nKeys
-        self.totalKmerCnt = totalKmerCnt;
-        self.Hk = Hk
-
-    def getDelta(self):
-        return float(self.nKeys) / (2 * self.totalKmerCnt)
-
-    def getError(self):
-        try:
-            result = self.getDelta() / self.Hk
-        except ZeroDivisionError:
-            result = 0
-        return result
-
-    def toString(self):
-        return [self.nKeys, 2 * self.totalKmerCnt, self.getDelta(), self.Hk, self.getError()]
-
-
-
-
-class MashData:
-    def __init__(self, cmdResults):
-        mr = cmdResults.split()
-        mashAN = mr[4].decode('UTF-8')
-        self.Pv = float(mr[2])
-        self.dist = float(mr[3])
-        try:
-            ns = mashAN.index('/')
-            self.A = int(mashAN[:ns])
-            self.N = int(mashAN[ns+1:])
-        except ValueError:
-            self.A = 0
-            self.N = 0
-
-    def toString( self):
-        return [ self.Pv, self.dist, self.A, self.N ]
-
-
 def checkPathExists(path: str) -> bool:
     global hdfsDataDir, spark
     # spark is a SparkSession
@@ -98,12 +58,6 @@ def checkPathExists(path: str) -> bool:
     return fs.exists(sc._jvm.org.apache.hadoop.fs.Path(path))
 
 
-def hamming_distance(seq1: str, seq2: str) -> int:
-    return sum(c1 != c2 for c1, c2 in zip(seq1, seq2))
-
-def hamming_distance2(seq1: str, seq2: str) -> int:
-    return len(list(filter(lambda x : ord(x[0])^ord(x[1]), zip(seq1, seq2))))
-
 
 
 
@@ -150,226 +104,226 @@ def NormalizedSquaredEuclideanDistance( vector):
 
 
 
-# run jaccard on sequence pair ds with kmer of length = k
-def runPresentAbsent(  bothCnt: int, leftCnt: int, rightCnt: int, k: int):
+# load histogram for both sequences (for counter based measures such as D2)
+# and calculate Entropy of the sequence
+# dest file è la path sull'HDFS già nel formato hdfs://host:port/xxx/yyy
+def loadHistogramOnHDFS(histFile: str, destFile: str, k: int):
+    # tmp = histFile + '.txt'
+    #
+    # # dump the result -> kmer histogram
+    # cmd = "/usr/local/bin/kmc_dump %s %s" % (histFile, tmp)
+    # p = subprocess.Popen(cmd.split())
+    # p.wait()
+    # print(f"****** Dumping {histFile} kmers counting ******")
+    #
+    # # trasferisce sull'HDFS il file testuale
+    # print(f"****** Transferring to hdfs {histFile} -> {destFile} ******")
+    # cmd = "hdfs dfs -put %s %s" % (tmp, destFile)
+    # p = subprocess.Popen(cmd.split())
+    # p.wait()
+    # os.remove(tmp) # remove kmc output suffix file
 
-    A = int(bothCnt)
-    B = int(leftCnt)
-    C = int(rightCnt)
+    print(f"****** Dumping & Transferring to hdfs {histFile} -> {destFile} ******")
+    # l'output di kmc_dump_x passa per il driver che lo converte in parquet (kmer codificato come intero,
+    # contatore int32) calcolando i momenti dei contatori durante il dump
+    localFile = histFile + '.parquet'
+    dump = subprocess.Popen(['/usr/local/bin/kmc_dump_x', histFile, 'stdout'], stdout=subprocess.PIPE)
+
+    schema = histogramSchema(k)
+    moments = HistogramMoments()
+    tail = b''
+    with pq.ParquetWriter(localFile, schema, compression='zstd') as writer:
+        while True:
+            chunk = dump.stdout.read(dumpChunkSize)
+            block = tail + chunk
+            if (chunk):
+                nl = block.rfind(b'\n') + 1
+                (block, tail) = (block[:nl], block[nl:])
+            elif (len(block) > 0 and not block.endswith(b'\n')):
+                block += b'\n'
+            (hi, lo, cnts) = parseDumpBlock(block, k)
+            if (len(cnts) > 0):
+                moments.update(cnts)
+                writer.write_table(histogramTable(hi, lo, cnts, schema))
+            if (not chunk):
+                break
+    dump.wait()
+
+    putHistogramOnHDFS(localFile, destFile, moments)
 
-    NMax = pow(4, k)
-    M01M10 = leftCnt + rightCnt
-    M01M10M11 = bothCnt + M01M10
-    absentCnt = NMax - (A + B + C) # NMax - M01M10M11
-    D = absentCnt
-    # (M10 + M01) / (M11 + M10 + M01)
+    os.remove(histFile +'.kmc_pre') # remove kmc output prefix file
+    os.remove(histFile +'.kmc_suf') # remove kmc output suffix file
 
-    # Anderberg dissimilarity => Anderberg = 1 - (A/(A + B) + A/(A + C) + D/(C + D) + D/(B + D))/4
-    try:
-        anderberg = 1 - (A/float(A + B) + A/float(A + C) + D/float(C + D) + D/float(B + D))/4.0
-    except (ZeroDivisionError, ValueError):
-        anderberg = 1.000001
+    return moments
 
-    # Antidice dissimilarity => Antidice = 1 - A/(A + 2(B + C))
-    try:
-        antidice = 1 - A / float(A + 2.0 * (B + C))
-    except (ZeroDivisionError, ValueError):
-        antidice = 1.000001
 
-    # Dice dissimilarity => Dice = 1 - 2A/(2A + B + C)
-    try:
-        dice = 1 - 2*A / float(2.0*A + B + C)
-    except (ZeroDivisionError, ValueError):
-        dice  = 1.000001
-    # Gower dissimilarity => Gower = 1 - A x D/sqrt(A + B) x(A + C) x (D + B x (D + C)
-    try:
-        gower = 1 - A * D / math.sqrt((A + B) * (A + C) * (D + B * (D + C)))
-    except (ZeroDivisionError, ValueError):
-        gower = 1.000001
 
-    # Hamman dissimilarity => Hamman = 1 - [((A + D) - (B + C))/N]2
-    try:
-        hamman = 1 - math.pow((((A + D) - (B + C)) / float(NMax)), 2.0)
-    except (ZeroDivisionError, ValueError):
-        hamman = 1.000001
 
-    # Hamming dissimilarity => Hamming = (B + C)/N
-    try:
-        hamming = (B + C)/ NMax
-    except (ZeroDivisionError, ValueError):
-        hamming = 1.000001
+# trasferisce sull'HDFS l'istogramma parquet locale e i suoi momenti
+def putHistogramOnHDFS(localFile: str, destFile: str, moments: HistogramMoments):
+    cmd = f"hdfs dfs -put -f {localFile} {destFile}"
+    p = subprocess.Popen(cmd.split())
+    p.wait()
+    os.remove(localFile)
 
-    # Jaccard dissimilarity => Jaccard = 1 - A/(N - D)
-    try:
-        jaccard = 1 - A / (NMax - D)
-    except (ZeroDivisionError, ValueError):
-        jaccard = 1.000001
+    saveHistogramMoments(destFile, moments)
 
-    try:
-        jaccardDistance = 1 - min( 1.0, A / float(NMax - D))
-    except (ZeroDivisionError, ValueError):
-        jaccardDistance = 1.000001
 
 
-    # Kulczynski dissimilarity => Kulczynski = 1 - (A/(A + B) + A/(A + C)) / 2
-    try:
-        kulczynski = 1 - (A / float(A + B) + A / float(A + C)) / 2.0
-    except (ZeroDivisionError, ValueError):
-        kulczynski = 1.000001
 
-    # Matching dissimilarity => Matching = 1 - (A + D)/N
-    try:
-        matching = 1 - (A + D) / NMax
-    except (ZeroDivisionError,ValueError):
-        matching = 1.000001
+# salva sull'HDFS l'istogramma (hi, lo, cnts) calcolato da countStreamKmers
+def saveHistogramOnHDFS(hi, lo, cnts, localPrefix: str, destFile: str, k: int):
+    print(f"****** Transferring to hdfs {localPrefix} -> {destFile} ******")
+    localFile = localPrefix + '.parquet'
+    schema = histogramSchema(k)
+    moments = HistogramMoments()
+    moments.update(cnts)
+    rows = dumpChunkSize // (8 * len(kmerColumns(k)) + 4)
+    with pq.ParquetWriter(localFile, schema, compression='zstd') as writer:
+        for first in range(0, len(cnts), rows):
+            last = first + rows
+            writer.write_table(histogramTable(None if hi is None else hi[first:last], lo[first:last], cnts[first:last], schema))
 
-    # Ochiai dissimilarity => Ochiai = 1 - A/sqrt(A + B) x (A + C)
-    try:
-        ochiai = 1 - A / math.sqrt((A + B) * (A + C))
-    except (ZeroDivisionError, ValueError):
-        ochiai = 1.000001
+    putHistogramOnHDFS(localFile, destFile, moments)
+    return moments
 
-    # Phi dissimilarity => Phi = 1 - [(A x  B x  C x D)/sqrt(A + B) x (A + C) x (D + B) x (D + C)]2
-    try:
-        phi = 1 - math.pow((A * B * C * D)/ math.sqrt((A + B) * (A + C) * (D + B) * (D + C)), 2.0)
-    except (ZeroDivisionError, ValueError):
-        phi = 1.000001
 
-    # Russel dissimilarity => Russel = 1 - A/N
-    try:
-        russel = 1 - A / NMax
-    except (ZeroDivisionError, ValueError):
-        russel = 1.000001
 
-    # Sneath dissimilarity => Sneath = 1 - 2(A + D)/(2 x (A + D) + (B + C))
-    try:
-        sneath = 1 - 2.0 * (A + D) / (2.0 * (A + D) + (B + C))
-    except (ZeroDivisionError, ValueError):
-        sneath = 1.000001
 
-    # Tanimoto dissimilarity => Tanimoto = 1 - (A + D)/((A + D) + 2(B + C))
-    try:
-        tanimoto = 1 - (A + D) / float((A + D) + 2.0 * (B + C))
-    except (ZeroDivisionError, ValueError):
-        tanimoto = 1.000001
+# colonne chiave dell'istogramma: codice a 2 bit per base in un int64 (k <= 32)
+# o in due int64 (kmerHi: prime k - 32 basi, kmer: ultime 32 basi) per 32 < k <= 64
+def kmerColumns(k: int):
+    return ['kmer'] if k <= 32 else ['kmerHi', 'kmer']
 
-    # Yule dissimilarity => Yule = 1 - [(A x D - B x C)/(A x D + B x C)]2
-    try:
-        yule = 1 - math.pow(((A * D - B * C) / float(A * D + B * C)), 2.0)
-    except (ZeroDivisionError, ValueError):
-        yule = 1.000001
 
-    # salva il risultato nel file CSV
-    # dati present / absent e distanze present absent
-    data1 = [ A, B, C, str(D), str(NMax), str(A/NMax),
-             anderberg, antidice, dice, gower, hamman, hamming, jaccard,
-             kulczynski, matching, ochiai, phi, russel, sneath, tanimoto, yule]
+def histogramSchema(k: int):
+    return pa.schema([ (c, pa.int64()) for c in kmerColumns(k)] + [('cnt', pa.int32())])
 
-    return data1
 
 
 
+# row group ordinato per kmer (kmc_dump_x elenca i k-mer in ordine lessicografico, quindi
+# i row group sono intervalli consecutivi). I codici a 64 bit sono salvati come int64 con lo stesso
+# contenuto binario: il join richiede solo l'uguaglianza
+def histogramTable(hi, lo, cnts, schema):
+    order = np.argsort(lo, kind='stable') if hi is None else np.lexsort((lo, hi))
+    cols = [] if hi is None else [ hi[order].view(np.int64)]
+    cols += [ lo[order].view(np.int64), cnts[order].astype(np.int32)]
+    return pa.Table.from_arrays(cols, schema=schema)
 
-def runMash(inputDS1: str, inputDS2: str, k: int):
-    # run mash on the same sequence pair
-    mashValues = []
-    for i in range(len(sketchSizes)):
-        # extract mash sketch from the first sequence
-        mashout1 = f"{os.path.splitext(inputDS1)[0]}-k={k}"
-        cmd = f"/usr/local/bin/mash sketch -s {sketchSizes[i]} -p 8 -k {k} -o {mashout1} {inputDS1}"
-        p = subprocess.Popen(cmd.split())
-        p.wait()
 
-        mashout2 = f"{os.path.splitext(inputDS2)[0]}-k={k}"
-        cmd = f"/usr/local/bin/mash sketch -s {sketchSizes[i]} -p 8 -k {k} -o {mashout2} {inputDS2}"
-        p = subprocess.Popen(cmd.split())
-        p.wait()
 
-        cmd = f"/usr/local/bin/mash dist {mashout1}.msh {mashout2}.msh"
-        out = subprocess.check_output(cmd.split())
 
-        mashValues.append( MashData( out))
+# somma i contatori dei k-mer ripetuti: ritorna (hi, lo, cnts) ordinati per kmer e senza duplicati
+def reduceKmers(hi, lo, cnts):
+    order = np.argsort(lo, kind='stable') if hi is None else np.lexsort((lo, hi))
+    lo = lo[order]
+    hi = None if hi is None else hi[order]
+    new = np.ones(len(lo), dtype=bool)
+    new[1:] = lo[1:] != lo[:-1]
+    if (hi is not None):
+        new[1:] |= hi[1:] != hi[:-1]
+    first = np.flatnonzero(new)
+    cnts = np.add.reduceat(cnts[order], first) if len(first) > 0 else cnts[:0]
+    return (None if hi is None else hi[first], lo[first], cnts.astype(np.uint64))
 
-    # dati mash distance
-    data2 = []
-    for i in range(len(sketchSizes)):
-        data2 = data2 + mashValues[i].toString()
 
-    # clean up remove kmc temporary files
-    os.remove(mashout1 + '.msh')
-    os.remove(mashout2 + '.msh')
 
-    return data2
 
+# codici (hi, lo) dei k-mer di seq (array di basi di un solo record) che contengono solo A, C, G, T
+def sequenceKmers(seq, k: int):
+    n = len(seq) - k + 1
+    if (n <= 0):
+        return (None if k <= 32 else np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.uint64))
+    invalid = np.concatenate(([0], np.cumsum(~isKmerBase[seq])))
+    valid = np.flatnonzero(invalid[k:] == invalid[:n])
+    values = codeTable[seq]
 
+    def encode(first: int, last: int):
+        codes = np.zeros(n, dtype=np.uint64)
+        for j in range(first, last):
+            codes = (codes << np.uint64(2)) | values[j:j + n]
+        return codes[valid]
 
+    lo = encode(max(0, k - 32), k)
+    hi = encode(0, k - 32) if k > 32 else None
+    return (hi, lo)
 
-# load histogram for both sequences (for counter based measures such as D2)
-# and calculate Entropy of the sequence
-# dest file è la path sull'HDFS già nel formato hdfs://host:port/xxx/yyy
-def loadHistogramOnHDFS(histFile: str, destFile: str):
-    # tmp = histFile + '.txt'
-    #
-    # # dump the result -> kmer histogram
-    # cmd = "/usr/local/bin/kmc_dump %s %s" % (histFile, tmp)
-    # p = subprocess.Popen(cmd.split())
-    # p.wait()
-    # print(f"****** Dumping {histFile} kmers counting ******")
-    #
-    # # trasferisce sull'HDFS il file testuale
-    # print(f"****** Transferring to hdfs {histFile} -> {destFile} ******")
-    # cmd = "hdfs dfs -put %s %s" % (tmp, destFile)
-    # p = subprocess.Popen(cmd.split())
-    # p.wait()
-    # os.remove(tmp) # remove kmc output suffix file
-
-    print(f"****** Dumping & Transferring to hdfs {histFile} -> {destFile} ******")
-    cmd1 = f"/usr/local/bin/kmc_dump_x {histFile} stdout | hdfs dfs -put - {destFile}"
-    p = subprocess.run( cmd1, shell=True, stdout=subprocess.PIPE)
-
-    os.remove(histFile +'.kmc_pre') # remove kmc output prefix file
-    os.remove(histFile +'.kmc_suf') # remove kmc output suffix file
 
-    return
 
 
+# Conta in memoria (come kmc -b -ci0: k-mer non canonici, tutti i contatori) i k-mer di una
+# sequenza multi fasta letta come sequenza di blocchi che iniziano ad inizio riga (ad es. mkd.MutatedStream).
+# Le ultime k - 1 basi di ogni blocco sono riportate nel blocco successivo se il record continua.
+# Ritorna (hi, lo, cnts) ordinati per kmer e il numero totale di k-mer.
+# L'istogramma e' tutto nella memoria del driver: circa 3 x min(4^k, basi) x 16 byte (24 per k > 32)
+# durante le fusioni, per questo lo stream e' usato solo su richiesta (--stream-synthetic)
+def countStreamKmers(chunks, k: int):
+    (his, los, cntss) = ([], [], [])
+    (merged, pending) = (0, 0)
+    carry = b''
+    totKmer = 0
+    for chunk in chunks:
+        # record (o parte di record) del blocco: il primo continua il record del blocco precedente
+        records = re.split(rb'^>.*\n?', chunk, flags=re.M)
+        for (r, record) in enumerate(records):
+            text = (carry if r == 0 else b'') + record.translate(None, b'\r\n')
+            seq = np.frombuffer(text, dtype=np.uint8)
+            (hi, lo) = sequenceKmers(seq, k)
+            if (len(lo) > 0):
+                (hi, lo, cnts) = reduceKmers(hi, lo, np.ones(len(lo), dtype=np.uint64))
+                totKmer += int(cnts.sum())
+                his.append(hi)
+                los.append(lo)
+                cntss.append(cnts)
+                pending += len(lo)
+            carry = text[-(k - 1):] if k > 1 else b''
 
+        # fonde gli istogrammi parziali quando superano l'istogramma gia' fuso (costo ammortizzato n log n)
+        if (pending > max(merged, 4 * len(chunk))):
+            (hi, lo, cnts) = reduceKmers(None if k <= 32 else np.concatenate(his), np.concatenate(los), np.concatenate(cntss))
+            (his, los, cntss) = ([hi], [lo], [cnts])
+            merged = len(lo)
+            pending = 0
 
+    if (len(los) == 0):
+        return (None if k <= 32 else np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.uint64), 0)
+    (hi, lo, cnts) = reduceKmers(None if k <= 32 else np.concatenate(his), np.concatenate(los), np.concatenate(cntss))
+    return (hi, lo, cnts, totKmer)
 
-def extractKmers( inputDataset: str, k: int, tempDir: str, kmcOutputPrefix: str):
-    # run kmc on the first sequence
-    # -v - verbose mode (shows all parameter settings); default: false
-    # -k<len> - k-mer length (k from 1 to 256; default: 25)
-    # -m<size> - max amount of RAM in GB (from 1 to 1024); default: 12
-    # -sm - use strict memory mode (memory limit from -m<n> switch will not be exceeded)
-    # -p<par> - signature length (5, 6, 7, 8, 9, 10, 11); default: 9
-    # -f<a/q/m/bam/kmc> - input in FASTA format (-fa), FASTQ format (-fq), multi FASTA (-fm) or BAM (-fbam) or KMC(-fkmc); default: FASTQ
-    # -ci<value> - exclude k-mers occurring less than <value> times (default: 2)
-    # -cs<value> - maximal value of a counter (default: 255)
-    # -cx<value> - exclude k-mers occurring more of than <value> times (default: 1e9)
-    # -b - turn off transformation of k-mers into canonical form
-    # -r - turn on RAM-only mode
-    # -n<value> - number of bins
-    # -t<value> - total number of threads (default: no. of CPU cores)
-    # -sf<value> - number of FASTQ reading threads
-    # -sp<value> - number of splitting threads
-    # -sr<value> - number of threads for 2nd stage
-    # -hp - hide percentage progress (default: false)
 
-    cmd = f"/usr/local/bin/kmc -b -hp -k{k} -m12 -fm -ci0 -cs1048575000 -cx2000000000 {inputDataset} {kmcOutputPrefix} {tempDir}"
 
-    print(f"****** (local) Kmer Counting {cmd} ******")
 
-    out = subprocess.check_output(cmd.split())
-    results = out.decode()
-    m = re.search(r'Total no. of k-mers[ \t]*:[ \t]*(\d+)', results)
-    totalKmerNumber = 0 if (m is None) else int(m.group(1))
-    # print(f"****** cmd: {cmd} returned:\n{results} ******")
+# salva i momenti dell'istogramma sull'HDFS accanto al file destFile
+def saveHistogramMoments(destFile: str, moments: HistogramMoments):
+    path = sc._jvm.org.apache.hadoop.fs.Path(destFile + momentsSuffix)
+    fs = path.getFileSystem(sc._jsc.hadoopConfiguration())
+    writer = sc._jvm.java.io.BufferedWriter(sc._jvm.java.io.OutputStreamWriter(fs.create(path, True)))
+    writer.write(moments.toString() + '\n')
+    writer.close()
 
-    m = re.search(r'No. of unique k-mers[ \t]*:[ \t]*(\d+)', results)
-    totalDistinctKmerNumber = 0 if (m is None) else int(m.group(1))
 
-    return (totalDistinctKmerNumber, totalKmerNumber)
+
+
+# legge i momenti di un istogramma gia' presente sull'HDFS. Se il file dei metadati manca
+# (istogrammi caricati con versioni precedenti) i momenti vengono calcolati sul solo istogramma
+def getHistogramMoments(destFile: str):
+    if (checkPathExists(destFile + momentsSuffix)):
+        path = sc._jvm.org.apache.hadoop.fs.Path(destFile + momentsSuffix)
+        fs = path.getFileSystem(sc._jsc.hadoopConfiguration())
+        reader = sc._jvm.java.io.BufferedReader(sc._jvm.java.io.InputStreamReader(fs.open(path)))
+        line = reader.readLine()
+        reader.close()
+        return HistogramMoments.fromString(line)
+
+    print(f"****** Evaluating moments of {destFile} ******")
+    df = spark.read.parquet(destFile)
+    cnt = sf.col('cnt').cast(LongType())
+    r = df.select(sf.count(cnt), sf.sum(cnt), sf.sum(cnt * cnt)).collect()[0]
+    moments = HistogramMoments(int(r[0]), int(r[1] or 0), int(r[2] or 0))
+    saveHistogramMoments(destFile, moments)
+    return moments
+
 
 
 
@@ -387,147 +341,158 @@ def distCounter(cnt, x: str):
 
 
 
-def countBasedMeasures(partData):
-    global totKmerAAcc, totKmerBAcc, kmerStats
-
-    D2totValue = D2ZTotValue = EuclideanTotValue = EuclideanZTotValue = 0
-    Acnt = Bcnt = Ccnt = 0
-    Hk1 = totalProb1 = Hk2 = totalProb2 = 0.0
-    totalKmerCnt1 = float(totKmerAAcc.value)
-    totalKmerCnt2 = float(totKmerBAcc.value)
-    mean1 = float(kmerStats.value.mean1)
-    mean2 = float(kmerStats.value.mean2)
-    std1 = float(kmerStats.value.std1)
-    if (std1 == 0):
-        std1 = 10**-40
-    std2 = float(kmerStats.value.std2)
-    if (std2 == 0):
-        std2 = 10**-40
-
-    for row in partData:
-        # cnt1 = 0 if row.cnt1 is None else row.cnt1
-        # cnt2 = 0 if row.cnt2 is None else row.cnt2
-        cnt1 = row.cnt1
-        cnt2 = row.cnt2
-        # zcnt1 = 0 if std1 == 0 else (cnt1 - mean1) / std1
-        # zcnt2 = 0 if std2 == 0 else (cnt2 - mean2) / std2
-        zcnt1 = (cnt1 - mean1) / std1
-        zcnt2 = (cnt2 - mean2) / std2
-
-        # counting based measures
-        d = cnt2 - cnt1
-        zd = zcnt2 -zcnt1
-        EuclideanTotValue += d * d
-        D2totValue +=  cnt1 * cnt2
-        EuclideanZTotValue += zd * zd
-        D2ZTotValue += zcnt1 * zcnt2
+# misure basate sui contatori calcolate con aggregazioni native di Spark SQL sul full outer join
+# (nessuna riga passa per i worker python). Ritorna la tupla
+# (Euclidean, D2, A, B, C, HkA, totalProbA, HkB, totalProbB)
+def countBasedMeasures(outer, totalKmerCnt1: int, totalKmerCnt2: int):
+    # i contatori sono IntegerType: cast a long per evitare overflow su prodotti e quadrati
+    cnt1 = sf.col('cnt1').cast(LongType())
+    cnt2 = sf.col('cnt2').cast(LongType())
+    d = cnt2 - cnt1
 
+    # le misure standardizzate (D2Z, EuclideanZ) sono ricavate in processLocalPair
+    # da D2 e dai momenti degli istogrammi: il join viene attraversato una sola volta
+    prob1 = cnt1 / float(totalKmerCnt1)
+    prob2 = cnt2 / float(totalKmerCnt2)
+
+    r = outer.agg(
+        sf.sum(d * d),
+        sf.sum(cnt1 * cnt2),
         # Present/Absent
-        if (cnt1 > 0 and cnt2 > 0):
-            Acnt += 1
-        elif (cnt1 > 0):
-            Bcnt += 1
-        else:
-            Ccnt += 1
+        sf.count(sf.when((cnt1 > 0) & (cnt2 > 0), 1)),
+        sf.count(sf.when((cnt1 > 0) & ~(cnt2 > 0), 1)),
+        sf.count(sf.when(~(cnt1 > 0), 1)),
         # calcola i valori dell'entropia in-line per evitare due pipe
-        if (cnt1 > 0):
-            prob1 = cnt1 / totalKmerCnt1
-            totalProb1 += prob1
-            Hk1 += prob1 * math.log(prob1, 2)
+        sf.sum(sf.when(cnt1 > 0, prob1 * sf.log2(prob1))),
+        sf.sum(sf.when(cnt1 > 0, prob1)),
+        sf.sum(sf.when(cnt2 > 0, prob2 * sf.log2(prob2))),
+        sf.sum(sf.when(cnt2 > 0, prob2))
+        ).collect()[0]
+
+    # sum su un join vuoto (o senza righe selezionate da when) ritorna None
+    return tuple(0 if v is None else v for v in r)
+
+
+
+
+# istogramma di una sequenza per un valore di k: totali kmc, momenti dei contatori,
+# file parquet sull'HDFS (letto come DataFrame con colonna cntColumn) e sketch mash.
+# Per la sequenza di riferimento di uno sweep su theta viene costruito una sola volta per k.
+# Se stream non e' None seqFile e' solo il nome di una sequenza virtuale i cui blocchi sono
+# prodotti da stream() (ad es. mkd.MutatedStream) e non esiste sul disco
+class SequenceHistogram:
+    def __init__(self, seqFile: str, k: int, tempDir: str, cntColumn: str, stream = None):
+        self.seqFile = seqFile
+        self.k = k
+        self.tempDir = tempDir
+        self.baseSeq = Path(seqFile).stem
+        kmcOutputPrefix = f"{tempDir}/{self.baseSeq}-k={k}"
+        self.destFilename = f"{hdfsDataDir}/{self.baseSeq}-k={k}.parquet"
+        self.mash = MashSketches(seqFile, k, kmcOutputPrefix)
+        if (stream is not None):
+            self.countStream(stream)
+        else:
+            self.countFile(kmcOutputPrefix)
 
-        if (cnt2 > 0):
-            prob2 = cnt2 / totalKmerCnt2
-            totalProb2 += prob2
-            Hk2 += prob2 * math.log(prob2, 2)
+        # istogrammi in parquet: kmer codificato come intero (o coppia di interi per k > 32), contatore int32
+        self.df = spark.read.parquet(self.destFilename).withColumnRenamed('cnt', cntColumn)
 
-    return iter([(EuclideanTotValue,EuclideanZTotValue, D2totValue, D2ZTotValue, Acnt, Bcnt, Ccnt, Hk1, totalProb1, Hk2, totalProb2)])
+    def countFile(self, kmcOutputPrefix: str):
+        # calcola comunque kmc per avere i valori di totDistinctKmer, totKmer
+        (self.totDistinctKmer, self.totKmer) = extractKmers(self.seqFile, self.k, self.tempDir, kmcOutputPrefix)
+        if (not checkPathExists(self.destFilename)):
+            # load kmers statistics from histogram files (dumping kmc output to hdfs)
+            self.moments = loadHistogramOnHDFS(kmcOutputPrefix, self.destFilename, self.k)
+        else:
+            # altrimenti rimuove solo i file temporanei di KMC e usera' destFilename come input
+            os.remove(kmcOutputPrefix+'.kmc_pre')
+            os.remove(kmcOutputPrefix+'.kmc_suf')
+            self.moments = getHistogramMoments(self.destFilename)
+
+    # un solo passaggio sulla sequenza virtuale alimenta il conteggio in memoria dei k-mer
+    # e gli sketch mash (che leggono la sequenza dallo stdin), senza file intermedi
+    def countStream(self, stream):
+        print(f"****** (in memory) Kmer Counting {self.baseSeq} k = {self.k} ******")
+        sketchers = {}
+        for ss in sketchSizes:
+            mashout = f"{self.mash.prefix}-s={ss}"
+            cmd = f"/usr/local/bin/mash sketch -s {ss} -p 8 -k {self.k} -o {mashout} -"
+            sketchers[ss] = (subprocess.Popen(cmd.split(), stdin=subprocess.PIPE), mashout + '.msh')
+
+        def tee():
+            for chunk in stream():
+                for (p, msh) in sketchers.values():
+                    p.stdin.write(chunk)
+                yield chunk
+
+        (hi, lo, cnts, self.totKmer) = countStreamKmers(tee(), self.k)
+        for (ss, (p, msh)) in sketchers.items():
+            p.stdin.close()
+            p.wait()
+            self.mash.sketches[ss] = msh
+
+        self.totDistinctKmer = len(cnts)
+        self.moments = saveHistogramOnHDFS(hi, lo, cnts, f"{self.tempDir}/{self.baseSeq}-k={self.k}", self.destFilename, self.k)
+
+    def persist(self):
+        self.df = self.df.persist(pyspark.StorageLevel.MEMORY_AND_DISK)
+        return self
+
+    def mashSketch(self, sketchSize: int):
+        return self.mash.mashSketch(sketchSize)
+
+    # rimuove gli sketch mash locali e libera il DataFrame (l'istogramma sull'HDFS resta)
+    def release(self):
+        self.df.unpersist()
+        self.mash.remove()
+
+    # rimuove anche l'istogramma (e i relativi momenti) dall'HDFS
+    def remove(self):
+        self.release()
+        cmd = f"hdfs dfs -rm -skipTrash {self.destFilename} {self.destFilename}{momentsSuffix}"
+        p = subprocess.Popen(cmd.split())
+        p.wait()
 
 
 
 
 # run jaccard on sequence pair ds with kmer of length = k
-def processLocalPair(seqFile1: str, seqFile2: str, k: int, theta: float, tempDir: str):
-    global totDistinctKmerAAcc, totDistinctKmerBAcc, totKmerAAcc, totKmerBAcc, kmerStats
+# reference e' l'istogramma di seqFile1 gia' calcolato (sweep su theta) oppure None,
+# stream (se non None) produce i blocchi della sequenza virtuale seqFile2
+def processLocalPair(seqFile1: str, seqFile2: str, k: int, theta: float, tempDir: str, reference: SequenceHistogram = None, stream = None):
 
     start = time.time()
 
     # first locally extract kmer statistics for both sequences
-
-    baseSeq1 = Path(seqFile1).stem
-    kmcOutputPrefixA = f"{tempDir}/{baseSeq1}-k={k}"
-    destFilenameA = f"{hdfsDataDir}/{baseSeq1}-k={k}.txt"
-    # calcola comunque kmc per avere i valori di totDistinctKmerA, totKmerA
-    (totDistinctKmerA, totKmerA) = extractKmers(seqFile1, k, tempDir, kmcOutputPrefixA)
-    if (not checkPathExists(destFilenameA)):
-        # load kmers statistics from histogram files (dumping kmc output to hdfs)
-        loadHistogramOnHDFS(kmcOutputPrefixA, destFilenameA)
-    else:
-        # altrimenti rimuove solo i file temporanei di KMC e usera' destFilenameA come input
-        os.remove(kmcOutputPrefixA+'.kmc_pre')
-        os.remove(kmcOutputPrefixA+'.kmc_suf')
-
-    baseSeq2 = Path(seqFile2).stem
-    kmcOutputPrefixB = f"{tempDir}/{baseSeq2}-k={k}"
-    destFilenameB = f"{hdfsDataDir}/{baseSeq2}-k={k}.txt"
-    # calcola comunque kmc per avere i valori di totDistinctKmerB, totKmerB
-    (totDistinctKmerB, totKmerB) = extractKmers(seqFile2, k, tempDir, kmcOutputPrefixB)
-    if (not checkPathExists(destFilenameB)):
-        # load kmers statistics from histogram files (dumping kmc output to hdfs)
-        loadHistogramOnHDFS(kmcOutputPrefixB, destFilenameB)
-    else:
-        # altrimenti rimuove solo i file temporanei di KMC e usera' destFilenameB come input
-        os.remove(kmcOutputPrefixB+'.kmc_pre')
-        os.remove(kmcOutputPrefixB+'.kmc_suf')
+    histA = SequenceHistogram(seqFile1, k, tempDir, 'cnt1') if reference is None else reference
+    histB = SequenceHistogram(seqFile2, k, tempDir, 'cnt2', stream)
+    (baseSeq1, totDistinctKmerA, totKmerA, momentsA) = (histA.baseSeq, histA.totDistinctKmer, histA.totKmer, histA.moments)
+    (baseSeq2, totDistinctKmerB, totKmerB, momentsB) = (histB.baseSeq, histB.totDistinctKmer, histB.totKmer, histB.moments)
 
     #
     # inizio procedura Dataframe oriented (out of memory)
     #
-    # Broadcast variables ... for all map tasks. These are read-only
-    totDistinctKmerAAcc = sc.broadcast(totDistinctKmerA)
-    totDistinctKmerBAcc = sc.broadcast(totDistinctKmerB)
-    totKmerAAcc = sc.broadcast(totKmerA)
-    totKmerBAcc = sc.broadcast(totKmerB)
-
-    schema1 = StructType([ StructField('kmer', StringType(), True), StructField('cnt1', IntegerType(), True)])
-    schema2 = StructType([ StructField('kmer', StringType(), True), StructField('cnt2', IntegerType(), True)])
-
-    df1 = spark.read.format("csv").schema(schema1).options(delimiter='\t').load(destFilenameA)
-    df2 = spark.read.format("csv").schema(schema2).options(delimiter='\t').load(destFilenameB)
+    df1 = histA.df
+    df2 = histB.df
 
     # inner solo l'intersezione
     # inner = df1.join(df2, df1.kmer == df2.kmer, "inner")
     # full outer join di tutte le righe (poiche' le colonne chiave hanno lo stesso nome possiamo usare una lista
     # al termine tutti i valori null (i valori di cnt per k-mer non definiti) vengono posti a 0
-    outer = df1.join(df2, ['kmer'], how='full').na.fill(value=0, subset=['cnt1','cnt2'])
+    outer = df1.join(df2, kmerColumns(k), how='full').na.fill(value=0, subset=['cnt1','cnt2'])
     # questa produce 2 colonne kmer
     # outer = df1.join(df2, df1.kmer == df2.kmer, "outer")
 
     # df4 = outer.select(EuclidUDF(col('cnt1'), col('cnt2'))).show()
 
-    # calcola media e deviazione standard delle frequenze.
-    stats = outer.select(sf.mean(sf.col('cnt1')).alias('mean1'),
-                         sf.stddev(sf.col('cnt1')).alias('std1'),
-                         sf.mean(sf.col('cnt2')).alias('mean2'),
-                         sf.stddev(sf.col('cnt2')).alias('std2')
-                         ).collect()
-
-    # share the results to all workers
-    kmerStats = sc.broadcast( stats[0])
-    allDist = outer.rdd.mapPartitions(countBasedMeasures).collect()
+    # media e deviazione standard delle frequenze non sono piu' calcolate sul join
+    # (che veniva valutato due volte) ma ricavate dai momenti salvati con gli istogrammi
+    (totEuclid, totD2, Acnt, Bcnt, Ccnt, HkA, totalProbA, HkB, totalProbB) = countBasedMeasures(outer, totKmerA, totKmerB)
 
-    totEuclidZ = totD2Z = 0.0
-    totEuclid = totD2 = Acnt = Bcnt = Ccnt = 0
-    HkA = totalProbA = HkB = totalProbB = 0.0
-    for t in allDist:
-        totEuclid += t[0]; totEuclidZ += t[1]; totD2 += t[2]; totD2Z += t[3]
-        Acnt += t[4]; Bcnt += t[5]; Ccnt += t[6]
-        HkA  += t[7]; totalProbA += t[8]; HkB  += t[9]; totalProbB += t[10]
+    # il numero di righe del full outer join e' |A U B| = A + B + C
+    (totD2Z, totEuclidZ) = standardizedMeasures(totD2, Acnt + Bcnt + Ccnt, momentsA, momentsB)
 
-    vec = [0,0,0,0,0,0,0,0,0,0,0]
-    for t in allDist:
-        vec = [ x[0] + x[1] for x in zip(vec, t) ]
-
-    print(f"****** {vec[0]}, {vec[1]}, {vec[2]}, {vec[3]}, {vec[4]}, {vec[5]}, {vec[6]}, {vec[7]}, {vec[8]} ******")
+    print(f"****** {totEuclid}, {totEuclidZ}, {totD2}, {totD2Z}, {Acnt}, {Bcnt}, {Ccnt}, {HkA}, {totalProbA} ******")
 
     if round(totalProbA,0) != 1.0:
         # raise ValueError("Somma(Pa = {round(totalProbA, 0):f} must be 1.0. Aborting")
@@ -573,7 +538,7 @@ def processLocalPair(seqFile1: str, seqFile2: str, k: int, theta: float, tempDir
     ###################################################
     dati1 = runPresentAbsent(Acnt, Bcnt, Ccnt, k)
 
-    dati2 = runMash(seqFile1, seqFile2, k)
+    dati2 = runMash(histA, histB, k)
 
     # dati4 = dati entropia
     dati4 = entropySeqA.toString() + entropySeqB.toString()
@@ -581,49 +546,29 @@ def processLocalPair(seqFile1: str, seqFile2: str, k: int, theta: float, tempDir
     delay = time.time()-start
     dati0 = [baseSeq1, baseSeq2, start, delay, theta, k]
 
-    # do not remove base textual histogram file (for all k values) because can be reused in next iterations (for other theta values)
-    # cmd = f"hdfs dfs -rm -skipTrash {destFilenameA}"
-    # p = subprocess.Popen(cmd.split())
-    # p.wait()
+    # do not remove base histogram file (for all k values) because can be reused in next iterations (for other theta values)
+    if (reference is None):
+        histA.release()
 
-    # remove textual histogram files from hdfs
-    cmd = f"hdfs dfs -rm -skipTrash {destFilenameB}"
-    p = subprocess.Popen(cmd.split())
-    p.wait()
+    # remove histogram files from hdfs
+    histB.remove()
     
     return dati0 + dati1 + dati2 + dati3 + dati4    # nuovo record output
 
 
 
 
-def writeHeader( writer):#
-    columns0 = ['sequenceA', 'sequenceB', 'start time', 'real time', 'Theta', 'k'] # dati 0
-    columns1 = [ 'A', 'B', 'C', 'D', 'N', 'A/N',
-               'Anderberg', 'Antidice', 'Dice', 'Gower', 'Hamman', 'Hamming',
-                'Jaccard', 'Kulczynski', 'Matching', 'Ochiai',
-                'Phi', 'Russel', 'Sneath', 'Tanimoto', 'Yule']
+# sequenza allontanata virtuale: ogni chiamata restituisce gli stessi blocchi (stesso seed)
+def syntheticStream(seqFile1: str, theta: float, seed: int):
+    return lambda: mkd.MutatedStream(seqFile1, theta, seed, ' theta = %g%%' % (theta * 100), workers=os.cpu_count())
 
-    columns2 = []
-    for ss in sketchSizes:
-        columns2.append( f"Mash Pv ({ss})")
-        columns2.append( f"Mash Distance({ss})")
-        columns2.append( f"A ({ss})")
-        columns2.append( f"N ({ss})")
 
-    columns3 = [ 'D2', 'D2Z', 'Euclidean', 'EuclideanZ']
 
-    columns4 = ['NKeysA', '2*totalCntA', 'deltaA', 'HkA', 'errorA',
-                'NKeysB', '2*totalCntB', 'deltaB', 'HkB', 'errorB']
 
-    writer.writerow(columns0 + columns1 + columns2 + columns3 + columns4)
-    
-                 
-
-
-
-
-# processa localmente una coppia di sequenze seqFile1 e seqFile2
-def processPairs(seqFile1: str, seqFile2: str, theta: float):
+# processa localmente una coppia di sequenze seqFile1 e seqFile2. Se seqFile2 == "synthetic" la sequenza
+# allontanata e' scritta sul disco e contata con kmc, oppure, se streamSynthetic e' True, e' prodotta come
+# stream (rigenerato per ogni k) e contata nella memoria del driver (vedi countStreamKmers)
+def processPairs(seqFile1: str, seqFile2: str, theta: float, streamSynthetic: bool = False):
     # process local sequence files in the same local directory (temporary named ttt)
     tempDir = os.path.dirname( seqFile1)+'/ttt'
     if (not os.path.isdir(tempDir)):
@@ -636,16 +581,22 @@ def processPairs(seqFile1: str, seqFile2: str, theta: float):
         writeHeader(csvWriter)
         file.flush()
 
+        stream = None
         if (seqFile2 == "synthetic"):
-            # produce il file allontanato da seqFile1 di un fattore theta
-            (f, ext) = os.path.splitext(seqFile1)
+            (f, ext) = cf.splitExt(seqFile1)
             seqFile2 = f"{f}-{theta:.3f}{ext}"
-            mkd.MoveAwaySequence(seqFile1, seqFile2, theta)
+            if (streamSynthetic):
+                seed = np.random.SeedSequence().entropy
+                print(f"****** Streaming {Path(seqFile2).stem} (not written, seed = {seed}) ******")
+                stream = syntheticStream(seqFile1, theta, seed)
+            else:
+                # produce il file allontanato da seqFile1 di un fattore theta
+                mkd.MoveAwaySequence(seqFile1, seqFile2, theta, workers=os.cpu_count())
 
         for k in range( minK, maxK+1, stepK):
             # run kmc on both the sequences and eval A, B, C, D + Mash + Entropy
             print(f"****** Starting {Path(seqFile1).stem} vs {Path(seqFile2).stem} k = {k} T = {theta:.3f} ******")
-            res = processLocalPair(seqFile1, seqFile2, k, theta, tempDir)
+            res = processLocalPair(seqFile1, seqFile2, k, theta, tempDir, stream=stream)
             csvWriter.writerow( res)
             file.flush()
 
@@ -664,20 +615,79 @@ def processPairs(seqFile1: str, seqFile2: str, theta: float):
 
 
 
+# sweep su piu' valori di theta in una sola applicazione spark: per ogni k l'istogramma della
+# sequenza di riferimento (DataFrame persistito, totali kmc, momenti e sketch mash) e' calcolato
+# una sola volta e riusato per tutti i theta. I risultati sono scritti dopo ogni coppia (theta, k).
+# Le sequenze allontanate (con lo stesso seed, quindi accoppiate su theta) sono scritte sul disco,
+# oppure sono stream contati nella memoria del driver se streamSynthetic e' True
+def processSweep(seqFile1: str, thetas: list, streamSynthetic: bool = False):
+    tempDir = os.path.dirname( seqFile1)+'/ttt'
+    if (not os.path.isdir(tempDir)):
+        os.mkdir(tempDir)
+
+    references = {}
+    (f, ext) = cf.splitExt(seqFile1)
+    seqFiles2 = [ f"{f}-{theta:.3f}{ext}" for theta in thetas]
+    seed = np.random.SeedSequence().entropy
+    if (streamSynthetic):
+        print(f"****** Streaming synthetic sequences (not written, seed = {seed}) ******")
+    else:
+        # produce con una sola lettura di seqFile1 tutti i file allontanati (varianti accoppiate su theta)
+        mkd.MoveAwaySequences(seqFile1, seqFiles2, thetas, seed, workers=os.cpu_count())
+
+    outFile = f"{os.path.dirname( seqFile1)}/{Path(seqFile1).stem}-sweep-{int(time.time())}.csv"
+    with open(outFile, 'w') as file:
+        csvWriter = csv.writer(file)
+        writeHeader(csvWriter)
+        file.flush()
+
+        for (theta, seqFile2) in zip(thetas, seqFiles2):
+            for k in range( minK, maxK+1, stepK):
+                print(f"****** Starting {Path(seqFile1).stem} vs {Path(seqFile2).stem} k = {k} T = {theta:.3f} ******")
+                if (k not in references):
+                    references[k] = SequenceHistogram(seqFile1, k, tempDir, 'cnt1').persist()
+                stream = syntheticStream(seqFile1, theta, seed) if streamSynthetic else None
+                res = processLocalPair(seqFile1, seqFile2, k, theta, tempDir, references[k], stream)
+                csvWriter.writerow( res)
+                file.flush()
+
+    for ref in references.values():
+        ref.release()
+
+    try:
+        print(f"****** Cleaning temporary directory {tempDir} ******")
+        shutil.rmtree(tempDir)
+    except OSError as e:
+        print(f"Error removing: {tempDir}: {e.strerror}")
+
+
+
+
+
+
 def main():
     global hdfsDataDir, hdfsPrefixPath, spark, sc, thetaValue, minK, maxK
 
-
+    thetaValues = [thetaValue]
     hdfsDataDir = hdfsPrefixPath
 
+    # --stream-synthetic: le sequenze allontanate (Sequence2 == "synthetic") non sono scritte sul disco
+    # ma prodotte come stream per mash e per il conteggio dei k-mer nella memoria del driver
+    # (istogramma non limitato: circa 3 x min(4^k, basi) x 16 byte, vedi countStreamKmers)
+    streamSynthetic = '--stream-synthetic' in sys.argv
+    if (streamSynthetic):
+        sys.argv.remove('--stream-synthetic')
+
     argNum = len(sys.argv)
     if (argNum < 5 or argNum > 6):
         """
-            Usage: PySparkPASingleSequenceOutMemory Sequence1 Sequence2 theta dataDir [kValue]
+            Usage: PySparkPASingleSequenceOutMemory [--stream-synthetic] Sequence1 Sequence2 theta[,theta...] dataDir [kValue]
         """
     else:
         # theta viene utilizzato SOLO se Sequence2 == "synthetic" altrimenti viene ignorato
-        thetaValue = float(sys.argv[3])
+        # piu' valori separati da virgola => sweep su theta nella stessa applicazione
+        thetaValues = [float(t) for t in sys.argv[3].split(',')]
+        thetaValue = thetaValues[0]
         hdfsDataDir = f"{hdfsPrefixPath}/{sys.argv[4]}"
 
     if (argNum == 6):
@@ -689,14 +699,17 @@ def main():
     seqFile2 = sys.argv[2] # per eseguire localmente l'estrazione dei k-mers
     # outFile = '%s/%s-%s.csv' % (hdfsDataDir, Path( seqFile1).stem, Path(seqFile2).stem )
 
-    if (seqFile2 == "synthetic"):
+    sweep = seqFile2 == "synthetic" and len(thetaValues) > 1
+    if (sweep):
+        print(f"****** Comparing: {Path(seqFile1).stem} vs {Path(seqFile2).stem} with {minK} <= k <= {maxK} and Theta in {thetaValues} in hdfsDataDir = {hdfsDataDir} ******")
+    elif (seqFile2 == "synthetic"):
         print(f"****** Comparing: {Path(seqFile1).stem} vs {Path(seqFile2).stem} with {minK} <= k <= {maxK} and Theta = {thetaValue:.3f} in hdfsDataDir = {hdfsDataDir} ******")
     else:
         print(f"****** Comparing: {Path(seqFile1).stem} vs {Path(seqFile2).stem} with {minK} <= k <= {maxK} in hdfsDataDir = {hdfsDataDir} ******")
 
     spark = SparkSession \
         .builder \
-        .appName( f"{Path( sys.argv[0]).stem} {Path(seqFile1).stem} {Path(seqFile2).stem} {minK} <= k <= {maxK} theta = {thetaValue:.3f}") \
+        .appName( f"{Path( sys.argv[0]).stem} {Path(seqFile1).stem} {Path(seqFile2).stem} {minK} <= k <= {maxK} theta = {','.join(f'{t:.3f}' for t in thetaValues)}") \
         .getOrCreate()
 
     sc = spark.sparkContext
@@ -710,13 +723,16 @@ def main():
 
     print(f"****** {nWorkers} workers, hdfsDataDir: {hdfsDataDir} ******")
 
-    processPairs(seqFile1, seqFile2, thetaValue)
+    if (sweep):
+        processSweep(seqFile1, thetaValues, streamSynthetic)
+    else:
+        processPairs(seqFile1, seqFile2, thetaValue, streamSynthetic)
 
     spark.stop()
 
 
 # program profile:
-# main ->   processPairs(seqFile1, seqFile2, thetaValue)
+# main ->   processPairs(seqFile1, seqFile2, thetaValue) | processSweep(seqFile1, thetaValues)
 #           processPairs -> processLocalPair(seqFile1, seqFile2, k, theta, tempDir)
 #                           processLocalPairs -> extractKmers(seqFile1, k, tempDir, kmcOutputPrefixA)
 #                                                loadHistogramOnHDFS(kmcOutputPrefixA, destFilenameA)
@@ -13,6 +13,7 @@ import time
 from datetime import datetime as dt
 import numpy as np
 import py_kmc_api as kmc
+import fastaIndex
 
 sys.path.extend(['/usr/local/spark/python/lib/pyspark.zip', '/usr/local/spark/python/lib/py4j-0.10.9.5-src.zip'])
 
@@ -81,12 +82,6 @@ def checkPathExists(path: str, use_local_mode: bool) -> bool:
 
 
 
-def hamming_distance(seq1: str, seq2: str) -> int:
-    return sum(c1 != c2 for c1, c2 in zip(seq1, seq2))
-
-def hamming_distance2(seq1: str, seq2: str) -> int:
-    return len(list(filter(lambda x : ord(x[0])^ord(x[1]), zip(seq1, seq2))))
-
 
 # load histogram for both sequences (for counter based measures such as D2)
 def loadHistogramFromKMC(kmerDict: dict, histFile: str, pairId: str):
@@ -717,6 +712,39 @@ def splitPairs(ds):
 
 
 
+# dataset della directory (locale o sull'HDFS) ordinati per nome
+def listDatasets(dataDir, use_local_mode):
+    if use_local_mode:
+        return sorted(glob.glob('%s/%s' % (dataDir, inputRE)))
+    sc = spark.sparkContext
+    path = sc._jvm.org.apache.hadoop.fs.Path('%s/%s' % (dataDir, inputRE))
+    fs = path.getFileSystem(sc._jsc.hadoopConfiguration())
+    return sorted([ st.getPath().toString() for st in fs.globStatus(path)])
+
+
+
+
+# una coppia per task: il driver legge solo gli indici .pai dei dataset, ogni task legge
+# (mmap o read_at sull'HDFS) le due sequenze della propria coppia nel formato di splitPairs
+def indexedPairs(sc, datasets, numSlices):
+    tasks = []
+    for ds in datasets:
+        m = re.search(r'^(.*)-(\d+)\.(\d+)(.*).fasta', os.path.basename(ds))
+        if (m is None):
+            raise ValueError("Malformed file name <%s>" % ds)
+        seqLabel = "%s-%d.%d%s" % (m.group(1), int(m.group(2)), int(m.group(3)), m.group(4))
+        for (recA, recB) in fastaIndex.indexPairs(fastaIndex.loadIndex(ds)):
+            tasks.append((ds, seqLabel, recA, recB))
+
+    print("**** %d pairs from %d datasets" % (len(tasks), len(datasets)))
+    return sc.parallelize(tasks, max(1, min(numSlices, len(tasks)))) \
+             .map(lambda t: [t[1]] + [list(x) for x in fastaIndex.readPair(t[0], t[2], t[3])])
+
+
+
+
+
+
 def main():
     global hdfsDataDir, hdfsPrefixPath,  outFilePrefix, spark
 
@@ -762,21 +790,30 @@ def main():
     print("%d workers, dataDir: %s, dataMode: %s" % (nWorkers, dataDir, dataMode))
 
 
-    if use_local_mode:
-        inputDataset = '%s/%s' % (dataDir, inputRE)
-        rdd = sc.wholeTextFiles(inputDataset)
-    else:
-        inputDataset = '%s/%s' % (dataDir, inputRE)
-        rdd = sc.wholeTextFiles(inputDataset, minPartitions=48 * 100)  # 100 tasks per 48 executors
+    # il modulo dell'indice serve anche agli executor
+    sc.addPyFile(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'compressedFasta.py'))
+    sc.addPyFile(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fastaIndex.py'))
 
-    # print("Number of Partitions: " + str(rdd.getNumPartitions()))
-    #
-    # .map(lambda x: (x[0], x[1][0], x[1][1], x[2][0], x[2][1]))
-    # columns = ['name', 'seqA', 'contentA', 'seqB', 'contentB']
+    inputDataset = '%s/%s' % (dataDir, inputRE)
+    numSlices = 48 * 100 # 100 tasks per 48 executors
+    try:
+        pairs = indexedPairs(sc, listDatasets(dataDir, use_local_mode), numSlices)
+    except (OSError, ImportError) as e:
+        # indice non disponibile (ad es. dataset sull'HDFS senza .pai): ogni file e' letto per intero
+        print("**** dataset index not available (%s), reading whole files" % e)
+        if use_local_mode:
+            rdd = sc.wholeTextFiles(inputDataset)
+        else:
+            rdd = sc.wholeTextFiles(inputDataset, minPartitions=numSlices)
+
+        # print("Number of Partitions: " + str(rdd.getNumPartitions()))
+        #
+        # .map(lambda x: (x[0], x[1][0], x[1][1], x[2][0], x[2][1]))
+        # columns = ['name', 'seqA', 'contentA', 'seqB', 'contentB']
 
-    print("**** RDD number of Partitions: %d" % rdd.getNumPartitions())
+        print("**** RDD number of Partitions: %d" % rdd.getNumPartitions())
 
-    pairs = rdd.map(lambda x: splitPairs(x))
+        pairs = rdd.map(lambda x: splitPairs(x))
     print("**** pairs number of Partitions: %d" % pairs.getNumPartitions())
 
     counts = pairs.flatMap(lambda x: processPairs(x))
@@ -1,62 +1,126 @@
-#! /usr/bin/python
+#! /usr/local/bin/python3
 
 import re
 import os
 import sys
-import subprocess
+import csv
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 
+import fastaIndex as fi
+import HammingDistance as hd
 
-inputFile1 = sys.argv[1]
-inputFile2 = sys.argv[2]
+#
+# Rileva i pattern trasferiti (PT) o i motivi impiantati (MR) confrontando le due sequenze di ogni coppia:
+# la maschera di uguaglianza (case insensitive) e' calcolata con numpy e i tratti identici sono
+# estratti come run length (diff/nonzero sulla maschera). Sono riportati i tratti di almeno minLen basi
+# (10 come nella versione basata su cmp -l): numero, istogramma delle lunghezze e posizioni.
+#
+# Usage: comparePTSeqs.py [-m minLen] [-t threads] [-o positions.csv] sequence1 sequence2
+#            confronta la i-esima sequenza di sequence1 con la i-esima di sequence2
+#        comparePTSeqs.py [-m minLen] [-t threads] [-o positions.csv] -d dataset.fasta [...]
+#            tutte le coppie A-B dei dataset PT/MR (formato DatasetBuilder)
+#
 
-totalCnt = 0
-totalSeqCnt = 0
-totalKmer = 0
-totalProb = 0.0
-totalLines = 0
-writeSequenceHistogram = True
+minLength = 10
 
-sumDict = dict()  # dizionario vuoto
-seqDict = dict()
 
-seqDistDir = 'seqDists'
-#basename = os.path.splitext(os.path.basename(inputFile))[0]
+# tratti identici di almeno minLen basi tra a e b (array uint8): (posizioni iniziali, lunghezze)
+def identicalRuns(a, b, minLen: int = minLength):
+    n = min(len(a), len(b))
+    eq = np.zeros(n + 2, dtype=np.int8)
+    eq[1:n + 1] = hd.foldTable[a[:n]] == hd.foldTable[b[:n]]
+    edges = np.diff(eq)
+    starts = np.nonzero(edges == 1)[0]
+    lengths = np.nonzero(edges == -1)[0] - starts
+    keep = lengths >= minLen
+    return (starts[keep], lengths[keep])
 
 
+def pairRuns(task):
+    (buf1, record1, buf2, record2, minLen) = task
+    return identicalRuns(hd.basesView(buf1, record1, 0, record1.length),
+                         hd.basesView(buf2, record2, 0, record2.length), minLen)
 
 
-def main():
-    global totalCnt, totalSeqCnt, totalKmer, totalProb, totalLines, writeSequenceHistogram, sumDict, seqDict
-
-    p = subprocess.Popen(['cmp', '-l', inputFile1, inputFile2],
-                         stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    out, err = p.communicate()
-
-    skip = 0
-    offset = skip
-    cnt = 0
-    maxLen = 0
-
-    for line in out.splitlines():
-        m = re.search(r'(\d+)[ \t]+(\d+)[ \t]+(\d+)', line)
-        if (m is None):
-            print line, " unknown input format"
-            exit()
-        else:
-            actualOffset = int(m.group(1))
+# [(seqId, posizioni, lunghezze), ...] per le coppie [(bufA, recordA, bufB, recordB), ...]
+def findTransfers(pairs: list, minLen: int = minLength, threads: int = 1):
+    tasks = [ (buf1, r1, buf2, r2, minLen) for (buf1, r1, buf2, r2) in pairs]
+    if (threads <= 1):
+        results = list(map(pairRuns, tasks))
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            results = list(executor.map(pairRuns, tasks))
+    return [ (r1.seqId, starts, lengths) for ((buf1, r1, buf2, r2), (starts, lengths)) in zip(pairs, results)]
+
+
+def CompareSequences(inputFile1: str, inputFile2: str, minLen: int = minLength, threads: int = 1):
+    with hd.MappedFasta(inputFile1) as f1, hd.MappedFasta(inputFile2) as f2:
+        return findTransfers([ (f1.buf, r1, f2.buf, r2) for (r1, r2) in zip(f1.records, f2.records)], minLen, threads)
+
+
+def DatasetTransfers(dataset: str, minLen: int = minLength, threads: int = 1):
+    with hd.MappedFasta(dataset) as f:
+        return findTransfers([ (f.buf, a, f.buf, b) for (a, b) in fi.indexPairs(f.records)], minLen, threads)
 
-        if ((actualOffset - offset) >= 10):
-            cnt = cnt + 1
-            len = actualOffset - offset
-            if (len > maxLen):
-                maxLen = len
-            print("found Pattern Transferred @ %d, len = %d, cnt = %d" % (offset - skip, len, cnt))
-            if (cnt > 10):
-                break
 
-        offset = actualOffset
+def printSummary(name: str, results: list):
+    lengths = np.concatenate([ l for (seqId, s, l) in results]) if len(results) > 0 else np.zeros(0, dtype=np.int64)
+    print("****** %s: %d pairs, %d transfers, maxLength = %d ******" % (name, len(results), len(lengths), lengths.max() if len(lengths) > 0 else 0))
+    counts = np.bincount(lengths) if len(lengths) > 0 else []
+    for l in np.nonzero(counts)[0]:
+        print("%6d %10d" % (l, counts[l]))
+    noTransfer = [ seqId for (seqId, s, l) in results if len(l) == 0]
+    if (len(noTransfer) > 0):
+        print("%d pairs without transfers (first: %s)" % (len(noTransfer), noTransfer[:10]))
+
+
+
+
+def main():
+    args = sys.argv[1:]
+    minLen = minLength
+    threads = 1
+    outFile = None
+    datasets = False
+    while (len(args) > 0 and args[0].startswith('-')):
+        if (args[0] == '-m' and len(args) > 1):
+            minLen = int(args[1])
+            args = args[2:]
+        elif (args[0] == '-t' and len(args) > 1):
+            threads = int(args[1]) if int(args[1]) > 0 else os.cpu_count()
+            args = args[2:]
+        elif (args[0] == '-o' and len(args) > 1):
+            outFile = args[1]
+            args = args[2:]
+        elif (args[0] == '-d'):
+            datasets = True
+            args = args[1:]
+        else:
+            break
+
+    if ((not datasets and len(args) != 2) or (datasets and len(args) == 0)):
+        print("Errore nei parametri:\nUsage: %s [-m minLen] [-t threads] [-o positions.csv] sequence1 sequence2\n"
+              "       %s [-m minLen] [-t threads] [-o positions.csv] -d dataset.fasta [...]" %
+              (os.path.basename(sys.argv[0]), os.path.basename(sys.argv[0])))
+        exit(-1)
+
+    if (datasets):
+        runs = [ (os.path.basename(ds), DatasetTransfers(ds, minLen, threads)) for ds in args]
+    else:
+        runs = [ ('%s vs %s' % (args[0], args[1]), CompareSequences(args[0], args[1], minLen, threads))]
+
+    for (name, results) in runs:
+        printSummary(name, results)
+
+    if (outFile is not None):
+        with open(outFile, 'w', newline='') as out:
+            csvWriter = csv.writer(out)
+            csvWriter.writerow(['dataset', 'seqId', 'start', 'length'])
+            for (name, results) in runs:
+                for (seqId, starts, lengths) in results:
+                    csvWriter.writerows([ (name, seqId, s, l) for (s, l) in zip(starts.tolist(), lengths.tolist())])
 
-    print("%d transferts, maxLength = %d" % (cnt, maxLen))
 
 
 if __name__ == "__main__":
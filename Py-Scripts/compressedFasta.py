@@ -0,0 +1,162 @@
+#! /usr/local/bin/python3
+
+import io
+import os
+import sys
+import gzip
+import zlib
+import struct
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+#
+# Lettura trasparente di file fasta non compressi, gzip o BGZF (gzip a blocchi, bgzip/samtools).
+# I blocchi BGZF (al piu' 64 KB ciascuno) sono membri gzip indipendenti: vengono letti in sequenza
+# e decompressi in parallelo da un pool di thread (zlib rilascia il GIL), mantenendo l'ordine.
+# Il lettore espone uno stream sequenziale di byte (read/readline) come un file aperto in 'rb'.
+#
+# Usage: compressedFasta.py file [threads]    (scrive il contenuto decompresso sullo stdout)
+#
+
+compressedExts = ('.gz', '.bgz', '.bgzf')
+bgzfLookahead = 64      # blocchi in decompressione per thread
+
+
+def isGzip(path: str):
+    with open(path, 'rb') as f:
+        return f.read(2) == b'\x1f\x8b'
+
+
+# gzip con il campo extra 'BC' (dimensione del blocco) nell'header
+def isBgzf(path: str):
+    with open(path, 'rb') as f:
+        header = f.read(18)
+    return (len(header) == 18 and header[:4] == b'\x1f\x8b\x08\x04' and header[12:14] == b'BC')
+
+
+def isCompressed(path: str):
+    return os.path.isfile(path) and isGzip(path)
+
+
+# nome base ed estensione senza il suffisso di compressione: x.fna.gz -> (x, .fna)
+def splitExt(path: str):
+    (base, ext) = os.path.splitext(path)
+    if (ext.lower() in compressedExts):
+        (base, ext) = os.path.splitext(base)
+    return (base, ext)
+
+
+
+
+# blocchi BGZF compressi (header compreso) letti in sequenza dal file
+def bgzfBlocks(f):
+    while True:
+        header = f.read(18)
+        if (len(header) == 0):
+            return
+        if (len(header) < 18 or header[:4] != b'\x1f\x8b\x08\x04'):
+            raise IOError("Malformed BGZF block header")
+        xlen = struct.unpack('<H', header[10:12])[0]
+        extra = header[12:] + f.read(xlen - 6)
+        bsize = None
+        pos = 0
+        while (pos + 4 <= len(extra)):
+            (si, slen) = (extra[pos:pos + 2], struct.unpack('<H', extra[pos + 2:pos + 4])[0])
+            if (si == b'BC'):
+                bsize = struct.unpack('<H', extra[pos + 4:pos + 6])[0]
+            pos += 4 + slen
+        if (bsize is None):
+            raise IOError("BGZF block without BC subfield")
+        yield header[:12] + extra + f.read(bsize + 1 - 12 - xlen)
+
+
+# un blocco e' un membro gzip completo: deflate raw tra l'header e il trailer (crc32, isize)
+def inflateBlock(block: bytes):
+    xlen = struct.unpack('<H', block[10:12])[0]
+    data = zlib.decompress(block[12 + xlen:-8], -15)
+    (crc, isize) = struct.unpack('<II', block[-8:])
+    if (len(data) != isize or zlib.crc32(data) != crc):
+        raise IOError("BGZF block CRC/size mismatch")
+    return data
+
+
+
+
+class BgzfReader(io.RawIOBase):
+    def __init__(self, path: str, threads: int = None):
+        self.file = open(path, 'rb')
+        self.threads = threads or os.cpu_count()
+        self.executor = ThreadPoolExecutor(max_workers=self.threads)
+        self.blocks = bgzfBlocks(self.file)
+        self.pending = deque()
+        self.buffer = b''
+        self.pos = 0
+        self.eof = False
+        self.fill()
+
+    # mantiene in decompressione fino a threads * bgzfLookahead blocchi
+    def fill(self):
+        while (not self.eof and len(self.pending) < self.threads * bgzfLookahead):
+            block = next(self.blocks, None)
+            if (block is None):
+                self.eof = True
+            else:
+                self.pending.append(self.executor.submit(inflateBlock, block))
+
+    def nextData(self):
+        while (self.pending):
+            data = self.pending.popleft().result()
+            self.fill()
+            if (data):
+                return data
+        return b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if (self.pos >= len(self.buffer)):
+            self.buffer = self.nextData()
+            self.pos = 0
+        n = min(len(b), len(self.buffer) - self.pos)
+        b[:n] = self.buffer[self.pos:self.pos + n]
+        self.pos += n
+        return n
+
+    def close(self):
+        if (not self.closed):
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.file.close()
+        super().close()
+
+
+
+
+# apre un fasta (non compresso, gzip o BGZF) come stream binario con read/readline
+def openFasta(path: str, threads: int = None):
+    if (not isGzip(path)):
+        return open(path, 'rb')
+    if (isBgzf(path)):
+        return io.BufferedReader(BgzfReader(path, threads), buffer_size=1024 * 1024)
+    return gzip.open(path, 'rb')
+
+
+
+
+def main():
+    if (len(sys.argv) < 2 or len(sys.argv) > 3):
+        print("Usage: %s file [threads]" % os.path.basename(sys.argv[0]))
+        exit(-1)
+
+    threads = int(sys.argv[2]) if len(sys.argv) == 3 else None
+    with openFasta(sys.argv[1], threads) as f:
+        while True:
+            data = f.read(16 * 1024 * 1024)
+            if (not data):
+                break
+            sys.stdout.buffer.write(data)
+
+
+
+if __name__ == "__main__":
+    main()
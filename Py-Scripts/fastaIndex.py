@@ -0,0 +1,277 @@
+#! /usr/local/bin/python3
+
+import re
+import os
+import sys
+import mmap
+import numpy as np
+from urllib.parse import urlparse
+import compressedFasta as cf
+
+#
+# Indice (simile al .fai di samtools) dei dataset multi fasta di coppie di sequenze prodotti da
+# DatasetBuilder (header prefix.00001[.G=010]-A / -B). Per ogni dataset il file <dataset>.pai contiene
+# una riga per sequenza:
+#
+#   name  seqId  pairId  offset  length  lineBases  lineBytes
+#
+# offset e' la posizione (in byte) della prima base, length il numero di basi, lineBases/lineBytes
+# le basi e i byte (con il fine riga) di ogni riga della sequenza (come nel .fai: tutte le righe
+# tranne l'ultima devono avere la stessa lunghezza, altrimenti l'indice non e' costruito). Con l'indice
+# una coppia o una finestra si legge direttamente (mmap o read_at sull'HDFS) senza dividere il dataset.
+# I dataset locali compressi (gzip o BGZF) sono decompressi in memoria: gli offset si riferiscono
+# al contenuto decompresso, che resta in cache (un solo dataset per processo/executor) per le letture
+# successive. Sull'HDFS gli offset sono applicati al file cosi' com'e', quindi i dataset compressi
+# non sono ammessi: usarne una copia non compressa.
+#
+# Usage: fastaIndex.py index dataset.fasta [...]
+#        fastaIndex.py window dataset.fasta winSize nWindows [seqNum]
+#
+
+indexSuffix = '.pai'
+headerRE = re.compile(rb'^>(.*?)\r?$', re.M)
+pairRE = re.compile(r'^(.+)\.(\d+)(.*)-([AB])$')
+
+
+class FastaRecord:
+    def __init__(self, name: str, seqId: int, pairId: str, offset: int, length: int, lineBases: int, lineBytes: int):
+        self.name = name
+        self.seqId = seqId
+        self.pairId = pairId
+        self.offset = offset
+        self.length = length
+        self.lineBases = lineBases
+        self.lineBytes = lineBytes
+
+    # byte del file che contengono le basi [start, start + size)
+    def byteRange(self, start: int = 0, size: int = None):
+        size = self.length - start if size is None else min(size, self.length - start)
+        if (size <= 0 or self.lineBases <= 0):
+            return (self.offset, self.offset)
+        first = self.offset + (start // self.lineBases) * self.lineBytes + start % self.lineBases
+        last = start + size - 1
+        last = self.offset + (last // self.lineBases) * self.lineBytes + last % self.lineBases + 1
+        return (first, last)
+
+    def header(self):
+        return '>' + self.name
+
+    def toString(self):
+        return '\t'.join(map(str, [self.name, self.seqId, self.pairId, self.offset, self.length, self.lineBases, self.lineBytes]))
+
+    @staticmethod
+    def fromString(line: str):
+        f = line.rstrip('\n').split('\t')
+        return FastaRecord(f[0], int(f[1]), f[2], int(f[3]), int(f[4]), int(f[5]), int(f[6]))
+
+
+
+
+def isLocal(path: str):
+    return urlparse(path).scheme in ('', 'file')
+
+
+def localPath(path: str):
+    url = urlparse(path)
+    return url.path if url.scheme == 'file' else path
+
+
+def hdfsFile(path: str):
+    from pyarrow import fs
+    (hdfs, p) = fs.FileSystem.from_uri(path)
+    return (hdfs, p)
+
+
+
+
+# ultimo dataset compresso decompresso dal processo: (path, mtime, size) -> bytes
+dataCache = {}
+
+
+# contenuto di un dataset locale: mmap se non compresso, altrimenti decompresso in memoria
+# (una sola volta per processo finche' il file non cambia)
+def localData(path: str):
+    if (cf.isCompressed(path)):
+        key = (os.path.abspath(path), os.path.getmtime(path), os.path.getsize(path))
+        data = dataCache.get(key)
+        if (data is None):
+            dataCache.clear()
+            with cf.openFasta(path) as f:
+                data = f.read()
+            dataCache[key] = data
+        return data
+    with open(path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+# lunghezza e righe (basi e byte per riga) delle basi in data[start:end]; come samtools faidx tutte
+# le righe tranne l'ultima devono avere lineBases basi, altrimenti gli offset dell'indice sarebbero errati
+def recordLayout(name: str, data, buf, start: int, end: int):
+    nl = data.find(b'\n', start, end)
+    lineBytes = (nl - start + 1) if nl >= 0 else end - start
+    lineBases = lineBytes - (1 if nl >= 0 else 0)
+    if (nl > start and data[nl - 1] == ord('\r')):
+        lineBases -= 1
+    eol = (buf[start:end] == ord('\n')) | (buf[start:end] == ord('\r'))
+    length = (end - start) - int(np.count_nonzero(eol))
+
+    # righe vuote finali escluse: le righe terminate da '\n' sono lunghe lineBytes, l'ultima al piu' lineBases
+    bases = np.flatnonzero(~eol)
+    last = start + int(bases[-1]) + 1 if len(bases) > 0 else start
+    ends = np.flatnonzero(buf[start:last] == ord('\n'))
+    lines = np.diff(ends, prepend=-1)
+    tail = (last - start) - (int(ends[-1]) + 1 if len(ends) > 0 else 0)
+    if (np.any(lines != lineBytes) or tail > lineBases):
+        raise ValueError("%s: different line length in sequence (expected %d bases per line)" % (name, lineBases))
+    return (length, lineBases, lineBytes)
+
+
+# una sola scansione (in C con re su mmap) del dataset per trovare gli header
+def buildIndex(fastaFile: str, save: bool = True):
+    path = localPath(fastaFile)
+    records = []
+    if (os.path.getsize(path) == 0):
+        return records
+    data = localData(path)
+    buf = np.frombuffer(data, dtype=np.uint8)
+    headers = list(headerRE.finditer(data))
+    for (i, m) in enumerate(headers):
+        name = m.group(1).decode()
+        start = min(m.end() + 1, len(data))
+        end = headers[i + 1].start() if i + 1 < len(headers) else len(data)
+        (length, lineBases, lineBytes) = recordLayout(name, data, buf, start, end)
+        p = pairRE.search(name)
+        (seqId, pairId) = (int(p.group(2)), p.group(4)) if p is not None else (i + 1, '-')
+        records.append(FastaRecord(name, seqId, pairId, start, length, lineBases, lineBytes))
+    del buf
+    if (isinstance(data, mmap.mmap)):
+        data.close()
+
+    if (save):
+        with open(path + indexSuffix, 'w') as out:
+            for r in records:
+                out.write(r.toString() + '\n')
+    return records
+
+
+
+
+# legge l'indice del dataset (locale o sull'HDFS); per i file locali l'indice viene (ri)costruito
+# se manca o e' piu' vecchio del dataset
+def loadIndex(fastaFile: str):
+    if (isLocal(fastaFile)):
+        path = localPath(fastaFile)
+        idx = path + indexSuffix
+        if (not os.path.exists(idx) or os.path.getmtime(idx) < os.path.getmtime(path)):
+            return buildIndex(path)
+        with open(idx) as f:
+            return [ FastaRecord.fromString(line) for line in f if line.strip()]
+
+    (hdfs, p) = hdfsFile(fastaFile + indexSuffix)
+    with hdfs.open_input_stream(p) as f:
+        return [ FastaRecord.fromString(line) for line in f.read().decode().splitlines() if line.strip()]
+
+
+
+
+# coppie (A, B) dell'indice ordinate per seqId
+def indexPairs(records: list):
+    pairs = {}
+    for r in records:
+        pairs.setdefault(r.seqId, {})[r.pairId] = r
+    return [ (p['A'], p['B']) for (seqId, p) in sorted(pairs.items()) if 'A' in p and 'B' in p]
+
+
+
+
+# accesso ai byte di un dataset: mmap (o cache del contenuto decompresso) per i file locali,
+# read_at per quelli sull'HDFS, che devono essere non compressi
+class FastaReader:
+    def __init__(self, fastaFile: str):
+        self.fastaFile = fastaFile
+        if (isLocal(fastaFile)):
+            self.file = None
+            self.data = localData(localPath(fastaFile))
+        else:
+            (hdfs, p) = hdfsFile(fastaFile)
+            self.file = hdfs.open_input_file(p)
+            self.data = None
+            if (self.file.read_at(2, 0) == b'\x1f\x8b'):
+                self.file.close()
+                raise ValueError("%s: compressed dataset on HDFS, offsets of %s refer to the uncompressed "
+                                 "content: use an uncompressed copy" % (fastaFile, indexSuffix))
+
+    def readRange(self, first: int, last: int):
+        if (self.data is not None):
+            return self.data[first:last]
+        return self.file.read_at(last - first, first)
+
+    # basi [start, start + size) della sequenza (senza i fine riga)
+    def sequence(self, record: FastaRecord, start: int = 0, size: int = None):
+        (first, last) = record.byteRange(start, size)
+        seq = self.readRange(first, last)
+        if (record.lineBytes != record.lineBases):
+            seq = seq.replace(b'\n', b'').replace(b'\r', b'')
+        return seq
+
+    def close(self):
+        if (isinstance(self.data, mmap.mmap)):
+            self.data.close()
+        if (self.file is not None):
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+        return False
+
+
+
+
+# legge una sola coppia: usata dai task spark che ricevono (dataset, recordA, recordB)
+def readPair(fastaFile: str, recordA: FastaRecord, recordB: FastaRecord):
+    with FastaReader(fastaFile) as reader:
+        return ((recordA.header(), reader.sequence(recordA).decode()), (recordB.header(), reader.sequence(recordB).decode()))
+
+
+
+
+# finestre consecutive di winSize basi della sequenza seqNum (come splitSeq.sh: la prima parte dalla base 0)
+def extractWindows(fastaFile: str, winSize: int, nWindows: int, seqNum: int = 0):
+    record = loadIndex(fastaFile)[seqNum]
+    base = cf.splitExt(os.path.basename(fastaFile))[0]
+    outFiles = []
+    with FastaReader(fastaFile) as reader:
+        i = 0
+        for j in range(1, nWindows + 1):
+            if (i >= record.length - i):
+                break
+            outFile = '%s-%d.fasta' % (base, j)
+            with open(outFile, 'wb') as out:
+                out.write(reader.sequence(record, i, winSize))
+            outFiles.append(outFile)
+            i += winSize
+    return outFiles
+
+
+
+
+def main():
+    if (len(sys.argv) >= 3 and sys.argv[1] == 'index'):
+        for fastaFile in sys.argv[2:]:
+            records = buildIndex(fastaFile)
+            print("%s: %d sequences, %d pairs" % (fastaFile + indexSuffix, len(records), len(indexPairs(records))))
+    elif (len(sys.argv) in (5, 6) and sys.argv[1] == 'window'):
+        seqNum = int(sys.argv[5]) if len(sys.argv) == 6 else 0
+        for f in extractWindows(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]), seqNum):
+            print(f)
+    else:
+        print("Usage:\n%s index dataset.fasta [...]\n%s window dataset.fasta winSize nWindows [seqNum]" % (sys.argv[0], sys.argv[0]))
+        exit(-1)
+
+
+
+if __name__ == "__main__":
+    main()
@@ -1,128 +1,213 @@
-#! /usr/bin/python
+#! /usr/local/bin/python3
 
 import re
 import os
 import sys
-import math
+import glob
 import csv
-from filelock import Timeout, FileLock
+import shutil
+import tempfile
+import subprocess
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+import resultSink
+
+#
+# Nmax (k-mer distinti), 2N, delta = Nmax / 2N, entropia Hk ed errore delta / Hk di una sequenza.
+#
+# Usage: hist2delta-kmc.py histogramFile
+#            un dump di kmc (kmer cnt per riga): la riga e' scritta nello shard del processo di
+#            PAResults.csv (resultSink.py merge PAResults.csv alla fine dei processi paralleli)
+#        hist2delta-kmc.py -b [-k minK,maxK] [-w workers] [-o outFile] fasta|directory [...]
+#            per ogni fasta (o *.fasta della directory) e ogni k dello schedule di runKmc.sh
+#            (passo 2 fino a 20, 3 fino a 30, poi 10) kmc e' eseguito da un pool di workers e le
+#            misure sono calcolate dallo spettro dei contatori (kmc_tools histogram: numero di
+#            k-mer per ogni valore del contatore) senza passare per kmc_dump; tutte le righe sono
+#            scritte in una sola tabella outFile (default PAResults-all.csv)
+#
 
+outFile = 'PAResults.csv'
+batchOutFile = 'PAResults-all.csv'
+header = ['Model', 'G', 'len', 'pairdId', 'k', 'Nmax', '2N', 'delta', 'Hk', 'error']
 
-sumDict = dict()  # dizionario vuoto
-dist = 'dist' # directory per le distribuzioni
+minK = 4
+maxK = 62
+maxCounter = 1000000    # come -cs1000000 di runKmc.sh
 
-inputFile = sys.argv[1]
-basename = os.path.splitext(os.path.basename(inputFile))[0]
-outFile = 'PAResults.csv'
 
-def main():
-    totalCnt = 0
-    totalSeqCnt = 0
-    totalKmer = 0
-    totalProb = 0.0
-    totalLines = 0
-    k = 0
-    model = ''
-    pairId = 1
-    seqLen = 0
-    gamma = 0.0
-    seqId = '-'
+# nome di una sequenza di una coppia: model-pairId.len[.G=g]-S
+pairNameRE = re.compile(r'-(\d+)\.(\d+)(.*)-([AB])')
+
+
+# modello, coppia, lunghezza e gamma dal nome dell'istogramma k=K_model-pairId.len[.G=g]-S
+def histogramInfo(basename: str):
     m = re.search(r'^.*k=(\d+)_(.*)-(\d+)\.(\d+)(.*)-([AB])', basename)
-    if (m is not None):
-        k = int(m.group(1))
-        model = m.group(2)
-        pairId = int(m.group(3))
-        seqLen = int(m.group(4))
-        gamma = float("0."+m.group(5)[3:])
-        seqId = m.group(6)
-        print("Processing histogram: %s k=%d, model=%s, pair=%d, len=%d, gamma=%.2f, S=%s" %
-              (basename, k, model, pairId, seqLen, gamma, seqId))
-    else:
+    if (m is None):
         print("did not match")
+        return (0, '', 1, 0, 0.0, '-')
+    (k, model, pairId, seqLen) = (int(m.group(1)), m.group(2), int(m.group(3)), int(m.group(4)))
+    gamma = float("0."+m.group(5)[3:])
+    seqId = m.group(6)
+    print("Processing histogram: %s k=%d, model=%s, pair=%d, len=%d, gamma=%.2f, S=%s" %
+          (basename, k, model, pairId, seqLen, gamma, seqId))
+    return (k, model, pairId, seqLen, gamma, seqId)
+
+
+# Nmax, N e Hk dallo spettro: freqs[i] k-mer distinti hanno contatore counts[i]
+def spectrumStats(counts, freqs):
+    counts = np.asarray(counts, dtype=np.float64)
+    freqs = np.asarray(freqs, dtype=np.float64)
+    keep = (counts > 0) & (freqs > 0)
+    (counts, freqs) = (counts[keep], freqs[keep])
+    Nmax = int(freqs.sum())
+    N = int((counts * freqs).sum())
+    if (N == 0):
+        return (0, 0, 0.0, 0.0)
+    probs = counts / N
+    Hk = float(-(freqs * probs * np.log2(probs)).sum())
+    totalProb = float((freqs * probs).sum())
+    return (Nmax, N, Hk, totalProb)
+
+
+def deltaRow(info, Nmax: int, N: int, Hk: float):
+    (k, model, pairId, seqLen, gamma, seqId) = info
+    delta = float(Nmax) / (2 * N)
+    return [model, gamma, seqLen, pairId, k, Nmax, 2*N, delta, Hk, delta/Hk if Hk != 0 else float('nan') ]
+
+
+# ogni file contiene l'istogramma di una sola sequenza prodotto con kmc 3 (kmc_dump: kmer cnt)
+def dumpSpectrum(histFile: str):
+    with open(histFile, 'rb') as inFile:
+        tokens = inFile.read().split()
+    if (len(tokens) % 2 != 0):
+        raise ValueError("Malformed histogram file (%d token)" % len(tokens))
+    (counts, freqs) = np.unique(np.array(tokens[1::2]).astype(np.int64), return_counts=True)
+    return (counts, freqs)
 
-    # ogni file contiene l'istogramma di una sola sequenza prodotto con kmc 3
-    with open(inputFile) as inFile:
-        seqDict = dict()
-        totalSeqCnt = 0
-        seqNum = 1
-        for line in inFile:
-            # m = re.search(r'^([A-Z]+)[ \t]+(\d+)', line)
-            # if (m is None):
-            #    print line, " malformed histogram file"
-            #    exit()
-            # else:
-            #    kmer = m.group(1)
-            #    count = int(m.group(2))
-            s = line.split()   # molto piu' veloce della re
-            if (len(s) != 2):
-                print( "%sMalformed histogram file (%d token)" % (line, len(s)))
-                exit()
-            else:
-                kmer = s[0]
-                count = int(s[1])
 
-            # totale generale per il calcolo della probabilita' empirica
-            totalCnt = totalCnt + count
-            totalSeqCnt = totalSeqCnt + count
-            totalLines = totalLines + 1
 
-            if kmer in sumDict:
-                sumDict[kmer] = sumDict[kmer] + int(count)
+
+# spettro dei contatori di un fasta per un valore di k calcolato con kmc + kmc_tools histogram
+def kmcSpectrum(fastaFile: str, k: int, tempDir: str, threads: int = 1):
+    workDir = tempfile.mkdtemp(dir=tempDir)
+    try:
+        prefix = os.path.join(workDir, 'kmc')
+        cx = max(1, min(maxCounter, os.path.getsize(fastaFile)))
+        subprocess.check_output(['kmc', '-b', '-hp', '-k%d' % k, '-m2', '-fm', '-ci1', '-cs%d' % maxCounter,
+                                 '-t%d' % threads, fastaFile, prefix, workDir])
+        specFile = os.path.join(workDir, 'spectrum.txt')
+        subprocess.check_output(['kmc_tools', 'transform', prefix, 'histogram', specFile, '-ci1', '-cx%d' % cx])
+        spec = np.loadtxt(specFile, dtype=np.int64, ndmin=2)
+        return (spec[:, 0], spec[:, 1]) if len(spec) > 0 else (np.zeros(0), np.zeros(0))
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+
+def kSchedule(minK: int = minK, maxK: int = maxK):
+    ks = []
+    k = minK
+    while (k <= maxK):
+        ks.append(k)
+        k += 2 if k < 20 else 3 if k < 30 else 10
+    return ks
+
+
+# ritorna (riga, errore): un fallimento di kmc/kmc_tools non interrompe gli altri task
+def batchTask(task):
+    (fastaFile, k, tempDir, threads) = task
+    base = os.path.splitext(os.path.basename(fastaFile))[0]
+    try:
+        (Nmax, N, Hk, totalProb) = spectrumStats(*kmcSpectrum(fastaFile, k, tempDir, threads))
+    except (subprocess.CalledProcessError, OSError, ValueError) as e:
+        print("%s k = %d: failed (%s)" % (fastaFile, k, e))
+        return (None, str(e))
+    if (N == 0):
+        print("%s k = %d: no k-mers" % (fastaFile, k))
+        return (None, None)
+    # k e nome dal task: il nome del file (se e' quello di una coppia) fornisce solo modello, coppia,
+    # lunghezza e gamma, altrimenti il modello e' il nome del file
+    info = histogramInfo("k=%d_%s" % (k, base)) if pairNameRE.search(base) else (k, base, 0, 0, 0.0, '-')
+    return (deltaRow((k,) + info[1:], Nmax, N, Hk), None)
+
+
+# tutte le coppie (fasta, k) in un pool di workers: una sola tabella di risultati
+def batchDelta(inputs: list, ks: list, outFile: str = batchOutFile, workers: int = 1):
+    files = []
+    for p in inputs:
+        files += sorted(glob.glob(os.path.join(p, '*.fasta'))) if os.path.isdir(p) else [p]
+    tempDir = tempfile.mkdtemp(dir='.')
+    threads = max(1, os.cpu_count() // workers)
+    try:
+        tasks = [ (f, k, tempDir, threads) for f in files for k in ks]
+        print("****** %d files x %d values of k = %d tasks, %d workers ******" % (len(files), len(ks), len(tasks), workers))
+        rows = []
+        failed = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for (task, (row, error)) in zip(tasks, executor.map(batchTask, tasks)):
+                if (error is not None):
+                    failed.append((task[0], task[1], error))
+                elif (row is not None):
+                    rows.append(row)
+    finally:
+        shutil.rmtree(tempDir, ignore_errors=True)
+
+    with open(outFile, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+    print("%s: %d rows, %d failed tasks" % (outFile, len(rows), len(failed)))
+    for (fastaFile, k, error) in failed:
+        print("failed: %s k = %d: %s" % (fastaFile, k, error))
+    return (rows, failed)
+
+
+
+
+def main():
+    args = sys.argv[1:]
+    if (len(args) > 0 and args[0] == '-b'):
+        args = args[1:]
+        (k1, k2, workers, out) = (minK, maxK, os.cpu_count(), batchOutFile)
+        while (len(args) > 1 and args[0] in ('-k', '-w', '-o')):
+            if (args[0] == '-k'):
+                (k1, k2) = [ int(v) for v in args[1].split(',')]
+            elif (args[0] == '-w'):
+                workers = max(1, int(args[1]))
             else:
-                sumDict[kmer] = int(count)
-
-
-    totalKmer = 0
-    totalProb = 0
-    #probFile = "%s/%s.dist" % (dist, basename)
-    # with open(probFile, "w") as outDist :
-    #    kmers = sorted(sumDict.keys())
-    Hk = 0.0
-    for key in sumDict.keys():
-        prob = sumDict[key] / float(totalCnt)
-        totalProb = totalProb + prob
-        totalKmer = totalKmer + 1
-        Hk = Hk + prob * math.log(prob, 2)
-        # print( "prob(%s) = %f log(prob) = %f" % (key, prob, math.log(prob, 2)))
-
-    Hk = Hk * -1
-    Nmax = len(sumDict.keys())
-    if (totalKmer != Nmax):
-        print( "errore %d vs %d" % (totalKmer, Nmax))
+                out = args[1]
+            args = args[2:]
+        if (len(args) == 0):
+            print("Usage: %s -b [-k minK,maxK] [-w workers] [-o outFile] fasta|directory [...]" % os.path.basename(sys.argv[0]))
+            exit(-1)
+        (rows, failed) = batchDelta(args, kSchedule(k1, k2), out, workers)
+        if (len(failed) > 0):
+            exit(-1)
+        return
+
+    if (len(args) != 1):
+        print("Usage: %s histogramFile\n       %s -b [-k minK,maxK] [-w workers] [-o outFile] fasta|directory [...]" %
+              (os.path.basename(sys.argv[0]), os.path.basename(sys.argv[0])))
         exit(-1)
 
+    inputFile = args[0]
+    basename = os.path.splitext(os.path.basename(inputFile))[0]
+    info = histogramInfo(basename)
+    try:
+        (Nmax, N, Hk, totalProb) = spectrumStats(*dumpSpectrum(inputFile))
+    except ValueError as e:
+        print(e)
+        exit()
+
     if (round(totalProb,0) != 1.0):
         print( "errore Somma(p) = %f" % (totalProb))
         exit(-1)
 
-    # print("total kmer values:\t%d" % totalLines)  # numero dei conteggi
-    print("total distinct kmers (Nmax):\t%d" % totalKmer) # Nmax number of distinct kmers with frequency > 0
-    print("total kmers counter (N):\t%d" % totalCnt)  # totale conteggio
-    # print("total prob-distr.:\t%f" % totalProb)  # totale distribuzione di probabilita'
-    N = totalCnt
-    delta = float(Nmax) / (2 * N)
-    header = ['Model', 'G', 'len', 'pairdId', 'k', 'Nmax', '2N', 'delta', 'Hk', 'error']
-    data = [model, gamma, seqLen, pairId, k, Nmax, 2*N, delta, Hk, delta/Hk ]
-
-    lock = FileLock(outFile + '.lck')
-    try:
-        lock.acquire(5)
-        print("Lock acquired.")
-        print( data)
-        if (not os.path.exists( outFile)):
-            with open(outFile, 'w') as f:
-                writer = csv.writer(f)
-                writer.writerow(header)
-                writer.writerow(data)
-        else:
-            with open(outFile, 'a') as f:
-                writer = csv.writer(f)
-                writer.writerow(data)
-            
-        lock.release()
-        
-    except Timeout:
-        print("Another instance of this application currently holds the lock.")
+    print("total distinct kmers (Nmax):\t%d" % Nmax) # Nmax number of distinct kmers with frequency > 0
+    print("total kmers counter (N):\t%d" % N)  # totale conteggio
+    data = deltaRow(info, Nmax, N, Hk)
+    print( data)
+    with resultSink.ShardedSink(outFile, header) as sink:
+        sink.write(data)
 
 
 
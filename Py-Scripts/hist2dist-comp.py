@@ -1,60 +1,104 @@
-#! /usr/bin/python
+#! /usr/local/bin/python3
 
 import re
 import os
 import sys
 import time
-from array import array
-
-inputFile = sys.argv[1]
-
-totalCnt = 0
-totalSeqCnt = 0
-totalKmer = 0
-totalProb = 0.0
-totalLines = 0
+import numpy as np
+
+#
+# Costruisce la matrice sequenze x k-mer (probabilita' empiriche) di un istogramma
+# dist-k=K_model-nPairs.len[.G=g] con righe (seqId,(kmer,cnt)).
+# Il file e' letto a blocchi di righe: la tokenizzazione e' vettoriale (bytes.translate/split e
+# conversione numpy degli array seqId/k-mer/cnt). Una prima lettura raccoglie i k-mer distinti
+# (ordinati una sola volta), la seconda li distribuisce (searchsorted) direttamente nel file
+# .distbin mappato in memoria (np.memmap): la memoria usata e' quella della matrice finale.
+#
+# Formato .distbin (letto dagli script R): int32 numero di k-mer, poi per ogni sequenza
+# (2 * nPairs) il vettore float64 delle probabilita' dei k-mer in ordine lessicografico.
+#
+# Usage: hist2dist-comp.py histogramFile
+#
+
+blockSize = 64 * 1024 * 1024
 writeSequenceHistogram = True
 
-sumDict = dict()  # dizionario vuoto
-seqDict = dict()
-
 seqDistDir = 'seqDists'
-basename = os.path.splitext(os.path.basename(inputFile))[0]
+stripTable = bytes.maketrans(b'\n', b',')
 
 
-def OutputFileName():
+def OutputFileName(basename: str):
     return( "%s/%s-All.distbin" % (seqDistDir, basename))
 
 
-# salva la distribuzione ed istogramma della sequenza prevSeq
-def SaveDistributions(model, pairs):
-    fileName1 = OutputFileName()
-    with open(fileName1, "w") as outFileDist:
-        kmers = sorted(seqDict.keys())
-        arrLen = [1]
-        arrLen[0] = len(kmers)
-        header = array('i', arrLen )
-        header.tofile(outFileDist)
-        pv = [0]*arrLen[0]
-        for seq in range(2 * pairs):
-            ks = 0
-            for key in sorted(seqDict.keys()):
-                av = seqDict[key]
-                # outFileDist.write("%s " % (key))
-                pv[ks] = av[seq] / float(totalSeqCnt)
-                ks = ks + 1
+# blocchi di righe complete del file
+def lineBlocks(inputFile: str):
+    with open(inputFile, 'rb') as inFile:
+        while True:
+            block = inFile.read(blockSize)
+            if (not block):
+                return
+            block += inFile.readline()
+            yield block
+
+
+# righe (seqId,(kmer,cnt)) -> array seqId, k-mer (bytes di lunghezza fissa), cnt
+def parseBlock(block: bytes):
+    nLines = block.count(b'\n') + (0 if block.endswith(b'\n') else 1)
+    tokens = block.translate(stripTable, b'() \r').rstrip(b',').split(b',')
+    if (len(tokens) != 3 * nLines):
+        raise ValueError("malformed histogram file")
+    seqs = np.array(tokens[0::3]).astype(np.int64)
+    kmers = np.array(tokens[1::3])
+    counts = np.array(tokens[2::3]).astype(np.int64)
+    return (seqs, kmers, counts)
+
+
+# prima lettura: k-mer distinti ordinati e totale dei conteggi di ogni sequenza
+def collectKmers(inputFile: str, nSeqs: int):
+    kmers = np.zeros(0, dtype='S1')
+    seqTotals = np.zeros(nSeqs, dtype=np.int64)
+    totalLines = 0
+    for block in lineBlocks(inputFile):
+        (seqs, blockKmers, counts) = parseBlock(block)
+        kmers = np.union1d(kmers, blockKmers)
+        seqTotals += np.bincount(seqs, weights=counts, minlength=nSeqs)[:nSeqs].astype(np.int64)
+        totalLines += len(seqs)
+        if (len(seqs) > 0 and seqs.max() >= nSeqs):
+            raise ValueError("seqId %d out of range (%d sequences)" % (seqs.max(), nSeqs))
+    return (kmers, seqTotals, totalLines)
+
+
+# seconda lettura: probabilita' scritte nella matrice (mappata sul file di output) e somme per k-mer
+def SaveDistributions(inputFile: str, outFile: str, kmers, seqTotals):
+    nSeqs = len(seqTotals)
+    with open(outFile, 'wb') as f:
+        f.write(np.array([len(kmers)], dtype=np.int32).tobytes())
+        f.truncate(4 + 8 * nSeqs * len(kmers))
+
+    sums = np.zeros(len(kmers), dtype=np.int64)
+    dist = np.memmap(outFile, dtype=np.float64, mode='r+', offset=4, shape=(nSeqs, len(kmers)))
+    for block in lineBlocks(inputFile):
+        (seqs, blockKmers, counts) = parseBlock(block)
+        idx = np.searchsorted(kmers, blockKmers)
+        dist[seqs, idx] = counts / seqTotals[seqs]
+        sums += np.bincount(idx, weights=counts, minlength=len(kmers)).astype(np.int64)
+        sys.stdout.write('.')
+        sys.stdout.flush()
+    dist.flush()
+    del dist
+    return sums
 
-            # salva l'intero vettore di probabilita'
-            fa = array('d', pv)
-            fa.tofile(outFileDist)
-            #outFileDist.write("\n")
 
 
 
 def main():
-    global totalCnt, totalSeqCnt, totalKmer, totalProb, totalLines, writeSequenceHistogram, sumDict, seqDict
+    if (len(sys.argv) != 2):
+        print("Errore nei parametri:\nUsage: %s histogramFile" % os.path.basename(sys.argv[0]))
+        exit(-1)
 
-    prevSeq = 0 # N.B. la  prima sequenza ha indice 0
+    inputFile = sys.argv[1]
+    basename = os.path.splitext(os.path.basename(inputFile))[0]
 
     if (writeSequenceHistogram):
         if not os.path.exists(seqDistDir):
@@ -62,17 +106,17 @@ def main():
 
     m = re.search(r'^(.*)k=(\d+)_(.*)-(\d+)\.(\d+)', basename)
     if (m is None):
-        print basename, " malformed histogram filename"
+        print(basename, " malformed histogram filename")
         exit()
     else:
         kLen = int(m.group(2))
         model = m.group(3)
         nPairs = int(m.group(4))
-        len = int(m.group(5))
+        seqLen = int(m.group(5))
 
     # crea il file distribuzione solo se l'input e' piu' recente
     mt1 = os.path.getmtime(inputFile)
-    out = OutputFileName()
+    out = OutputFileName(basename)
     if (os.path.exists(out)):
         mt2 = os.path.getmtime(out)
         if (mt2 > mt1):
@@ -80,76 +124,35 @@ def main():
             print( "%s -> %s vs\n%s -> %s" % (inputFile, time.ctime(mt1), out, time.ctime(mt2)))
             exit(-1)
 
-    with open(inputFile) as inFile:
-        for line in inFile:
-            # pattern ( idSeq, ( k-mer, cnt))
-            m = re.search(r'^\((\d+),\(([A-Z]+),(\d+)\)\)', line)
-            if (m is None):
-                print line, " malformed histogram file"
-                exit(-1)
-            else:
-                seqNum = int(m.group(1))
-                kmer = m.group(2)
-                count = int(m.group(3))
-
-            if (seqNum != prevSeq):
-                # salviamo tutto il dizionario unico alla fine
-                if (totalSeqCnt != len - kLen + 1):
-                    print("Wrong number of k-mers %d vs %d" & (totalSeqCnt, len - kLen + 1))
-                    exit(-1)
-                totalSeqCnt = 0
-                prevSeq = seqNum
-                sys.stdout.write('\r%d / %d Complete\r' % (seqNum,nPairs*2)),
-                sys.stdout.flush()
-
-            # totale generale per il calcolo della probabilita' empirica
-            totalCnt = totalCnt + count
-            totalSeqCnt = totalSeqCnt + count
-            totalLines = totalLines + 1
-
-            if kmer in sumDict:
-                sumDict[kmer] = sumDict[kmer] + count
-            else:
-                sumDict[kmer] = count
-
-            if kmer in seqDict:
-                av = seqDict[kmer]
-                if (av[seqNum] != 0):
-                    print("Errore seqNum %d non zero initial value" & seqNum)
-
-                av[seqNum] = count #otherwise av[seqNum] + count ????
-                seqDict[kmer] = av
-            else:
-                av = [0]*(2*nPairs)
-                av[seqNum] = count
-                seqDict[kmer] = av
+    try:
+        (kmers, seqTotals, totalLines) = collectKmers(inputFile, 2 * nPairs)
+    except ValueError as e:
+        print(inputFile, e)
+        exit(-1)
 
-    if (writeSequenceHistogram):
-        # salva la distribuzione e l'istogramma dell'ultima sequenza
-        SaveDistributions(model, nPairs)
+    wrong = np.nonzero(seqTotals != seqLen - kLen + 1)[0]
+    if (len(wrong) > 0):
+        print("Wrong number of k-mers for sequence %d: %d vs %d" % (wrong[0], seqTotals[wrong[0]], seqLen - kLen + 1))
+        exit(-1)
 
+    sums = SaveDistributions(inputFile, out, kmers, seqTotals)
     print('')
 
+    totalCnt = int(sums.sum())
     freqFile = basename + '.sum'
     with open(freqFile, "w") as outText:
-        for key in sumDict:
-            outText.write("%s\t%d\n" % (key, sumDict[key]))
+        outText.writelines("%s\t%d\n" % (key.decode(), cnt) for (key, cnt) in zip(kmers, sums.tolist()))
 
-    totalKmer = 0
-    totalProb = 0
+    probs = sums / float(totalCnt)
     probFile = basename + '.dist'
     with open(probFile, "w") as outText:
-        for key in sumDict:
-            prob = sumDict[key] / float(totalCnt)
-            totalProb = totalProb + prob
-            totalKmer = totalKmer + 1
-            outText.write("%f\n" % (prob))
+        outText.writelines("%f\n" % prob for prob in probs.tolist())
 
-    print("total sequence number:\t%d" % (int(seqNum) + 1))  # numero sequenze seqId starts from 0
+    print("total sequence number:\t%d" % len(seqTotals))  # numero sequenze seqId starts from 0
     print("total kmer values:\t%d" % totalLines)  # numero dei conteggi
-    print("total distinct kmers:\t%d" % totalKmer)  # numero kmers
+    print("total distinct kmers:\t%d" % len(kmers))  # numero kmers
     print("total kmers counter:\t%d" % totalCnt)  # totale conteggio
-    print("total prob-distr.:\t%f" % totalProb)  # totale distribuzione di probabilita'
+    print("total prob-distr.:\t%f" % probs.sum())  # totale distribuzione di probabilita'
 
 
 if __name__ == "__main__":
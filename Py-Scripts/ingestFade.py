@@ -0,0 +1,148 @@
+#! /usr/local/bin/python3
+
+import re
+import os
+import sys
+import glob
+from concurrent.futures import ProcessPoolExecutor
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import pyarrow.dataset as ds
+
+#
+# Raccoglie tutti gli output di FADE (resultsDir/k=K/dist-k=K_model-nPairs.len[.G=g].csv, una riga
+# per coppia: seqA,seqB,misure...) in un unico dataset parquet partizionato per k e modello:
+#   storeDir/k=K/Model=model/<nome file FADE>.parquet
+# con colonne tipate gamma (float64), seqLen (int32), seqId (int32), seqA, seqB e una colonna float64
+# per ogni misura. model, len e gamma sono ricavati una sola volta dal nome del file, seqId e'
+# estratto con un'unica espressione regolare vettoriale (pyarrow.compute) sulla colonna seqA.
+# I file sono convertiti in parallelo (un file parquet per output di FADE: ripetere l'ingest di un
+# file ne sostituisce la partizione). Il dataset si legge con loadFadeResults o con
+# pyarrow.dataset / spark.read.parquet.
+#
+# Usage: ingestFade.py [-w workers] [-o storeDir] [resultsDir]
+#
+
+resultsDir = 'results/allMeasures'
+storeDir = 'fadeResults'
+
+# dist-k=4_MotifRepl-Sh-1000.10000.G=010.csv or dist-k=4_ShuffledEColi-1000.10000.csv
+fileRegex = re.compile(r'^dist-k=(\d+)_(.*)-(\d+)\.(\d+)(.*)\.csv$')
+# MotifRepl.00087.G=010-A
+seqIdRegex = r'^.+\.(?P<seqId>\d+)'
+
+
+# (k, model, seqLen, gamma) dal nome del file di FADE, None se il nome non e' riconosciuto
+def fadeFileInfo(inputFile: str):
+    m = fileRegex.search(os.path.basename(inputFile))
+    if (m is None):
+        return None
+    gamma = 0. if (len(m.group(5)) == 0) else float("0." + m.group(5)[3:])
+    return (int(m.group(1)), m.group(2), int(m.group(4)), gamma)
+
+
+def fadeFiles(resultsDir: str):
+    return sorted(glob.glob(os.path.join(resultsDir, 'k=*', 'dist-k=*_*.csv')))
+
+
+def partitionFile(storeDir: str, inputFile: str, k: int, model: str):
+    name = os.path.splitext(os.path.basename(inputFile))[0]
+    return os.path.join(storeDir, 'k=%d' % k, 'Model=%s' % model, name + '.parquet')
+
+
+# tabella tipata di un output di FADE
+def fadeTable(inputFile: str, seqLen: int, gamma: float):
+    table = pacsv.read_csv(inputFile)
+    names = table.column_names
+    if (len(names) < 3):
+        raise ValueError("%s: %d columns, expected seqA,seqB,measures..." % (inputFile, len(names)))
+
+    seqA = table.column(0).cast(pa.string())
+    ids = pc.extract_regex(seqA, seqIdRegex)
+    if (ids.null_count > 0):
+        raise ValueError("%s: %d sequence names without seqId" % (inputFile, ids.null_count))
+
+    n = table.num_rows
+    cols = [ pa.array([gamma] * n, type=pa.float64()),
+             pa.array([seqLen] * n, type=pa.int32()),
+             pc.struct_field(ids, [0]).cast(pa.int32()),
+             seqA,
+             table.column(1).cast(pa.string())]
+    cols += [ table.column(i).cast(pa.float64()) for i in range(2, len(names))]
+    return pa.Table.from_arrays(cols, names=['gamma', 'seqLen', 'seqId', 'seqA', 'seqB'] + names[2:])
+
+
+# converte un file di FADE nella sua partizione: ritorna (file, righe, errore)
+def ingestFile(task):
+    (inputFile, storeDir) = task
+    info = fadeFileInfo(inputFile)
+    if (info is None):
+        return (inputFile, 0, "malformed file name")
+    (k, model, seqLen, gamma) = info
+    try:
+        table = fadeTable(inputFile, seqLen, gamma)
+    except (ValueError, pa.ArrowInvalid) as e:
+        return (inputFile, 0, str(e))
+
+    outFile = partitionFile(storeDir, inputFile, k, model)
+    os.makedirs(os.path.dirname(outFile), exist_ok=True)
+    tmp = '%s.tmp.%d' % (outFile, os.getpid())
+    pq.write_table(table, tmp, compression='zstd')
+    os.replace(tmp, outFile)
+    return (inputFile, table.num_rows, None)
+
+
+def ingestAll(resultsDir: str, storeDir: str, workers: int = 1):
+    files = fadeFiles(resultsDir)
+    print("****** %d FADE output files in %s -> %s, %d workers ******" % (len(files), resultsDir, storeDir, workers))
+    rows = 0
+    errors = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for (inputFile, n, error) in executor.map(ingestFile, [ (f, storeDir) for f in files]):
+            if (error is not None):
+                print("%s: %s" % (inputFile, error))
+                errors.append(inputFile)
+            rows += n
+    print("****** %d rows from %d files, %d errors ******" % (rows, len(files) - len(errors), len(errors)))
+    return (rows, errors)
+
+
+# tabella (eventualmente filtrata per k e modello) del dataset consolidato
+def loadFadeResults(storeDir: str = storeDir, k: int = None, model: str = None):
+    dataset = ds.dataset(storeDir, format='parquet', partitioning='hive')
+    filter = None
+    if (k is not None):
+        filter = (ds.field('k') == k)
+    if (model is not None):
+        cond = (ds.field('Model') == model)
+        filter = cond if filter is None else filter & cond
+    return dataset.to_table(filter=filter)
+
+
+
+
+def main():
+    args = sys.argv[1:]
+    workers = os.cpu_count()
+    outDir = storeDir
+    while (len(args) > 1 and args[0] in ('-w', '-o')):
+        if (args[0] == '-w'):
+            workers = max(1, int(args[1]))
+        else:
+            outDir = args[1]
+        args = args[2:]
+
+    if (len(args) > 1 or (len(args) == 1 and args[0].startswith('-'))):
+        print("Usage: %s [-w workers] [-o storeDir] [resultsDir]" % os.path.basename(sys.argv[0]))
+        exit(-1)
+
+    (rows, errors) = ingestAll(args[0] if len(args) > 0 else resultsDir, outDir, workers)
+    if (len(errors) > 0):
+        exit(-1)
+
+
+
+if __name__ == "__main__":
+    main()
@@ -6,8 +6,9 @@ import sys
 import glob
 import subprocess
 import csv
-from filelock import Timeout, FileLock
+import resultSink
 import numpy as np
+import kmerSets
 
 
 # process private temporary directory
@@ -18,31 +19,12 @@ lengths = [2000, 20000, 200000, 2000000, 20000000]
 minK = 4
 maxK = 62
 model = 'Uniform'
+outFile = 'JaccardData.csv'
+header = ['model', 'gamma', 'seqLen', 'pairId', 'k', 'Jaccard Distance', 'A', 'B', 'C', 'D', 'Nmax']
+sink = None
 
 
 
-def loadKmerList( file):
-    print("Loading from file %s" % file)
-    # ogni file contiene l'istogramma di una sola sequenza prodotto con kmc 3
-    with open(file) as inFile:
-        seqDict = dict()
-        for line in inFile:
-            s = line.split()   # molto piu' veloce della re
-            if (len(s) != 2):
-                print( "%sMalformed histogram file (%d token)" % (line, len(s)))
-                exit()
-            else:
-                kmer = s[0]
-                count = int(s[1])
-
-            if kmer in seqDict:
-                seqDict[kmer] = seqDict[kmer] + count
-            else:
-                seqDict[kmer] = count
-
-    return np.array(seqDict.keys())
-
-
 def extractKmers( dataset, k, seq):
     inputDataset = '%s-%s.fasta' % (dataset, seq)
     kmcOutputPrefix = "k=%d%s-%s" % (k, dataset, seq)
@@ -59,7 +41,7 @@ def extractKmers( dataset, k, seq):
     p.wait()
     print("cmd: %s returned: %s" % (cmd, p.returncode))
     # load kmers from histogram file
-    vect = loadKmerList(histFile)
+    vect = kmerSets.loadKmerSet(histFile, k)
     # remove temporary files
     os.remove(histFile)
     for f in glob.glob(kmcOutputPrefix+'*'):
@@ -73,7 +55,6 @@ def extractKmers( dataset, k, seq):
 # run jaccard on sequence pair ds with kmer of length = k
 def runJaccard( ds, k):
 
-    outFile = 'JaccardData.csv'
     m = re.search(r'^(.*)-(\d+)\.(\d+)(.*)', ds)
     if (m is not None):
         model = m.group(1)
@@ -89,8 +70,8 @@ def runJaccard( ds, k):
 
     print("left: %d, right: %d" % (leftKmers.size, rightKmers.size))
 
-    intersection = np.intersect1d( leftKmers, rightKmers)
-    bothCnt = intersection.size
+    # insiemi ordinati di codici interi (uint64 o coppie per k > 32): intersezione con un merge lineare
+    bothCnt = kmerSets.intersectionSize( leftKmers, rightKmers)
     A = bothCnt
     leftCnt = leftKmers.size - bothCnt
     B = leftCnt
@@ -106,34 +87,16 @@ def runJaccard( ds, k):
     # jaccardDistance = M01M10 / float(M01M10M11)
     jaccardDistance = 1 - min( 1.0, A / float(NMax - D))
     
-    header = ['model', 'gamma', 'seqLen', 'pairId', 'k', 'Jaccard Distance', 'A', 'B', 'C', 'D', 'Nmax']
     data = [model, gamma, seqLen, pairId, k, jaccardDistance, bothCnt, leftCnt, rightCnt, absentCnt, NMax]
 
-    lock = FileLock(outFile + '.lck')
-    try:
-        lock.acquire(5)
-        print("Lock acquired.")
-        print( data)
-        if (not os.path.exists( outFile)):
-            f = open(outFile, 'w')
-            writer = csv.writer(f)
-            writer.writerow(header)
-        else:
-            f = open(outFile, 'a')
-            writer = csv.writer(f)
-
-        writer.writerow(data)
-        f.close()
-        lock.release()
-
-    except Timeout:
-        print("Another instance of this application currently holds the lock.")
+    print( data)
+    sink.write(data)
 
 
 
 
 def main():
-    global minK, maxK
+    global minK, maxK, sink
     
     l = len(sys.argv)
     if (l < 2 or l > 3):
@@ -153,22 +116,24 @@ def main():
     os.mkdir(tempDir)
     
     gammas =  ['none'] if model.startswith('Uniform') else gVals
-    for seqLen in lengths:
-        for seqId in range(1, 21):
-            for g in gammas:
-                gamma = '' if g == 'none' else '.G=%03d' % g
-                k = minK
-                while (k <= maxK):
-                    dataset = '%s-%04d.%d%s' % (model, seqId, seqLen, gamma)
-                    print("dataset: %s" % dataset)
-                    runJaccard( dataset, k)
-                    
-                    if (k < 20):
-                        k += 2
-                    elif (k < 30):
-                        k += 3
-                    else:
-                        k += 10
+    # ogni processo (uno per modello) scrive il proprio shard di outFile, uniti da scripts/runJaccardKmc.sh
+    with resultSink.ShardedSink(outFile, header) as sink:
+        for seqLen in lengths:
+            for seqId in range(1, 21):
+                for g in gammas:
+                    gamma = '' if g == 'none' else '.G=%03d' % g
+                    k = minK
+                    while (k <= maxK):
+                        dataset = '%s-%04d.%d%s' % (model, seqId, seqLen, gamma)
+                        print("dataset: %s" % dataset)
+                        runJaccard( dataset, k)
+
+                        if (k < 20):
+                            k += 2
+                        elif (k < 30):
+                            k += 3
+                        else:
+                            k += 10
     # cleanup
     os.rmdir(tempDir)
 
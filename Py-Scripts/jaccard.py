@@ -6,8 +6,9 @@ import sys
 import glob
 import subprocess
 import csv
-from filelock import Timeout, FileLock
+import resultSink
 import numpy as np
+import kmerSets
 
 
 # process private temporary directory
@@ -19,28 +20,8 @@ maxK = 62
 model = 'Uniform'
 
 outFile = ''
-
-
-def loadKmerList( file):
-    print("Loading from file %s" % file)
-    # ogni file contiene l'istogramma di una sola sequenza prodotto con kmc 3
-    with open(file) as inFile:
-        seqDict = dict()
-        for line in inFile:
-            s = line.split()   # molto piu' veloce della re
-            if (len(s) != 2):
-                print( "%sMalformed histogram file (%d token)" % (line, len(s)))
-                exit()
-            else:
-                kmer = s[0]
-                count = int(s[1])
-
-            if kmer in seqDict:
-               seqDict[kmer] = seqDict[kmer] + count
-            else:
-                seqDict[kmer] = count
-
-    return np.array(seqDict.keys())
+header = ['model', 'gamma', 'k', 'Jaccard Distance', 'A', 'B', 'C', 'D', 'Nmax', 'A/(N-D)']
+sink = None
 
 
 
@@ -65,7 +46,7 @@ def extractKmers( dataset, k, remove = True):
         print("skipping kmer extraction for dataset: %s" % dataset)
         
     # load kmers from histogram file
-    vect = loadKmerList(histFile)
+    vect = kmerSets.loadKmerSet(histFile, k)
 
     if (remove):
         # remove temporary files
@@ -80,15 +61,14 @@ def extractKmers( dataset, k, remove = True):
 
 # run jaccard on sequence pair ds with kmer of length = k
 def runJaccard( ds1, ds2, k):
-    global outFile
 
     leftKmers = extractKmers(ds1, k, False)
     rightKmers = extractKmers(ds2, k, False)
 
     print("left: %d, right: %d" % (leftKmers.size, rightKmers.size))
 
-    intersection = np.intersect1d( leftKmers, rightKmers)
-    bothCnt = intersection.size
+    # insiemi ordinati di codici interi (uint64 o coppie per k > 32): intersezione con un merge lineare
+    bothCnt = kmerSets.intersectionSize( leftKmers, rightKmers)
     A = bothCnt
     leftCnt = leftKmers.size - bothCnt
     B = leftCnt
@@ -105,34 +85,16 @@ def runJaccard( ds1, ds2, k):
     jaccardIndex = A / float(NMax - D)
     jaccardDistance = 1 - jaccardIndex
     
-    header = ['model', 'gamma', 'k', 'Jaccard Distance', 'A', 'B', 'C', 'D', 'Nmax', 'A/(N-D)']
     data = [model, gamma, k, jaccardDistance, bothCnt, leftCnt, rightCnt, absentCnt, NMax, jaccardIndex]
 
-    lock = FileLock(outFile + '.lck')
-    try:
-        lock.acquire(5)
-        print("Lock acquired.")
-        print( data)
-        if (not os.path.exists( outFile)):
-            f = open(outFile, 'w')
-            writer = csv.writer(f)
-            writer.writerow(header)
-        else:
-            f = open(outFile, 'a')
-            writer = csv.writer(f)
-
-        writer.writerow(data)
-        f.close()
-        lock.release()
-
-    except Timeout:
-        print("Another instance of this application currently holds the lock.")
+    print( data)
+    sink.write(data)
 
 
 
 
 def main():
-    global minK, maxK, gamma, model, outFile
+    global minK, maxK, gamma, model, outFile, sink
     
     l = len(sys.argv)
     if (l < 4 or l > 5):
@@ -163,16 +125,18 @@ def main():
 
     print('model: %s, gamma = %.3f' % (model, gamma))
 
-    k = minK
-    while (k <= maxK):
-        runJaccard( seq1, seq2, k)
-        
-        if (k < 20):
-            k += 2
-        elif (k < 30):
-            k += 3
-        else:
-            k += 10
+    # ogni processo scrive il proprio shard di outFile (resultSink.py merge outFile)
+    with resultSink.ShardedSink(outFile, header) as sink:
+        k = minK
+        while (k <= maxK):
+            runJaccard( seq1, seq2, k)
+
+            if (k < 20):
+                k += 2
+            elif (k < 30):
+                k += 3
+            else:
+                k += 10
 
     # cleanup
     os.rmdir(tempDir)
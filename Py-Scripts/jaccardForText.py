@@ -14,16 +14,25 @@ import numpy as np
 ext = '.fna'
 basis = string.ascii_uppercase + string.digits + ' '
 
+thetaValues = [1, 5, 10, 20, 30, 40, 50, 60, 70, 80, 90, 95]
+
+# testo codificato sull'alfabeto basis (37 simboli): A-Z -> 0..25, 0-9 -> 26..35, ' ' -> 36
+# i caratteri ascii rimasti fuori dall'alfabeto dopo la normalizzazione (\t, \f, ...) diventano spazi
+symbolTable = np.full(256, len(basis) - 1, dtype=np.uint8)
+symbolTable[np.frombuffer(basis.encode(), dtype=np.uint8)] = np.arange(len(basis), dtype=np.uint8)
+
+
 # parametri sulla linea di comando
-# inputSeqence theta
+# inputSeqence kmerLength [seed]
 
 def main():
     k = 0
-    if (len(sys.argv) == 3):
+    if (len(sys.argv) == 3 or len(sys.argv) == 4):
         inputPath = sys.argv[1]
         k = int(sys.argv[2])
+        seed = int(sys.argv[3]) if len(sys.argv) == 4 else None
     else:
-        print("Errore nei parametri:\nUsage: %s InputSequence kmerLength" % os.path.basename(sys.argv[0]))
+        print("Errore nei parametri:\nUsage: %s InputSequence kmerLength [seed]" % os.path.basename(sys.argv[0]))
         exit(-1)
 
     inputFile = os.path.basename(inputPath)
@@ -35,18 +44,23 @@ def main():
               'Total Distinct left', 'Total Kmers left', 'Total Distinct right', 'Total Kmers right']
     writer.writerow(header)
 
-    for k in range(2,11,1):
-        (totalLeft, hist1) = kmerExtraction(inputPath, k, 0)
-        leftKeys =  np.array(list(hist1.keys()))
+    # il testo viene letto e normalizzato una sola volta, le varianti per ogni theta sono calcolate
+    # sull'array codificato e riusate per tutti i valori di k
+    text = normalizeText(inputPath)
+    rng = np.random.default_rng(seed)
+    mutated = {}
+    for theta in thetaValues:
+        (mutated[theta], subst) = mutateText(text, theta, rng)
+        print(f"{inputFile} theta: {theta} -> {subst:,}/{len(text):,} substitutions")
 
-        for theta in [1, 5, 10, 20, 30, 40, 50, 60, 70, 80, 90, 95]:
-            # inputFile2 = MoveAwaySequence(inputPath, theta)
-            (totalRight, hist2) = kmerExtraction(inputPath, k, theta)
+    for k in range(2,11,1):
+        (totalLeft, leftKeys) = kmerExtraction(text, k)
 
-            # leftKeys =  np.array(list(hist1.keys()))
-            rightKeys =  np.array(list(hist2.keys()))
+        for theta in thetaValues:
+            (totalRight, rightKeys) = kmerExtraction(mutated[theta], k)
 
-            intersection = np.intersect1d( leftKeys, rightKeys)
+            # le chiavi sono ordinate e senza duplicati
+            intersection = np.intersect1d( leftKeys, rightKeys, assume_unique=True)
             A = bothCnt = intersection.size
             B = leftCnt = leftKeys.size - bothCnt
             C = rightCnt = rightKeys.size - bothCnt
@@ -70,20 +84,20 @@ def main():
 
 
 
-def kmerExtraction(inputPath: string, k: int, theta: int):
+# legge il testo e lo normalizza (una riga alla volta, come in precedenza) restituendo
+# l'array dei codici dei simboli in basis
+def normalizeText(inputPath: str):
 
     inputFile = Path(inputPath).name
     print( "*********************************************************")
-    print( "Extracting kmers from sequence: %s for k: %d and theta: %d" % (inputFile, k, theta))
+    print( "Normalizing text: %s" % inputFile)
 
-    count = {}
-    (cnt, subst, totalLen) = (0, 0, 0)
     regex0 = re.compile( '[\r\n]')
     regex1 = re.compile( '[%s]' % re.escape(string.punctuation))
     regex2 = re.compile('\s\s+')
     regex3 = re.compile('[\u0080-\uFFFF]')
 
-    allText = ""
+    lines = []
     with open(inputPath, encoding='latin-1') as inFile:
         for line in inFile:
             # 1) trasforma tutti i caratteri alfanumeri in uppercase
@@ -95,41 +109,45 @@ def kmerExtraction(inputPath: string, k: int, theta: int):
             # 4) rimpiazza più spazi consecutivi in un unico spazio
             l3 = regex2.sub(' ', l2)
             # 5) rimuove i caratteri ascii > 127
-            line = regex3.sub( '', l3)
+            lines.append(regex3.sub( '', l3))
+
+    # e concatena TUTTO l'input in una unica stringa (in tempo lineare)
+    allText = ''.join(lines).encode('ascii')
+    return symbolTable[np.frombuffer(allText, dtype=np.uint8)]
+
+
+
+
+# ogni simbolo viene sostituito con probabilita' theta% da uno degli altri 36 (scelto uniformemente)
+def mutateText(text, theta: int, rng):
+    mask = rng.random(len(text)) < theta / 100.0
+    out = text.copy()
+    shift = rng.integers(1, len(basis), size=int(np.count_nonzero(mask)), dtype=np.uint8)
+    out[mask] = (text[mask] + shift) % len(basis)
+    return (out, int(np.count_nonzero(mask)))
+
 
-            if theta > 0:
-                s = list(line)
-                for i in range(len(line)):
-                    if (random.randrange(100) < theta):
-                        # l'elemento i-esimo viene sostituito
-                        b = s[i]
-                        newBase = b
-                        while( newBase == b):
-                            newBase = random.choice( basis)
-                        s[i] = newBase
-                        subst += 1
-                line = "".join(s)
 
-            # e concatena TUTTO l'input in una unica stringa
-            allText = allText + line
-            cnt += 1
-            # print(i, l3)
-            totalLen += len(line)
 
-    print(f"{inputFile} -> {subst:,}/{totalLen:,} substitutions")
+# codici in base 37 dei k-mer del testo (k <= 12 per stare in un uint64):
+# code[i] = sum(text[i + j] * 37^(k - 1 - j)), calcolato per tutti gli i con k operazioni vettoriali
+def kmerCodes(text, k: int):
+    n = len(text) - k + 1
+    if (n <= 0):
+        return np.zeros(0, dtype=np.uint64)
+    codes = np.zeros(n, dtype=np.uint64)
+    for j in range(k):
+        codes = codes * np.uint64(len(basis)) + text[j:j + n]
+    return codes
 
-    totalLen = len(allText)
-    last = totalLen - k + 1
 
-    for i in range(last):
-        kmer = allText[i:i+k]
-        c = count.get(kmer, 0)
-        count[kmer] = c+1
 
-    # [print(f"{key}: {value}") for key, value in count.items() if (value > 1)]
 
-    print(f"Total Distinct: {len(count.keys()):,} / Total: {last:,} kmers (over {len(basis)**k:,} possible kmers)")
-    return (totalLen, count)
+# k-mer distinti (codici ordinati) del testo codificato e lunghezza del testo
+def kmerExtraction(text, k: int):
+    codes = np.unique(kmerCodes(text, k))
+    print(f"Total Distinct: {len(codes):,} / Total: {max(0, len(text) - k + 1):,} kmers (over {len(basis)**k:,} possible kmers)")
+    return (len(text), codes)
 
 
 
@@ -0,0 +1,106 @@
+#! /usr/local/bin/python3
+
+import os
+import sys
+import numpy as np
+
+#
+# Insiemi di k-mer codificati come interi (2 bit per base, A=0 C=1 G=2 T=3, maiuscole o minuscole):
+# - k <= 32       array ordinato di uint64
+# - 32 < k <= 64  array ordinato di coppie (hi, lo) big endian (pairDtype): hi contiene le prime
+#                 k - 32 basi, lo le ultime 32; l'ordine dei 16 byte (V16) e' quello numerico a 128 bit
+# L'intersezione di due insiemi ordinati e' un merge lineare: la concatenazione di due sequenze
+# ordinate e' ordinata con timsort (kind='stable'), che riconosce le due run e le fonde in O(n).
+#
+# Usage: kmerSets.py k histogram1 histogram2    (dump di kmc: kmer cnt per riga)
+#
+
+maxK = 64
+pairDtype = np.dtype([('hi', '>u8'), ('lo', '>u8')])
+
+baseCodes = np.full(256, 255, dtype=np.uint8)
+for (i, b) in enumerate(b'ACGT'):
+    baseCodes[b] = i
+    baseCodes[b + 32] = i
+
+
+def emptySet(k: int):
+    return np.zeros(0, dtype=np.uint64 if k <= 32 else pairDtype)
+
+
+# schema di Horner sulle colonne (basi) di una matrice n x l (l <= 32) di codici a 2 bit
+def hornerCodes(bases):
+    codes = np.zeros(bases.shape[0], dtype=np.uint64)
+    for j in range(bases.shape[1]):
+        codes <<= np.uint64(2)
+        codes |= bases[:, j]
+    return codes
+
+
+# codici dei k-mer (array di bytes di lunghezza k): uint64 per k <= 32, pairDtype per k <= 64
+def encodeKmers(kmers, k: int):
+    if (k < 1 or k > maxK):
+        raise ValueError("k = %d out of range 1 .. %d" % (k, maxK))
+    if (len(kmers) == 0):
+        return emptySet(k)
+    if (kmers.dtype.itemsize != k):
+        raise ValueError("k-mers of length %d, expected %d" % (kmers.dtype.itemsize, k))
+    bases = baseCodes[np.frombuffer(kmers.tobytes(), dtype=np.uint8).reshape(-1, k)]
+    if (np.any(bases > 3)):
+        raise ValueError("k-mers with symbols other than ACGT")
+    if (k <= 32):
+        return hornerCodes(bases)
+    codes = np.empty(len(kmers), dtype=pairDtype)
+    codes['hi'] = hornerCodes(bases[:, :k - 32])
+    codes['lo'] = hornerCodes(bases[:, k - 32:])
+    return codes
+
+
+def mergeKeys(codes):
+    return codes if codes.dtype == np.uint64 else codes.view('V16')
+
+
+# insieme ordinato (senza ripetizioni) dei codici
+def kmerSet(codes):
+    if (codes.dtype == np.uint64):
+        return np.unique(codes)
+    return np.unique(codes.view('V16')).view(pairDtype)
+
+
+# insieme dei k-mer di un dump di kmc (kmer cnt per riga), costruito una sola volta per sequenza e k
+def loadKmerSet(histFile: str, k: int):
+    print("Loading from file %s" % histFile)
+    with open(histFile, 'rb') as inFile:
+        tokens = inFile.read().split()
+    if (len(tokens) % 2 != 0):
+        raise ValueError("%s: Malformed histogram file (%d token)" % (histFile, len(tokens)))
+    if (len(tokens) == 0):
+        return emptySet(k)
+    return kmerSet(encodeKmers(np.array(tokens[0::2]), k))
+
+
+# |a & b| per due insiemi ordinati dello stesso tipo (merge lineare)
+def intersectionSize(a, b):
+    if (len(a) == 0 or len(b) == 0):
+        return 0
+    merged = np.sort(np.concatenate((mergeKeys(a), mergeKeys(b))), kind='stable')
+    return int(np.count_nonzero(merged[1:] == merged[:-1]))
+
+
+
+
+def main():
+    if (len(sys.argv) != 4):
+        print("Usage: %s k histogram1 histogram2" % os.path.basename(sys.argv[0]))
+        exit(-1)
+
+    k = int(sys.argv[1])
+    left = loadKmerSet(sys.argv[2], k)
+    right = loadKmerSet(sys.argv[3], k)
+    A = intersectionSize(left, right)
+    print("left: %d, right: %d, A: %d, B: %d, C: %d" % (left.size, right.size, A, left.size - A, right.size - A))
+
+
+
+if __name__ == "__main__":
+    main()
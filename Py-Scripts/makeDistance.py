@@ -3,8 +3,11 @@
 import re
 import os
 import sys
-import random
+import numpy as np
 from pathlib import Path
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import compressedFasta as cf
 
 
 
@@ -13,78 +16,271 @@ others = {'A' : ['C', 'G', 'T'], 'C' : ['A', 'G', 'T'], 'G':  ['A', 'C', 'T'], '
 
 ext = '.fna'
 
+chunkSize = 16 * 1024 * 1024    # byte letti per blocco (esteso fino a fine riga)
+
+# substTable[c, j] = j-esima delle altre 3 basi di c (in maiuscolo, come nella versione per carattere)
+substTable = np.repeat(np.arange(256, dtype=np.uint8), 3).reshape(256, 3)
+for b, o in others.items():
+    substTable[ord(b)] = np.frombuffer(''.join(o).encode(), dtype=np.uint8)
+    substTable[ord(b.lower())] = substTable[ord(b)]
+
+
 # parametri sulla linea di comando
-# inputSeqence theta
+# inputSeqence theta[,theta...] [seed [workers]]
 def ModifySequence():
 
-    if (len(sys.argv) == 3):
+    if (len(sys.argv) >= 3 and len(sys.argv) <= 5):
         inputFile = sys.argv[1]
-        theta = int(sys.argv[2])
-        baseName, ext = os.path.splitext( inputFile)
-        outFile = "%s-%02d%s" % (baseName, theta, ext)
-        MoveAwaySequence(inputFile, outFile, theta)
+        thetas = [int(t) for t in sys.argv[2].split(',')]
+        seed = int(sys.argv[3]) if len(sys.argv) >= 4 else None
+        workers = int(sys.argv[4]) if len(sys.argv) == 5 else 1
+        baseName, ext = cf.splitExt( inputFile)
+        outFiles = ["%s-%02d%s" % (baseName, theta, ext) for theta in thetas]
+        MoveAwaySequences(inputFile, outFiles, [theta / 100.0 for theta in thetas], seed, workers)
     else:
-        print("Errore nei parametri:\nUsage: %s InputSequence thetaProbability" % os.path.basename(sys.argv[0]))
+        print("Errore nei parametri:\nUsage: %s InputSequence thetaPercent[,thetaPercent...] [seed [workers]]" % os.path.basename(sys.argv[0]))
         exit(-1)
 
 
-def MoveAwaySequence(inputFile, outFile, theta):
+# theta e' la probabilita' di sostituzione di ogni base (0.05 => 5%)
+def MoveAwaySequence(inputFile, outFile, theta, seed = None, workers = 1):
+    MoveAwaySequences(inputFile, [outFile], [theta], seed, workers)
 
-    if (os.path.exists(outFile)):
-        print("Output File: %s already exists. Exiting." % outFile)
+
+# produce con una sola lettura di inputFile una sequenza per ogni valore di theta.
+# Le varianti sono accoppiate: una base sostituita per un theta e' sostituita (con la stessa base)
+# anche per tutti i theta maggiori
+def MoveAwaySequences(inputFile, outFiles, thetas, seed = None, workers = 1):
+
+    todo = [ i for i in range(len(outFiles)) if not os.path.exists(outFiles[i])]
+    for i in range(len(outFiles)):
+        if (i not in todo):
+            print("Output File: %s already exists. Skipping." % outFiles[i])
+    if (len(todo) == 0):
         return
 
     print( "*********************************************************")
-    print( "Creating sequence: %s from sequence: %s theta: %d" % (Path(outFile).stem, Path(inputFile).stem, theta))
+    for i in todo:
+        print( "Creating sequence: %s from sequence: %s theta: %.3f" % (Path(outFiles[i]).stem, Path(inputFile).stem, thetas[i]))
     print( "*********************************************************")
 
-    (written, subst, totLen) = (0, 0, 0)
-    newBase = ''
-    out = []
-    with open(outFile, "w") as outText:
-        with open(inputFile) as inFile:
-            for line in inFile:
-                if (line.startswith(">")):
-                    out = line.rstrip() + ' theta = %d%%\n' % theta
-                else:
-                    s = list(line)
-                    for i in range(len(line)):
-                        if (random.randrange(100) < theta):
-                            # l'elemento i-esimo viene sostituito
-                            b = s[i].upper()
-                            w = random.randrange(3)
-                            if (b == 'A'):
-                                newBase = ['C', 'G', 'T'][w]
-                            elif (b == 'C'):
-                                newBase = ['A', 'G', 'T'][w]
-                            elif (b == 'G'):
-                                newBase = ['A', 'C', 'T'][w]
-                            elif (b == 'T'):
-                                newBase = ['A', 'C', 'G'][w]
-                            else:
-                                # altri caratteri 'N' o fine linea
-                                newBase = b
-
-                            # print( "%d: %s->%s" % (i, s[i], newBase), end=" - ")
-                            s[i] = newBase
-                            subst += 1
-
-                        if (i > 0 and i % 1048576 == 0):
-                            written += 1
-                            sys.stdout.write('.')
-                            sys.stdout.flush()
-                            
-                    out = "".join(s)
-                    totLen += len(line) - 1
-
-                outText.write(out) # \n are in the original strings
-                m = totLen // 1048576
-                if (m > written):
-                    written = m
-                    sys.stdout.write('.')
-                    sys.stdout.flush()
-
-    print("\n%s -> %d/%d substitutions" % (outFile, subst, totLen))
+    results = MutateFastaMulti(inputFile, [outFiles[i] for i in todo], [thetas[i] for i in todo],
+                               [' theta = %g%%' % (thetas[i] * 100) for i in todo], seed, workers = workers)
+
+    print('')
+    for (i, (subst, totLen)) in zip(todo, results):
+        print("%s -> %d/%d substitutions" % (outFiles[i], subst, totLen))
+
+
+# Copia inputFile in outFile sostituendo ogni base (tra quelle in bases) con probabilita' theta
+# con una delle altre 3 scelta uniformemente. Ritorna (sostituzioni, numero di caratteri delle sequenze)
+def MutateFasta(inputFile, outFile, theta, headerSuffix = '', seed = None, bases = b'ACGTacgt', workers = 1):
+    return MutateFastaMulti(inputFile, [outFile], [theta], [headerSuffix], seed, bases, workers)[0]
+
+
+# confini dei blocchi: ogni blocco inizia ad inizio riga e termina con il primo fine riga
+# dal byte chunkSize in poi. I confini non dipendono dal numero di worker
+def chunkBoundaries(inputFile):
+    size = os.path.getsize(inputFile)
+    bounds = [0]
+    with open(inputFile, "rb") as inFile:
+        while (bounds[-1] < size):
+            inFile.seek(bounds[-1] + chunkSize - 1)
+            inFile.readline()
+            bounds.append(min(inFile.tell(), size))
+    return bounds
+
+
+# blocchi di un file compresso (gzip o BGZF) letti in sequenza: stessi confini di chunkBoundaries
+# sul contenuto decompresso (i primi chunkSize - 1 byte piu' il resto della riga)
+def streamChunks(inputFile):
+    with cf.openFasta(inputFile) as inFile:
+        while True:
+            chunk = inFile.read(chunkSize - 1)
+            if (not chunk):
+                return
+            yield chunk + inFile.readline()
+
+
+# come map ma con al piu' 2 * workers task in corso: i task sono prodotti in modo lazy
+# e al piu' 2 * workers risultati sono in memoria in attesa di essere consumati
+def boundedMap(fn, tasks, workers):
+    if (workers <= 1):
+        yield from map(fn, tasks)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for task in tasks:
+            pending.append(executor.submit(fn, task))
+            if (len(pending) >= 2 * workers):
+                yield pending.popleft().result()
+        while (pending):
+            yield pending.popleft().result()
+
+
+def readChunk(inputFile, start, end):
+    with open(inputFile, "rb") as inFile:
+        inFile.seek(start)
+        return inFile.read(end - start)
+
+
+# numero di header nel blocco (che inizia ad inizio riga)
+def countHeaders(task):
+    (inputFile, start, end) = task
+    chunk = readChunk(inputFile, start, end)
+    return len(re.findall(rb'^>', chunk, re.M))
+
+
+# Muta un blocco (che inizia ad inizio riga) per ogni valore di theta e ritorna
+# ([blocchi mutati con i suffissi degli header], sostituzioni per theta, numero di caratteri delle sequenze).
+# Il generatore del blocco dipende solo dal seed e dall'indice del blocco: l'output e' identico
+# per qualunque numero di worker. Per ogni posizione si estraggono una variabile uniforme u e la
+# scelta della base sostitutiva: la base e' sostituita in tutte le varianti con theta > u
+def mutateBlock(chunk, index, entropy, thetas, suffixes, bases):
+    rng = np.random.default_rng(np.random.SeedSequence(entropy, spawn_key=(index,)))
+    isBase = np.zeros(256, dtype=bool)
+    isBase[np.frombuffer(bases, dtype=np.uint8)] = True
+
+    src = np.frombuffer(chunk, dtype=np.uint8)
+    u = rng.random(len(src), dtype=np.float32)
+    choice = rng.integers(0, 3, size=len(src), dtype=np.uint8)
+    mask = isBase[src] & (u < max(thetas))
+    totLen = len(src) - int(np.count_nonzero((src == ord('\n')) | (src == ord('\r'))))
+    headers = [ (m.start(), m.end()) for m in re.finditer(rb'^>.*$', chunk, re.M)]
+    for (hs, he) in headers:
+        mask[hs:he] = False
+        totLen -= he - hs
+
+    idx = np.flatnonzero(mask)
+    newBases = substTable[src[idx], choice[idx]]
+    uIdx = u[idx]
+
+    blocks = []
+    subst = []
+    for i in range(len(thetas)):
+        sel = uIdx < thetas[i]
+        buf = src.copy()
+        buf[idx[sel]] = newBases[sel]
+        subst.append(int(np.count_nonzero(sel)))
+
+        # header con il suffisso aggiunto prima del fine riga
+        parts = []
+        pos = 0
+        for (hs, he) in headers:
+            parts.append(buf[pos:he].tobytes())
+            parts.append(suffixes[i])
+            pos = he
+        parts.append(buf[pos:].tobytes())
+        blocks.append(b''.join(parts))
+
+    return (blocks, subst, totLen)
+
+
+# Muta un blocco e lo scrive con pwrite in ogni file di output all'offset precalcolato
+def mutateChunk(task):
+    (inputFile, start, end, index, entropy, outFiles, offsets, thetas, suffixes, bases) = task
+    (blocks, subst, totLen) = mutateBlock(readChunk(inputFile, start, end), index, entropy, thetas, suffixes, bases)
+
+    for i in range(len(outFiles)):
+        fd = os.open(outFiles[i], os.O_WRONLY)
+        try:
+            os.pwrite(fd, blocks[i], offsets[i])
+        finally:
+            os.close(fd)
+
+    return (subst, totLen)
+
+
+def mutatedChunk(task):
+    (inputFile, start, end, index, entropy, theta, suffix, bases) = task
+    return mutateBlock(readChunk(inputFile, start, end), index, entropy, [theta], [suffix], bases)[0][0]
+
+
+# blocco gia' letto (input compresso)
+def mutateBlockTask(task):
+    return mutateBlock(*task)
+
+
+# Sequenza allontanata "virtuale": restituisce in ordine i blocchi della sequenza che MutateFasta
+# scriverebbe in outFile (stessi blocchi, stesso generatore) senza scriverla sul disco.
+# Con lo stesso seed ogni iterazione produce la stessa sequenza; al piu' 2 * workers blocchi
+# mutati sono in memoria in attesa di essere consumati
+def MutatedStream(inputFile, theta, seed, headerSuffix = '', bases = b'ACGTacgt', workers = 1):
+    entropy = np.random.SeedSequence(seed).entropy
+    if (cf.isCompressed(inputFile)):
+        tasks = ( (chunk, c, entropy, [theta], [headerSuffix.encode()], bases) for (c, chunk) in enumerate(streamChunks(inputFile)))
+        for (blocks, subst, totLen) in boundedMap(mutateBlockTask, tasks, workers):
+            yield blocks[0]
+        return
+
+    bounds = chunkBoundaries(inputFile)
+    tasks = ( (inputFile, bounds[c], bounds[c + 1], c, entropy, theta, headerSuffix.encode(), bases)
+              for c in range(len(bounds) - 1))
+    yield from boundedMap(mutatedChunk, tasks, workers)
+
+
+# input compresso: i blocchi sono decompressi in sequenza, mutati da workers processi e
+# scritti in ordine (senza pwrite, la dimensione dei file di output non e' nota in anticipo)
+def mutateCompressedMulti(inputFile, outFiles, thetas, suffixes, entropy, bases, workers):
+    outs = [ open(f, "wb") for f in outFiles]
+    subst = [0] * len(thetas)
+    totLen = 0
+    try:
+        tasks = ( (chunk, c, entropy, thetas, suffixes, bases) for (c, chunk) in enumerate(streamChunks(inputFile)))
+        for (blocks, s, t) in boundedMap(mutateBlockTask, tasks, workers):
+            for (out, block) in zip(outs, blocks):
+                out.write(block)
+            subst = [ a + b for (a, b) in zip(subst, s)]
+            totLen += t
+            sys.stdout.write('.')
+            sys.stdout.flush()
+    finally:
+        for out in outs:
+            out.close()
+
+    return [ (subst[i], totLen) for i in range(len(thetas))]
+
+
+# Il file (non compresso) viene diviso in blocchi (chunkBoundaries) elaborati da workers processi. Per ogni
+# variante il file di output e' preallocato e ogni blocco e' scritto al proprio offset, spostato
+# della lunghezza dei suffissi aggiunti agli header (headerSuffixes[i]) che lo precedono.
+# Layout delle righe, header e caratteri diversi dalle basi restano invariati.
+# Ritorna per ogni variante (sostituzioni, numero di caratteri delle sequenze)
+def MutateFastaMulti(inputFile, outFiles, thetas, headerSuffixes, seed = None, bases = b'ACGTacgt', workers = 1):
+    entropy = np.random.SeedSequence(seed).entropy
+    suffixes = [ h.encode() for h in headerSuffixes]
+    if (cf.isCompressed(inputFile)):
+        return mutateCompressedMulti(inputFile, outFiles, thetas, suffixes, entropy, bases, workers)
+
+    bounds = chunkBoundaries(inputFile)
+    ranges = [ (inputFile, bounds[c], bounds[c + 1]) for c in range(len(bounds) - 1)]
+
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    mapper = executor.map if executor is not None else map
+    try:
+        headersBefore = [0]
+        for n in mapper(countHeaders, ranges):
+            headersBefore.append(headersBefore[-1] + n)
+
+        for i in range(len(outFiles)):
+            with open(outFiles[i], "wb") as f:
+                f.truncate(bounds[-1] + headersBefore[-1] * len(suffixes[i]))
+
+        tasks = [ (inputFile, start, end, c, entropy, outFiles,
+                   [ start + headersBefore[c] * len(sfx) for sfx in suffixes], thetas, suffixes, bases)
+                  for (c, (_, start, end)) in enumerate(ranges)]
+        subst = [0] * len(thetas)
+        totLen = 0
+        for (s, t) in mapper(mutateChunk, tasks):
+            subst = [ a + b for (a, b) in zip(subst, s)]
+            totLen += t
+            sys.stdout.write('.')
+            sys.stdout.flush()
+    finally:
+        if (executor is not None):
+            executor.shutdown()
+
+    return [ (subst[i], totLen) for i in range(len(thetas))]
 
 
 
@@ -1,86 +1,170 @@
-#! /usr/bin/python
+#! /usr/local/bin/python3
 
-import re
 import os
 import sys
+import heapq
 import shutil
-
-rootDir = sys.argv[1] if (len(sys.argv) > 1) else '/Users/pipp8/Universita/Src/IdeaProjects/power_statistics/data/results/dataset5-1000'
+import tempfile
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+
+#
+# Fonde i risultati di Mash (mash/k=K/file.csv: seqA,seqB,misura) con quelli di FADE (k=K/file.csv)
+# con un merge join in streaming sulla chiave (seqA, seqB): ogni input e' letto in ordine di chiave
+# (se non e' gia' ordinato viene ordinato esternamente a run di runRows righe fuse con heapq.merge),
+# quindi la memoria usata e' limitata. Le directory k=K sono elaborate in parallelo. Le chiavi
+# presenti in uno solo dei due file sono riportate nella tabella merge/missing.csv.
+#
+# Usage: mergeCSV.py [rootDir [workers]]
+#
+
+rootDir = '/Users/pipp8/Universita/Src/IdeaProjects/power_statistics/data/results/dataset5-1000'
 
 mashDir = 'mash'
 mergeDir = 'merge'
+missingFile = 'missing.csv'
 kValues = [ 4, 6, 8, 10]
+expectedRows = 1000
+runRows = 1000000
+
+
+def lineKey(line: str):
+    ll = line.split(',', 2)
+    return (ll[0], ll[1])
+
+
+# righe del file (senza header) come (chiave, riga): una run ordinata in memoria o il merge
+# delle run ordinate salvate in tempDir
+def sortedLines(inputFile: str, tempDir: str):
+    with open(inputFile) as inFile:
+        header = inFile.readline().rstrip('\n')
+        prev = None
+        inOrder = True
+        for line in inFile:
+            key = lineKey(line)
+            if (prev is not None and key < prev):
+                inOrder = False
+                break
+            prev = key
+
+    if (inOrder):
+        return (header, fileLines(inputFile))
+
+    runs = []
+    with open(inputFile) as inFile:
+        inFile.readline()
+        while True:
+            run = sorted(((lineKey(l), l.rstrip('\n')) for l in islice(inFile, runRows)), key=lambda r: r[0])
+            if (len(run) == 0):
+                break
+            runFile = tempfile.NamedTemporaryFile('w', dir=tempDir, suffix='.run', delete=False)
+            with runFile:
+                runFile.writelines(line + '\n' for (key, line) in run)
+            runs.append(runFile.name)
+
+    return (header, heapq.merge(*[ fileLines(r, False) for r in runs], key=lambda r: r[0]))
+
+
+def fileLines(inputFile: str, skipHeader: bool = True):
+    with open(inputFile) as inFile:
+        if (skipHeader):
+            inFile.readline()
+        for line in inFile:
+            yield (lineKey(line), line.rstrip('\n'))
+
+
+# merge join di un file di mash con il corrispondente file di FADE: ritorna (righe, chiavi mancanti)
+def mergeFiles(mashFile: str, otherFile: str, mergeFile: str, tempDir: str):
+    (mashHdr, mash) = sortedLines(mashFile, tempDir)
+    (measuresHdr, other) = sortedLines(otherFile, tempDir)
+    measureName = mashHdr.split(',')[2].rstrip()
+
+    missing = []
+    cnt = 0
+    m = next(mash, None)
+    o = next(other, None)
+    with open(mergeFile, "w") as outFileCSV:
+        outFileCSV.write("%s,%s\n" % (measuresHdr, measureName))
+        while (m is not None or o is not None):
+            if (o is not None and (m is None or o[0] < m[0])):
+                missing.append(o[0] + (mashDir,))
+                o = next(other, None)
+            elif (o is None or m[0] < o[0]):
+                missing.append(m[0] + ('fade',))
+                m = next(mash, None)
+            else:
+                outFileCSV.write("%s,%s\n" % (o[1], m[1].split(',')[2].rstrip()))
+                cnt += 1
+                m = next(mash, None)
+                o = next(other, None)
+    return (cnt, missing)
+
+
+# tutti i file di una directory k=K: ritorna le righe della tabella dei mancanti
+def mergeK(k: int):
+    mashPath = "%s/%s/k=%d" %( rootDir, mashDir, k)
+    if (not os.path.isdir(mashPath)):
+        print("No Mash results for k = %d (%s)" % (k, mashPath))
+        return (0, [])
+
+    mergePath = '%s/%s/k=%d' % ( rootDir, mergeDir, k)
+    # cancella la directory destinazione
+    if os.path.exists(mergePath):
+        shutil.rmtree(mergePath)
+    os.makedirs(mergePath)
+
+    missing = []
+    fileCnt = 0
+    tempDir = tempfile.mkdtemp(dir=mergePath)
+    try:
+        for f in sorted(os.listdir( mashPath)):
+            if (not f.endswith(".csv")):
+                continue
+            file = '%s/%s' % (mashPath, f)
+            otherPath = "%s/k=%d/%s" %( rootDir, k, f)
+            print("Processing: %s" % file)
+            fileCnt = fileCnt + 1
+            if (not os.path.exists(otherPath)):
+                missing.append((k, f, '*', '*', 'fade'))
+                continue
 
-mash = dict()  # dizionario vuoto
-other = dict()
+            (cnt, keys) = mergeFiles(file, otherPath, '%s/%s' % (mergePath, f), tempDir)
+            missing += [ (k, f) + key for key in keys]
+            if (cnt != expectedRows):
+                print("Only %d results merged for file %s" % (cnt, file))
+    finally:
+        shutil.rmtree(tempDir)
+    return (fileCnt, missing)
 
 
-def main():
-    global mashDir, mergeDir, rootDir, kValues
 
-    fileCnt = 0
-    for k in kValues:
-        # cancella la directory destinazione
-        mergePath = '%s/%s/k=%d' % ( rootDir, mergeDir, k)
-        if os.path.exists(mergePath):
-            shutil.rmtree(mergePath)
-
-        os.mkdir(mergePath)
-
-        mashPath = "%s/%s/k=%d" %( rootDir, mashDir, k)
-        for f in os.listdir( mashPath):
-            if (f.endswith(".csv")):
-                file = '%s/%s' % (mashPath, f)
-                print("Processing: %s" % file)
-                fileCnt = fileCnt + 1
-            else:
-                continue
 
-            mash = dict()
-            cnt = 0
-            # carica il file risultati (mash) da fondere
-            with open(file) as inFile:
-                for line in inFile:
-                    cnt = cnt + 1
-                    ll = line.split(',')
-                    if (cnt == 1):
-                        measureName = ll[2].rstrip()
-                    else:
-                        key = "%s,%s" % (ll[0], ll[1])
-                        mash[ key] = ll[2].rstrip()
-
-            if (cnt != 1001):
-                print("Only %d results processed from file %s" % (cnt, file))
-            
-            otherPath = "%s/k=%d/%s" %( rootDir, k, f)
-            other = dict()
-            cnt = 0
-            with open(otherPath) as inFile:
-                for line in inFile:
-                    cnt = cnt + 1
-                    ll = line.split(',')
-                    if (cnt == 1):
-                        measuresHdr = line.rstrip()
-                    else:
-                        key = "%s,%s" % (ll[0], ll[1])
-                        other[ key] = line.rstrip() # riuove il newline alla fine
-
-            if (cnt != 1001):
-                print("Only %d results processed from file %s" % (cnt, otherPath))
-
-            # salva il file merged
-            mergePath = '%s/%s/k=%d/%s' % ( rootDir, mergeDir, k, f)
-            with open(mergePath, "w") as outFileCSV:
-                outFileCSV.write("%s,%s\n" % (measuresHdr, measureName))
-                for key in sorted(other.keys()):
-                    if (mash.has_key(key)):
-                        outFileCSV.write("%s,%s\n" % (other[key], mash[key]))
-                    else:
-                        print("chiave %s: mancante nel file %s" % (key, f))
-                        sys.exit("file mash incompleto")
-
-    print("Processed %d file" % fileCnt);
+def setRootDir(d: str):
+    global rootDir
+    rootDir = d
+
 
+def main():
+    global rootDir
+
+    if (len(sys.argv) > 1):
+        rootDir = sys.argv[1]
+    workers = int(sys.argv[2]) if (len(sys.argv) > 2) else len(kValues)
+
+    fileCnt = 0
+    missing = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=setRootDir, initargs=(rootDir,)) as executor:
+        for (cnt, m) in executor.map(mergeK, kValues):
+            fileCnt += cnt
+            missing += m
+
+    missingPath = '%s/%s/%s' % (rootDir, mergeDir, missingFile)
+    os.makedirs(os.path.dirname(missingPath), exist_ok=True)
+    with open(missingPath, "w") as out:
+        out.write("k,file,seqA,seqB,missingIn\n")
+        out.writelines("%s\n" % ','.join(map(str, row)) for row in missing)
+
+    print("Processed %d file, %d missing keys (%s)" % (fileCnt, len(missing), missingPath))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,181 @@
+#! /usr/local/bin/python3
+
+import os
+import sys
+import numpy as np
+
+#
+# Generatore in memoria delle coppie di sequenze sintetiche (come DatasetBuilder.scala):
+# - NM       null model: due sequenze i.i.d. con distribuzione delle basi distribution
+# - NM-T1    un secondo null model indipendente (per il controllo dell'errore di tipo 1)
+# - PT       pattern transfer PT(l, gamma): partendo dalla coppia NM, con probabilita' gamma per posizione
+#            un pattern di l basi di A viene copiato nella stessa posizione di B (senza sovrapposizioni)
+# - MR       motif replace MR(d, l, gamma): con probabilita' gamma per posizione uno dei d motivi di
+#            lunghezza l viene impiantato nella stessa posizione di A e di B (senza sovrapposizioni)
+#
+# Le sequenze sono array numpy di byte (b'ACGT'). Ogni coppia usa un proprio generatore
+# (SeedSequence(seed, spawn_key=(modello, coppia, ...))): PT e MR partono dalla stessa coppia NM per ogni
+# gamma e il risultato non dipende dall'ordine (o dal sottoinsieme) delle coppie generate.
+#
+# Usage: pairGenerator.py model seqLen nPairs [gamma [seed]]
+#        scrive nella directory corrente il dataset model-nPairs.seqLen[.G=gamma].fasta (formato DatasetBuilder)
+#
+
+uniformDist = [0.25, 0.25, 0.25, 0.25]     # P(A), P(C), P(G), P(T)
+gammaValues = [0.001, 0.005, 0.01, 0.05, 0.1]
+patternLen = 5
+motif = 'ACCCG'
+nullModelPrefix = 'Uniform'
+type1Suffix = '-T1'
+altMotifPrefix = 'MotifRepl'
+altPatTransfPrefix = 'PatTransf'
+
+bases = np.frombuffer(b'ACGT', dtype=np.uint8)
+
+NM, T1, PT, MR = range(4)
+modelIds = { 'NM': NM, 'T1': T1, 'PT': PT, 'MR': MR }
+
+
+def pairRng(entropy, model: int, seqId: int, gamma: float = 0.0):
+    return np.random.default_rng(np.random.SeedSequence(entropy, spawn_key=(model, seqId, int(round(gamma * 1000000)))))
+
+
+# sequenza i.i.d. di seqLen basi con la distribuzione data
+def nullModelSequence(rng, seqLen: int, distribution = uniformDist):
+    cdf = np.cumsum(distribution) / np.sum(distribution)
+    return bases[np.searchsorted(cdf, rng.random(seqLen), side='right').clip(0, 3)]
+
+
+# posizioni iniziali degli impianti: ad ogni posizione c < seqLen - l un impianto con probabilita' gamma,
+# dopo un impianto si riparte da c + l. I tentativi falliti tra due impianti sono geometrici
+def implantPositions(rng, seqLen: int, l: int, gamma: float):
+    last = seqLen - l
+    if (gamma <= 0 or last <= 0):
+        return np.zeros(0, dtype=np.int64)
+    starts = []
+    pos = 0
+    while (pos < last):
+        n = max(16, int((last - pos) * gamma / (1 + gamma * l) * 1.1) + 16)
+        gaps = rng.geometric(gamma, size=n) - 1
+        s = pos + np.cumsum(gaps + l) - l
+        starts.append(s[s < last])
+        pos = int(s[-1]) + l
+    return np.concatenate(starts)
+
+
+def implantIndexes(starts, l: int):
+    return (starts[:, None] + np.arange(l)).ravel()
+
+
+# PT(l, gamma): copia in seqB i pattern di seqA nelle posizioni estratte
+def patternTransfer(rng, seqA, seqB, l: int, gamma: float):
+    seqB = seqB.copy()
+    idx = implantIndexes(implantPositions(rng, len(seqB), l, gamma), l)
+    seqB[idx] = seqA[idx]
+    return (seqA, seqB)
+
+
+# numero di motivi usati: max(1, seqLen / 25000) come nel dataset di Reinert, limitato dai motivi disponibili
+def motifCount(seqLen: int, motifs: str, l: int, d: int = None):
+    if (d is None):
+        d = max(1, seqLen // 25000)
+    return max(1, min(d, len(motifs) // l))
+
+
+# MR(d, l, gamma): impianta in entrambe le sequenze uno dei d motivi (sottostringhe consecutive di motifs)
+def motifReplace(rng, seqA, seqB, motifs: str, l: int, gamma: float, d: int = None):
+    (seqA, seqB) = (seqA.copy(), seqB.copy())
+    d = motifCount(len(seqA), motifs, l, d)
+    table = np.frombuffer(motifs[:d * l].encode(), dtype=np.uint8).reshape(d, l)
+    starts = implantPositions(rng, len(seqA), l, gamma)
+    implants = table[rng.integers(0, d, size=len(starts))].ravel()
+    idx = implantIndexes(starts, l)
+    seqA[idx] = implants
+    seqB[idx] = implants
+    return (seqA, seqB)
+
+
+def nullModelPair(entropy, seqId: int, seqLen: int, distribution = uniformDist, model: int = NM):
+    rng = pairRng(entropy, model, seqId)
+    return (nullModelSequence(rng, seqLen, distribution), nullModelSequence(rng, seqLen, distribution))
+
+
+# nome del dataset come in DatasetBuilder: Uniform, Uniform-T1, MotifRepl-U, PatTransf-U
+def modelName(model: int, prefix: str = nullModelPrefix):
+    if (model == NM):
+        return prefix
+    elif (model == T1):
+        return prefix + type1Suffix
+    sfx = prefix[4:6] if prefix.startswith('rnd_') else prefix[0] if prefix[0] == 'U' else prefix[0:2]
+    return '%s-%s' % (altMotifPrefix if model == MR else altPatTransfPrefix, sfx)
+
+
+# header come getSequenceHeader di DatasetBuilder: prefix.00001[.G=010]-A
+def sequenceHeader(name: str, seqId: int, gamma: float, pairId: str):
+    pg = '.G=' + ('%.3f' % gamma)[2:] if gamma > 0 else ''
+    return '%s.%05d%s-%s' % (name, seqId, pg, pairId)
+
+
+# Genera le coppie (name, seqId, gamma, seqA, seqB) con seqId = 1 .. nPairs per il modello dato
+# (NM, T1, PT o MR). seed = None => seed casuale (stampato per poter ripetere l'esperimento)
+def generatePairs(model: int, seqLen: int, nPairs: int, gamma: float = 0.0, seed = None,
+                  l: int = patternLen, motifs: str = motif, d: int = None,
+                  distribution = uniformDist, prefix: str = nullModelPrefix):
+    entropy = np.random.SeedSequence(seed).entropy
+    if (seed is None):
+        print("****** pairGenerator seed = %d ******" % entropy)
+    name = modelName(model, prefix)
+    for seqId in range(1, nPairs + 1):
+        if (model == T1):
+            (seqA, seqB) = nullModelPair(entropy, seqId, seqLen, distribution, T1)
+        else:
+            (seqA, seqB) = nullModelPair(entropy, seqId, seqLen, distribution)
+            rng = pairRng(entropy, model, seqId, gamma)
+            if (model == PT):
+                (seqA, seqB) = patternTransfer(rng, seqA, seqB, l, gamma)
+            elif (model == MR):
+                (seqA, seqB) = motifReplace(rng, seqA, seqB, motifs, l, gamma, d)
+        yield (name, seqId, gamma if model in (PT, MR) else 0.0, seqA, seqB)
+
+
+# tutti i modelli di un esperimento di potenza per una lunghezza: NM, T1 e per ogni gamma MR e PT
+def generateDataset(seqLen: int, nPairs: int, gammas = gammaValues, seed = None, **kwargs):
+    entropy = np.random.SeedSequence(seed).entropy
+    if (seed is None):
+        print("****** pairGenerator seed = %d ******" % entropy)
+    yield from generatePairs(NM, seqLen, nPairs, 0.0, entropy, **kwargs)
+    yield from generatePairs(T1, seqLen, nPairs, 0.0, entropy, **kwargs)
+    for g in gammas:
+        yield from generatePairs(MR, seqLen, nPairs, g, entropy, **kwargs)
+        yield from generatePairs(PT, seqLen, nPairs, g, entropy, **kwargs)
+
+
+def fastaPair(name: str, seqId: int, gamma: float, seqA, seqB):
+    return b''.join([ b'>', sequenceHeader(name, seqId, gamma, 'A').encode(), b'\n', seqA.tobytes(), b'\n',
+                      b'>', sequenceHeader(name, seqId, gamma, 'B').encode(), b'\n', seqB.tobytes(), b'\n'])
+
+
+
+
+def main():
+    if (len(sys.argv) < 4 or len(sys.argv) > 6 or sys.argv[1] not in modelIds):
+        print("Usage: %s NM|T1|PT|MR seqLen nPairs [gamma [seed]]" % os.path.basename(sys.argv[0]))
+        exit(-1)
+
+    model = modelIds[sys.argv[1]]
+    seqLen = int(sys.argv[2])
+    nPairs = int(sys.argv[3])
+    gamma = float(sys.argv[4]) if len(sys.argv) >= 5 else 0.0
+    seed = int(sys.argv[5]) if len(sys.argv) == 6 else None
+
+    pg = '.G=%.3f' % gamma if model in (PT, MR) else ''
+    outFile = '%s-%04d.%d%s.fasta' % (modelName(model), nPairs, seqLen, pg)
+    with open(outFile, 'wb') as f:
+        for pair in generatePairs(model, seqLen, nPairs, gamma, seed):
+            f.write(fastaPair(*pair))
+    print("%s: %d pairs written" % (outFile, nPairs))
+
+
+
+if __name__ == "__main__":
+    main()
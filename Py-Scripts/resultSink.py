@@ -0,0 +1,168 @@
+#! /usr/local/bin/python3
+
+import os
+import sys
+import csv
+import glob
+import time
+import socket
+
+#
+# Risultati CSV scritti da piu' processi concorrenti senza lock: ogni processo scrive nel proprio
+# shard (outFile.shards/host-pid-time.csv) a blocchi di batchSize righe (write + fsync, il file e'
+# riaperto in append ad ogni blocco) e un passo di merge, eseguito quando i processi sono terminati,
+# aggiunge le righe di tutti gli shard a outFile (scritto in un file temporaneo e poi rinominato)
+# e rimuove gli shard. Nessuna riga viene scartata per timeout come con FileLock. Il merge prende
+# ogni shard rinominandolo (shard.merging: un blocco scritto dopo finisce in un nuovo shard) e i
+# merge dello stesso outFile sono serializzati dal file outFile.merging (creato con O_EXCL).
+#
+# Usage: resultSink.py merge outFile.csv [...]
+#
+
+shardSuffix = '.shards'
+mergingSuffix = '.merging'
+batchSize = 32
+
+
+def shardDir(outFile):
+    return outFile + shardSuffix
+
+
+class ShardedSink:
+    def __init__(self, outFile, header, batch = batchSize):
+        self.outFile = outFile
+        self.header = list(header)
+        self.batch = batch
+        self.rows = []
+        self.count = 0
+        d = shardDir(outFile)
+        if (not os.path.isdir(d)):
+            try:
+                os.makedirs(d)
+            except OSError:
+                if (not os.path.isdir(d)):   # creata nel frattempo da un altro processo
+                    raise
+        self.shard = os.path.join(d, '%s-%d-%d.csv' % (socket.gethostname(), os.getpid(), int(time.time() * 1000)))
+
+    def write(self, row):
+        self.rows.append(list(row))
+        if (len(self.rows) >= self.batch):
+            self.flush()
+
+    def flush(self):
+        if (len(self.rows) == 0):
+            return
+        # la directory puo' essere stata rimossa da un merge, lo shard preso e rinominato
+        os.makedirs(os.path.dirname(self.shard), exist_ok=True)
+        new = not os.path.exists(self.shard)
+        with open(self.shard, 'a') as f:
+            writer = csv.writer(f)
+            if (new):
+                writer.writerow(self.header)
+            writer.writerows(self.rows)
+            f.flush()
+            os.fsync(f.fileno())
+        self.count += len(self.rows)
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        if (self.count > 0):
+            print("****** %d rows in %s: when all the writers are done run 'resultSink.py merge %s' ******" %
+                  (self.count, self.shard, self.outFile))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+        return False
+
+
+
+
+def readRows(csvFile):
+    with open(csvFile) as f:
+        return [ row for row in csv.reader(f)]
+
+
+# aggiunge a outFile (creato se manca) le righe di tutti gli shard e li rimuove.
+# Ritorna il numero di righe aggiunte
+def mergeShards(outFile):
+    lockFile = outFile + mergingSuffix
+    try:
+        os.close(os.open(lockFile, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        raise RuntimeError("merge of %s already running (remove %s if stale)" % (outFile, lockFile))
+    try:
+        return mergeClaimed(outFile, claimShards(outFile))
+    finally:
+        os.remove(lockFile)
+
+
+# rinomina gli shard in shard.merging: compresi quelli presi da un merge precedente interrotto
+def claimShards(outFile):
+    d = shardDir(outFile)
+    for shard in glob.glob(os.path.join(d, '*.csv')):
+        os.rename(shard, shard + mergingSuffix)
+    return sorted(glob.glob(os.path.join(d, '*.csv' + mergingSuffix)))
+
+
+def mergeClaimed(outFile, shards):
+    if (len(shards) == 0):
+        return 0
+
+    rows = readRows(outFile) if os.path.exists(outFile) else []
+    header = rows[0] if len(rows) > 0 else None
+    added = 0
+    for shard in shards:
+        shardRows = readRows(shard)
+        if (len(shardRows) == 0):
+            continue
+        if (header is None):
+            header = shardRows[0]
+            rows.append(header)
+        elif (shardRows[0] != header):
+            print("Warning: %s header differs from %s" % (shard, outFile))
+        for row in shardRows[1:]:
+            if (len(row) != len(header)):
+                # ultima riga incompleta di un processo interrotto
+                print("Warning: %s skipping truncated row %s" % (shard, row))
+                continue
+            rows.append(row)
+            added += 1
+
+    tmp = '%s.tmp.%d' % (outFile, os.getpid())
+    with open(tmp, 'w') as f:
+        csv.writer(f).writerows(rows)
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(tmp, outFile)
+
+    for shard in shards:
+        os.remove(shard)
+    try:
+        os.rmdir(shardDir(outFile))
+    except OSError:
+        pass    # shard aggiunti nel frattempo
+    return added
+
+
+
+
+def main():
+    if (len(sys.argv) < 3 or sys.argv[1] != 'merge'):
+        print("Usage: %s merge outFile.csv [...]" % os.path.basename(sys.argv[0]))
+        exit(-1)
+
+    for outFile in sys.argv[2:]:
+        try:
+            print("%s: %d rows merged" % (outFile, mergeShards(outFile)))
+        except RuntimeError as e:
+            print(e)
+            exit(-1)
+
+
+
+if __name__ == "__main__":
+    main()
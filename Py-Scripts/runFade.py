@@ -4,12 +4,19 @@
 # $Id: runFade.py 1738 2020-12-11 12:25:28Z cattaneo@dia.unisa.it $
 #
 
+import os
 import sys
+import csv
+import json
 import datetime
 import re
 import math
+import time
+import threading
+import subprocess
 import ToolBox
 from os.path import basename, splitext
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from optparse import OptionParser
 
 Version = "$Revision: 1738 $".split(' ')[1]
@@ -22,11 +29,19 @@ numBins = 267
 kVal = 0
 gVal = 0
 masterConf = "confs/allMeasures.conf"
-confFile   = "fade.conf"
 logFile    = "run.log"
+jobsDir    = "fadeJobs"  # configurazione e log di ogni job (dataset, k)
 inputPath  = "data/dataset5-1000"
 resultsPrefix = "results"
 fadePath = " build/libs"
+driverMemory = "22g"
+executorMemory = "27500m"
+numJobs = 1         # spark-submit contemporanei
+maxRetries = 2      # nuovi tentativi per un job fallito
+retryDelay = 60     # secondi (raddoppiati ad ogni tentativo)
+historyFile = "fadeHistory.csv"  # storico delle esecuzioni (tempo, shuffle, configurazione)
+eventLogDir = ""    # spark.eventLog.dir del cluster, per leggere lo shuffle di ogni esecuzione
+maxScale = 4.       # lo storico vale per dataset con seqLen * nPairs entro questo fattore
 
 kValues = (4, 6, 8, 10)
 
@@ -68,9 +83,308 @@ class Logger(object):
 
     
 
+# numero di slices (e di bins) di FADE per il valore di k
+def Slices( kVal):
+    if (kVal <= 6):
+        return 73
+    elif (kVal <= 8):
+        return 269
+    elif (kVal == 9):
+        return 1023
+    elif (kVal == 10):
+        return 2069
+    elif (kVal == 11):
+        return 4079
+    else:
+        return 8069
+
+
+
+# listing dell'HDFS (hdfs dfs -ls [-R]) in memoria: path -> (directory, size)
+def HdfsListing( path, recursive = False):
+    out = ToolBox.GetCommandOutput("hdfs dfs -ls %s%s" % ("-R " if recursive else "", path))
+    listing = {}
+    if (not out):
+        return( listing)
+    for line in out.split('\n'):
+        # permessi repliche owner group size data ora path
+        f = line.split(None, 7)
+        if (len(f) < 8 or not is_int(f[4])):
+            continue # "Found n items" o messaggi di errore
+        listing[f[7]] = (f[0].startswith('d'), int(f[4]))
+    return( listing)
+
+
+
+# stato degli output di FADE sotto resultsPath da un solo listing ricorsivo: un output e' completo
+# se e' una directory con _SUCCESS e dati non vuoti (o un file non vuoto), parziale se esiste
+# ma non e' completo, mancante altrimenti
+class ResultsIndex(object):
+
+    def __init__(self, resultsPath):
+        self.outputs = {}   # k=K/dist-... -> (directory, size)
+        self.success = set()
+        self.dataBytes = {}
+        for (path, (isDir, size)) in HdfsListing( resultsPath, recursive = True).items():
+            rel = path.split( resultsPath.rstrip('/') + '/', 1)[-1]
+            parts = rel.split('/')
+            if (len(parts) == 2):
+                self.outputs[rel] = (isDir, size)
+            elif (len(parts) > 2 and not isDir):
+                out = '/'.join(parts[:2])
+                if (parts[-1] == '_SUCCESS'):
+                    self.success.add( out)
+                elif (not parts[-1].startswith(('_', '.'))):
+                    self.dataBytes[out] = self.dataBytes.get( out, 0) + size
+
+    def status(self, job):
+        rel = "k=%d/%s" % (job.kVal, job.name)
+        if (rel not in self.outputs):
+            return( 'missing')
+        (isDir, size) = self.outputs[rel]
+        if (isDir):
+            complete = rel in self.success and self.dataBytes.get( rel, 0) > 0
+        else:
+            complete = size > 0
+        return( 'complete' if complete else 'partial')
+
+
+
+# storico delle esecuzioni di FADE (una riga per tentativo in historyFile) usato per scegliere slices/bins
+class FadeHistory(object):
+
+    fields = ['date', 'dataset', 'k', 'seqLen', 'nPairs', 'slices', 'executors', 'elapsed', 'shuffleBytes', 'status']
+
+    def __init__(self, historyFile):
+        self.historyFile = historyFile
+        self.runs = []
+        self.lock = threading.Lock()
+        if (os.path.exists( historyFile)):
+            with open( historyFile) as f:
+                for row in csv.DictReader( f):
+                    try:
+                        self.runs.append( self.fromRow( row))
+                    except (ValueError, TypeError):
+                        pass # riga incompleta
+
+    def fromRow(self, row):
+        for c in ['k', 'seqLen', 'nPairs', 'slices', 'executors', 'elapsed', 'shuffleBytes']:
+            row[c] = int(row[c])
+        return( row)
+
+    def add(self, job, executors, elapsed, shuffleBytes, status):
+        row = { 'date': datetime.datetime.now().strftime("%Y/%m/%d %H:%M:%S"), 'dataset': job.datasetType,
+                'k': job.kVal, 'seqLen': job.seqLen, 'nPairs': job.seqNum, 'slices': job.slices,
+                'executors': executors, 'elapsed': int(elapsed), 'shuffleBytes': shuffleBytes, 'status': status}
+        with self.lock:
+            new = not os.path.exists( self.historyFile)
+            with open( self.historyFile, 'a', newline='') as f:
+                writer = csv.DictWriter( f, fieldnames = self.fields)
+                if (new):
+                    writer.writeheader()
+                writer.writerow( row)
+            self.runs.append( row)
+
+    # slices con il minor costo medio (secondi x executors per unita' di lavoro seqLen * nPairs) fra le
+    # esecuzioni riuscite con lo stesso k e la stessa dimensione o, se non ce ne sono, una dimensione
+    # entro maxScale: ritorna (slices, esecuzioni considerate) o None
+    def best(self, kVal, seqLen, nPairs):
+        work = float(seqLen * nPairs)
+        ok = [ r for r in self.runs if r['status'] == 'ok' and r['k'] == kVal and r['elapsed'] > 0]
+        runs = [ r for r in ok if r['seqLen'] == seqLen and r['nPairs'] == nPairs]
+        if (len(runs) == 0):
+            runs = [ r for r in ok if abs( math.log( r['seqLen'] * r['nPairs'] / work)) <= math.log( maxScale)]
+        if (len(runs) == 0):
+            return( None)
+
+        costs = {}
+        for r in runs:
+            costs.setdefault( r['slices'], []).append( float(r['elapsed']) * r['executors'] / (r['seqLen'] * r['nPairs']))
+        slices = min( costs, key = lambda sl: sum(costs[sl]) / len(costs[sl]))
+        return( (slices, len(runs)))
+
+
+
+# slices/bins di un job: opzione -b, altrimenti dallo storico, altrimenti dalla tabella su k
+def ChooseSlices( history, kVal, seqLen, nPairs, binNumber):
+    if (len(binNumber) > 0 and is_int(binNumber) and int(binNumber) > 0):
+        return( (int(binNumber), "option -b"))
+    best = history.best( kVal, seqLen, nPairs)
+    if (best is not None):
+        return( (best[0], "history, %d runs" % best[1]))
+    return( (Slices( kVal), "table"))
+
+
+
+# byte scritti nello shuffle dall'ultima applicazione spark del log del job (event log di spark in
+# eventLogDir, hdfs:// o locale), -1 se non disponibile
+def ShuffleBytes( logFile, eventLogDir):
+    if (len(eventLogDir) == 0):
+        return( -1)
+    with open( logFile) as f:
+        apps = re.findall( r'application_\d+_\d+', f.read())
+    if (len(apps) == 0):
+        return( -1)
+    path = "%s/%s" % (eventLogDir.rstrip('/'), apps[-1])
+
+    total = 0
+    try:
+        if (path.startswith('hdfs:')):
+            proc = subprocess.Popen( ["hdfs", "dfs", "-cat", path], stdout = subprocess.PIPE, stderr = subprocess.DEVNULL)
+            lines = proc.stdout
+        else:
+            proc = None
+            lines = open( re.sub( r'^file:(//)?', '', path), 'rb')
+        with lines:
+            for line in lines:
+                if (b'"SparkListenerTaskEnd"' in line):
+                    metrics = json.loads( line).get( 'Task Metrics') or {}
+                    total += metrics.get( 'Shuffle Write Metrics', {}).get( 'Shuffle Bytes Written', 0)
+        if (proc is not None and proc.wait() != 0):
+            return( -1)
+    except (OSError, ValueError):
+        return( -1)
+    return( total)
+
+
+
+# un'esecuzione di FADE su un dataset per un valore di k: configurazione e log in jobsDir
+class FadeJob(object):
+
+    def __init__(self, ds, kVal, slices, seqNum, seqLen, gVal, resultsPath, nokspec):
+        self.ds = ds
+        self.kVal = kVal
+        self.slices = slices
+        self.seqNum = seqNum
+        self.seqLen = seqLen
+        self.gVal = gVal
+        self.nokspec = nokspec
+        self.inputDataSet = splitext(basename( ds))[0]
+        self.datasetType = self.inputDataSet[0:self.inputDataSet.rindex('-')] # at least one dash must be there
+        # nome dell'output come nella configurazione (dist-k=_... per -f), conf e log distinti per ogni k
+        self.name = "dist-%s_%s" % (self.kSpec(), self.inputDataSet)
+        self.output = "%s/k=%d/%s" % (resultsPath, kVal, self.name)
+        self.confFile = "%s/dist-k=%d_%s.conf" % (jobsDir, kVal, self.inputDataSet)
+        self.logFile = "%s/dist-k=%d_%s.log" % (jobsDir, kVal, self.inputDataSet)
+        self.slicesSource = "table"
+        self.status = 'missing'
+        self.attempts = 0
+        self.notBefore = 0.
+
+    def toString(self):
+        return( "Dataset: %s, pairs: %d, len: %d, k: %d, b: %d, g: %d" %
+                (self.datasetType, self.seqNum, self.seqLen, self.kVal, self.slices, self.gVal))
+
+    def kSpec(self):
+        return "k=" if (self.nokspec) else "k=%d" % (self.kVal) # per spaced words is null
+
+    # configurazione del job dal file master
+    def writeConf(self, lines):
+        P1 = self.kSpec()
+        P2 = "output=%s" % (self.output)
+        P3 = "slices=%d" % self.slices
+        P4 = "b=%d" % self.slices
+
+        with open( self.confFile, "w") as config:
+            for line in lines:
+                config.write(re.sub( r"^input=", r"input=" + self.ds,
+                             re.sub( r"^k=", P1,
+                                     re.sub( r"^b=", P4,
+                                             re.sub( r"^slices=", P3,
+                                                         re.sub( r"^output=", P2, line))))))
+
+    def command(self, executors, fade):
+        return( "spark-submit --master yarn --deploy-mode %s \
+                --driver-memory %s --num-executors %d \
+                --executor-cores 7 --executor-memory %s \
+                --conf spark.eventLog.enabled=true\
+                --conf spark.hadoop.dfs.replication=1\
+                --conf spark.yarn.executor.memoryOverhead=2500m\
+                %s/fade-1.0.0-all.jar %s" % (deployMode, driverMemory, executors, executorMemory, fade, self.confFile))
+
+
+
+# esegue un tentativo del job (output di spark-submit nel log del job):
+# ritorna il codice di uscita e i byte di shuffle
+def RunJob( job, runSpark, eventLogDir):
+    job.attempts += 1
+    with open( job.logFile, 'a') as out:
+        out.write("****** %s attempt %d: %s ******\n" % (datetime.datetime.now().strftime("%Y/%m/%d, %H:%M:%S"),
+                                                         job.attempts, ' '.join(runSpark.split())))
+        out.flush()
+        if (job.attempts > 1 or job.status != 'missing'):
+            # output parziale (o da rieseguire) di un tentativo precedente
+            subprocess.call( ["hdfs", "dfs", "-rm", "-r", "-f", job.output], stdout = out, stderr = subprocess.STDOUT)
+        retCode = subprocess.call( runSpark.split(), stdout = out, stderr = subprocess.STDOUT)
+    return( (retCode, ShuffleBytes( job.logFile, eventLogDir) if retCode == 0 else -1))
+
+
+
+# coda dei job: al piu' jobs spark-submit contemporanei, un job fallito torna in fondo alla coda
+# (dopo retryDelay * 2^(tentativi - 1) secondi) fino a retries nuovi tentativi.
+# Ogni tentativo e' registrato nello storico. Ritorna la lista dei job falliti
+def RunQueue( queue, jobs, executors, retries, fade, runLog, history, eventLogDir, debug):
+    lock = threading.Lock()
+    running = {}
+    failed = []
+    done = 0
+    total = len(queue)
+
+    def report( msg):
+        with lock:
+            print( msg)
+            with open( runLog, 'a') as log:
+                log.write( msg + '\n')
+
+    with ThreadPoolExecutor( max_workers = jobs) as executor:
+        while (len(queue) > 0 or len(running) > 0):
+            now = time.time()
+            while (len(running) < jobs):
+                ready = [ j for j in queue if j.notBefore <= now]
+                if (len(ready) == 0):
+                    break
+                job = ready[0]
+                queue.remove( job)
+                runSpark = job.command( executors, fade)
+                report( "%s mode: %s %s (attempt %d, log %s)" % (datetime.datetime.now().strftime("%Y/%m/%d, %H:%M:%S"),
+                                                                 deployMode, job.toString(), job.attempts + 1, job.logFile))
+                if (debug):
+                    print( runSpark)
+                    done += 1
+                    continue
+                running[executor.submit( RunJob, job, runSpark, eventLogDir)] = (job, now)
+
+            if (len(running) == 0):
+                if (len(queue) > 0):
+                    time.sleep( max( 1., min( j.notBefore for j in queue) - time.time()))
+                continue
+
+            (finished, pending) = wait( list(running.keys()), timeout = 60, return_when = FIRST_COMPLETED)
+            for f in finished:
+                (job, start) = running.pop( f)
+                try:
+                    (retCode, shuffleBytes) = f.result()
+                except OSError as e:
+                    (retCode, shuffleBytes) = (str(e), -1)
+                elapsed = time.time() - start
+                history.add( job, executors, elapsed, shuffleBytes, 'ok' if retCode == 0 else 'failed')
+                if (retCode == 0):
+                    done += 1
+                    report( "****** %s completed in %d sec. (%d/%d) ******" % (job.name, elapsed, done, total))
+                elif (job.attempts <= retries):
+                    job.notBefore = time.time() + retryDelay * 2 ** (job.attempts - 1)
+                    queue.append( job)
+                    report( "****** %s failed (%s) after %d sec., retry %d/%d ******" % (job.name, retCode, elapsed, job.attempts, retries))
+                else:
+                    failed.append( job)
+                    report( "****** %s failed (%s) after %d attempts, see %s ******" % (job.name, retCode, job.attempts, job.logFile))
+    return( failed)
+
+
+
 def main():
 
-    global options, kValues, numExec
+    global options, kValues, numExec, driverMemory, executorMemory
         
     ScriptName = basename(splitext(__file__)[0])
 
@@ -81,7 +395,7 @@ def main():
     
     parser.add_option("-x", "--executors", action="store",
                       dest="executorsNumber", default = str(numExec),
-                      help="Number of spark task executors")
+                      help="Number of spark task executors (shared among concurrent jobs)")
     
     
     parser.add_option("-f", "--nokspec", action="store_true", # optional
@@ -115,36 +429,61 @@ def main():
     parser.add_option("-c", "--confFile", action="store", # ==> optional
                       dest="confFile", default=masterConf,
                       help="Specify master configuration  filename")
+
+    parser.add_option("-j", "--jobs", action="store", # optional
+                      dest="jobs", default = str(numJobs),
+                      help="Number of concurrent spark-submit (the executors are divided among them)")
+
+    parser.add_option("-r", "--retries", action="store", # optional
+                      dest="retries", default = str(maxRetries),
+                      help="Number of retries of a failed FADE job")
+
+    parser.add_option("--driverMemory", action="store", # optional
+                      dest="driverMemory", default = driverMemory,
+                      help="Spark driver memory")
+
+    parser.add_option("--executorMemory", action="store", # optional
+                      dest="executorMemory", default = executorMemory,
+                      help="Spark executor memory")
+
+    parser.add_option("--history", action="store", # optional
+                      dest="history", default = historyFile,
+                      help="History file of the FADE runs used to choose the number of slices/bins")
+
+    parser.add_option("--eventLogDir", action="store", # optional
+                      dest="eventLogDir", default = eventLogDir,
+                      help="Spark event log directory, used to record the shuffle size of each run")
+
+    parser.add_option("-n", "--dryRun", action="store_true",
+                      dest="dryRun", default = False,
+                      help="Show the jobs and the chosen number of slices/bins and exit")
+
+    parser.add_option("-a", "--all", action="store_true",
+                      dest="rerunAll", default = False,
+                      help="Run FADE also for the (dataset, k) whose output is already complete on HDFS")
     
     (options, args) = parser.parse_args()
 
     numExec = int(options.executorsNumber)
+    jobs = max(1, int(options.jobs))
+    driverMemory = options.driverMemory
+    executorMemory = options.executorMemory
     if (len(options.clkvalues) > 0):
-        kValues = map(int, options.clkvalues) 
+        kValues = list(map(int, options.clkvalues))
     
-    dir = ToolBox.GetCommandOutput("hdfs dfs -ls %s" % options.inputDataSet)
+    dsList = sorted( [ path for (path, (isDir, size)) in HdfsListing( options.inputDataSet).items() if (not isDir)])
 
-    if (not dir):
+    if (len(dsList) == 0):
         print( 'No input file specifiend in the directory or pattern %s' % (options.inputDataSet))
         exit(0)
-    else:
-        dirOut = dir.split('\n')
-
-    s = 1 if (dirOut[0].startswith('Found')) else 0
-    dsList = []
-    
-    for f in dirOut[s:]: 
-    	dsList.append(f.split()[7])
-	
-
-    ToolBox.RunCommand( "rm %s" % options.logFile)
 
     resultsPath = "%s/%s" % (resultsPrefix, basename(splitext(options.confFile)[0]))
+    results = ResultsIndex( resultsPath)
+    history = FadeHistory( options.history)
+    executors = max(1, numExec // jobs)
 
-    ToolBox.RunCommand( "hdfs dfs -mkdir %s" % (resultsPath))
-
-    print( "Test starting, script %s version: %s, %d dataset selected" % (ScriptName, Version, len(dsList)))
-           
+    # coda di tutti i job (dataset, k)
+    queue = []
     for ds in dsList:
 
         m = re.search( r'.*-(\d+)\.(\d+)\..*', ds)
@@ -159,75 +498,56 @@ def main():
         gVal = 0 if (m is None) else int(m.group(1))
 
         for kVal in kValues:
+            (slices, source) = ChooseSlices( history, kVal, seqLen, seqNum, options.binNumber)
+            job = FadeJob( ds, kVal, slices, seqNum, seqLen, gVal, resultsPath, options.nokspec)
+            job.slicesSource = source
+            job.status = results.status( job)
+            queue.append( job)
+
+    # lavoro rimanente: gli output completi non sono rieseguiti (salvo -a), quelli parziali sono cancellati e rieseguiti
+    counts = dict( [ (st, len([ j for j in queue if j.status == st])) for st in ('complete', 'partial', 'missing')])
+    print( "%d jobs: %d complete%s, %d partial (re-run), %d missing" %
+           (len(queue), counts['complete'], "" if options.rerunAll else " (skipped)", counts['partial'], counts['missing']))
+    if (not options.rerunAll):
+        queue = [ j for j in queue if j.status != 'complete']
+
+    if (options.dryRun):
+        print( "%d jobs to run, %d concurrent x %d executors, history: %s (%d runs)" %
+               (len(queue), jobs, executors, options.history, len(history.runs)))
+        for job in queue:
+            print( "%s -> slices = b = %d (%s), output %s" % (job.toString(), job.slices, job.slicesSource, job.status))
+        exit(0)
 
-            # kVal   = 0 if (options.nokspec) else ComputeKValue( seqLen) if (options.clkvalues == "") else int(options.clkvalues)
- 
-            if (len(options.binNumber) > 0 and is_int(options.binNumber) and
-                int(options.binNumber) > 0):
-                slices = int(options.binNumber)
-            else:
-                if (kVal <= 6):
-                    slices = 73
-                elif (kVal <= 8):
-                    slices = 269
-                elif (kVal == 9):
-                    slices = 1023
-                elif (kVal == 10):
-                    slices = 2069
-                elif (kVal == 11):
-                    slices = 4079
-                else:
-                    slices = 8069
-
-            inputDataSet = splitext(basename( ds))[0]
-
-            P1 = "k=" if (options.nokspec) else "k=%d" % (kVal) # per spaced words is null
-            P2 = "output=%s/k=%d/dist-%s_%s" % (resultsPath, kVal, P1, inputDataSet)
-            P3 = "slices=%d" % slices
-            P4 = "b=%d" % slices
-
-            datasetType = inputDataSet[0:inputDataSet.rindex('-')] # at least one dash must be there
-
-            with open( options.confFile, "r") as sources:
-                lines = sources.readlines()
+    if (len(queue) == 0):
+        print( "Nothing to do")
+        exit(0)
 
-            with open( confFile, "w") as config:
-                for line in lines:
-                    config.write(re.sub( r"^input=", r"input=" + ds,
-                                 re.sub( r"^k=", P1,
-                                         re.sub( r"^b=", P4,
-                                                 re.sub( r"^slices=", P3,
-                                                             re.sub( r"^output=", P2, line))))))
+    ToolBox.RunCommand( "rm %s" % options.logFile)
 
-            # Eseguo fade
-            dtStart = datetime.datetime.now()
-            out = open( logFile, 'a')
+    ToolBox.RunCommand( "hdfs dfs -mkdir %s" % (resultsPath))
 
-            runSpark = "spark-submit --master yarn --deploy-mode %s \
-                --driver-memory 22g --num-executors %d \
-                --executor-cores 7 --executor-memory 27500m \
-                --conf spark.eventLog.enabled=true\
-                --conf spark.hadoop.dfs.replication=1\
-                --conf spark.yarn.executor.memoryOverhead=2500m\
-                %s/fade-1.0.0-all.jar %s" % (deployMode, numExec, options.fade, confFile)
+    if (not os.path.exists( jobsDir)):
+        os.mkdir( jobsDir)
 
-            print( "%s mode: %s Dataset: %s, pairs: %d, len: %d, k: %d, b: %d, g: %d" %
-                   (dtStart.strftime("%Y/%m/%d, %H:%M:%S"), deployMode,
-                    datasetType, seqNum, seqLen, kVal, slices, gVal))
-            if (not options.debug_flag):
-                retCode = ToolBox.RunCommand2(runSpark, out)
-            else:
-                print(runSpark)
+    with open( options.confFile, "r") as sources:
+        lines = sources.readlines()
+    for job in queue:
+        job.writeConf( lines)
 
-            out.close()
-            # print  runSpark
+    print( "Test starting, script %s version: %s, %d dataset selected, %d jobs, %d concurrent x %d executors" %
+           (ScriptName, Version, len(dsList), len(queue), jobs, executors))
 
-            dtEnd = datetime.datetime.now()
-            elapsed = (dtEnd - dtStart).seconds
+    dtStart = datetime.datetime.now()
+    failed = RunQueue( queue, jobs, executors, int(options.retries), options.fade, options.logFile,
+                       history, options.eventLogDir, options.debug_flag)
+    elapsed = (datetime.datetime.now() - dtStart).seconds
 
-        	# raw_input("Press the <ENTER> key to continue...")
+    print( "Test completed in %d sec., %d jobs failed" % (elapsed, len(failed)))
+    for job in failed:
+        print( "%s: %s" % (job.name, job.logFile))
+    if (len(failed) > 0):
+        exit(-1)
 
-	 
 
 
 
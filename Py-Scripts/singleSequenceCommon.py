@@ -0,0 +1,400 @@
+#! /usr/local/bin/python3
+
+import re
+import os
+import math
+import subprocess
+
+import numpy as np
+
+#
+# Parti comuni delle versioni single sequence (PyPASingleSequenceOutMemory.py su HDFS/Spark,
+# PyPASingleSequenceExtMemory.py in memoria esterna sul disco locale): conteggio dei k-mer con kmc,
+# parsing vettoriale dei dump di kmc_dump_x, momenti dei contatori, misure present/absent,
+# misure standardizzate, mash e intestazione del CSV dei risultati.
+#
+
+sketchSizes = [1000, 10000, 100000]
+# sketchSizes = [10000]
+
+dumpChunkSize = 64 * 1024 * 1024
+maxDigits = 10      # contatori kmc fino a -cs1048575000
+
+# A -> 0, C -> 1, G -> 2, T -> 3
+codeTable = np.zeros(256, dtype=np.uint64)
+isKmerBase = np.zeros(256, dtype=bool)
+for i, c in enumerate(b'ACGT'):
+    codeTable[c] = i
+    codeTable[c + 32] = i   # minuscole
+    isKmerBase[c] = True
+    isKmerBase[c + 32] = True
+
+
+
+class EntropyData:
+    def __init__(self, nKeys, totalKmerCnt, Hk):
+        self.nKeys = nKeys
+        self.totalKmerCnt = totalKmerCnt;
+        self.Hk = Hk
+
+    def getDelta(self):
+        return float(self.nKeys) / (2 * self.totalKmerCnt)
+
+    def getError(self):
+        try:
+            result = self.getDelta() / self.Hk
+        except ZeroDivisionError:
+            result = 0
+        return result
+
+    def toString(self):
+        return [self.nKeys, 2 * self.totalKmerCnt, self.getDelta(), self.Hk, self.getError()]
+
+
+
+
+class MashData:
+    def __init__(self, cmdResults):
+        mr = cmdResults.split()
+        mashAN = mr[4].decode('UTF-8')
+        self.Pv = float(mr[2])
+        self.dist = float(mr[3])
+        try:
+            ns = mashAN.index('/')
+            self.A = int(mashAN[:ns])
+            self.N = int(mashAN[ns+1:])
+        except ValueError:
+            self.A = 0
+            self.N = 0
+
+    def toString( self):
+        return [ self.Pv, self.dist, self.A, self.N ]
+
+
+
+
+# momenti dell'istogramma (numero di chiavi, somma e somma dei quadrati dei contatori)
+# calcolati durante il dump: permettono di ricavare media e deviazione standard sul full outer join
+# senza dover valutare il join una seconda volta
+class HistogramMoments:
+    def __init__(self, nKeys = 0, sum = 0, sumSq = 0):
+        self.nKeys = nKeys
+        self.sum = sum
+        self.sumSq = sumSq
+
+    def update(self, cnts):
+        cnts = cnts.astype(np.uint64)
+        self.nKeys += len(cnts)
+        self.sum += int(cnts.sum())
+        self.sumSq += int(np.dot(cnts, cnts))
+
+    # media sulle n chiavi del join (i k-mer assenti contano 0)
+    def mean(self, n: int):
+        return self.sum / n
+
+    # somma degli scarti quadratici sulle n chiavi del join: (n * sumSq - sum^2) / n
+    def sumSqDev(self, n: int):
+        return (n * self.sumSq - self.sum * self.sum) / n
+
+    # deviazione standard campionaria (come sf.stddev)
+    def std(self, n: int):
+        return math.sqrt(self.sumSqDev(n) / (n - 1)) if n > 1 else 0.0
+
+    def toString(self):
+        return f"{self.nKeys}\t{self.sum}\t{self.sumSq}"
+
+    @staticmethod
+    def fromString(line: str):
+        v = line.split('\t')
+        return HistogramMoments(int(v[0]), int(v[1]), int(v[2]))
+
+
+
+
+# sketch mash di una sequenza per un valore di k, calcolati una sola volta per dimensione
+class MashSketches:
+    def __init__(self, seqFile: str, k: int, prefix: str):
+        self.seqFile = seqFile
+        self.k = k
+        self.prefix = prefix
+        self.sketches = {}
+
+    def mashSketch(self, sketchSize: int):
+        if (sketchSize not in self.sketches):
+            mashout = f"{self.prefix}-s={sketchSize}"
+            cmd = f"/usr/local/bin/mash sketch -s {sketchSize} -p 8 -k {self.k} -o {mashout} {self.seqFile}"
+            p = subprocess.Popen(cmd.split())
+            p.wait()
+            self.sketches[sketchSize] = mashout + '.msh'
+        return self.sketches[sketchSize]
+
+    def remove(self):
+        for f in self.sketches.values():
+            os.remove(f)
+        self.sketches = {}
+
+
+
+
+def runMash(histA, histB, k: int):
+    # run mash on the same sequence pair (histA e histB forniscono mashSketch(sketchSize):
+    # gli sketch della sequenza di riferimento possono essere gia' stati calcolati)
+    mashValues = []
+    for ss in sketchSizes:
+        mashout1 = histA.mashSketch(ss)
+        mashout2 = histB.mashSketch(ss)
+
+        cmd = f"/usr/local/bin/mash dist {mashout1} {mashout2}"
+        out = subprocess.check_output(cmd.split())
+
+        mashValues.append( MashData( out))
+
+    # dati mash distance
+    data2 = []
+    for i in range(len(sketchSizes)):
+        data2 = data2 + mashValues[i].toString()
+
+    return data2
+
+
+
+
+# run jaccard on sequence pair ds with kmer of length = k
+def runPresentAbsent(  bothCnt: int, leftCnt: int, rightCnt: int, k: int):
+
+    A = int(bothCnt)
+    B = int(leftCnt)
+    C = int(rightCnt)
+
+    NMax = pow(4, k)
+    M01M10 = leftCnt + rightCnt
+    M01M10M11 = bothCnt + M01M10
+    absentCnt = NMax - (A + B + C) # NMax - M01M10M11
+    D = absentCnt
+    # (M10 + M01) / (M11 + M10 + M01)
+
+    # Anderberg dissimilarity => Anderberg = 1 - (A/(A + B) + A/(A + C) + D/(C + D) + D/(B + D))/4
+    try:
+        anderberg = 1 - (A/float(A + B) + A/float(A + C) + D/float(C + D) + D/float(B + D))/4.0
+    except (ZeroDivisionError, ValueError):
+        anderberg = 1.000001
+
+    # Antidice dissimilarity => Antidice = 1 - A/(A + 2(B + C))
+    try:
+        antidice = 1 - A / float(A + 2.0 * (B + C))
+    except (ZeroDivisionError, ValueError):
+        antidice = 1.000001
+
+    # Dice dissimilarity => Dice = 1 - 2A/(2A + B + C)
+    try:
+        dice = 1 - 2*A / float(2.0*A + B + C)
+    except (ZeroDivisionError, ValueError):
+        dice  = 1.000001
+    # Gower dissimilarity => Gower = 1 - A x D/sqrt(A + B) x(A + C) x (D + B x (D + C)
+    try:
+        gower = 1 - A * D / math.sqrt((A + B) * (A + C) * (D + B * (D + C)))
+    except (ZeroDivisionError, ValueError):
+        gower = 1.000001
+
+    # Hamman dissimilarity => Hamman = 1 - [((A + D) - (B + C))/N]2
+    try:
+        hamman = 1 - math.pow((((A + D) - (B + C)) / float(NMax)), 2.0)
+    except (ZeroDivisionError, ValueError):
+        hamman = 1.000001
+
+    # Hamming dissimilarity => Hamming = (B + C)/N
+    try:
+        hamming = (B + C)/ NMax
+    except (ZeroDivisionError, ValueError):
+        hamming = 1.000001
+
+    # Jaccard dissimilarity => Jaccard = 1 - A/(N - D)
+    try:
+        jaccard = 1 - A / (NMax - D)
+    except (ZeroDivisionError, ValueError):
+        jaccard = 1.000001
+
+    try:
+        jaccardDistance = 1 - min( 1.0, A / float(NMax - D))
+    except (ZeroDivisionError, ValueError):
+        jaccardDistance = 1.000001
+
+
+    # Kulczynski dissimilarity => Kulczynski = 1 - (A/(A + B) + A/(A + C)) / 2
+    try:
+        kulczynski = 1 - (A / float(A + B) + A / float(A + C)) / 2.0
+    except (ZeroDivisionError, ValueError):
+        kulczynski = 1.000001
+
+    # Matching dissimilarity => Matching = 1 - (A + D)/N
+    try:
+        matching = 1 - (A + D) / NMax
+    except (ZeroDivisionError,ValueError):
+        matching = 1.000001
+
+    # Ochiai dissimilarity => Ochiai = 1 - A/sqrt(A + B) x (A + C)
+    try:
+        ochiai = 1 - A / math.sqrt((A + B) * (A + C))
+    except (ZeroDivisionError, ValueError):
+        ochiai = 1.000001
+
+    # Phi dissimilarity => Phi = 1 - [(A x  B x  C x D)/sqrt(A + B) x (A + C) x (D + B) x (D + C)]2
+    try:
+        phi = 1 - math.pow((A * B * C * D)/ math.sqrt((A + B) * (A + C) * (D + B) * (D + C)), 2.0)
+    except (ZeroDivisionError, ValueError):
+        phi = 1.000001
+
+    # Russel dissimilarity => Russel = 1 - A/N
+    try:
+        russel = 1 - A / NMax
+    except (ZeroDivisionError, ValueError):
+        russel = 1.000001
+
+    # Sneath dissimilarity => Sneath = 1 - 2(A + D)/(2 x (A + D) + (B + C))
+    try:
+        sneath = 1 - 2.0 * (A + D) / (2.0 * (A + D) + (B + C))
+    except (ZeroDivisionError, ValueError):
+        sneath = 1.000001
+
+    # Tanimoto dissimilarity => Tanimoto = 1 - (A + D)/((A + D) + 2(B + C))
+    try:
+        tanimoto = 1 - (A + D) / float((A + D) + 2.0 * (B + C))
+    except (ZeroDivisionError, ValueError):
+        tanimoto = 1.000001
+
+    # Yule dissimilarity => Yule = 1 - [(A x D - B x C)/(A x D + B x C)]2
+    try:
+        yule = 1 - math.pow(((A * D - B * C) / float(A * D + B * C)), 2.0)
+    except (ZeroDivisionError, ValueError):
+        yule = 1.000001
+
+    # salva il risultato nel file CSV
+    # dati present / absent e distanze present absent
+    data1 = [ A, B, C, str(D), str(NMax), str(A/NMax),
+             anderberg, antidice, dice, gower, hamman, hamming, jaccard,
+             kulczynski, matching, ochiai, phi, russel, sneath, tanimoto, yule]
+
+    return data1
+
+
+
+
+# conta i k-mer di inputDataset con kmc (al piu' memGB GB di RAM, -sm se strictMemory):
+# ritorna (k-mer distinti, k-mer totali)
+def extractKmers( inputDataset: str, k: int, tempDir: str, kmcOutputPrefix: str, memGB: int = 12, strictMemory: bool = False):
+    # run kmc on the first sequence
+    # -v - verbose mode (shows all parameter settings); default: false
+    # -k<len> - k-mer length (k from 1 to 256; default: 25)
+    # -m<size> - max amount of RAM in GB (from 1 to 1024); default: 12
+    # -sm - use strict memory mode (memory limit from -m<n> switch will not be exceeded)
+    # -p<par> - signature length (5, 6, 7, 8, 9, 10, 11); default: 9
+    # -f<a/q/m/bam/kmc> - input in FASTA format (-fa), FASTQ format (-fq), multi FASTA (-fm) or BAM (-fbam) or KMC(-fkmc); default: FASTQ
+    # -ci<value> - exclude k-mers occurring less than <value> times (default: 2)
+    # -cs<value> - maximal value of a counter (default: 255)
+    # -cx<value> - exclude k-mers occurring more of than <value> times (default: 1e9)
+    # -b - turn off transformation of k-mers into canonical form
+    # -r - turn on RAM-only mode
+    # -n<value> - number of bins
+    # -t<value> - total number of threads (default: no. of CPU cores)
+    # -sf<value> - number of FASTQ reading threads
+    # -sp<value> - number of splitting threads
+    # -sr<value> - number of threads for 2nd stage
+    # -hp - hide percentage progress (default: false)
+
+    sm = " -sm" if (strictMemory) else ""
+    cmd = f"/usr/local/bin/kmc -b -hp -k{k} -m{memGB}{sm} -fm -ci0 -cs1048575000 -cx2000000000 {inputDataset} {kmcOutputPrefix} {tempDir}"
+
+    print(f"****** (local) Kmer Counting {cmd} ******")
+
+    out = subprocess.check_output(cmd.split())
+    results = out.decode()
+    m = re.search(r'Total no. of k-mers[ \t]*:[ \t]*(\d+)', results)
+    totalKmerNumber = 0 if (m is None) else int(m.group(1))
+    # print(f"****** cmd: {cmd} returned:\n{results} ******")
+
+    m = re.search(r'No. of unique k-mers[ \t]*:[ \t]*(\d+)', results)
+    totalDistinctKmerNumber = 0 if (m is None) else int(m.group(1))
+
+    return (totalDistinctKmerNumber, totalKmerNumber)
+
+
+
+
+# codici delle basi [first, last) delle righe che iniziano in starts
+def encodeKmers(buf, starts, first: int, last: int):
+    codes = np.zeros(len(starts), dtype=np.uint64)
+    for j in range(first, last):
+        codes = (codes << np.uint64(2)) | codeTable[buf[starts + j]]
+    return codes
+
+
+
+
+# converte un blocco di righe complete "kmer\tcount\n" prodotte da kmc_dump_x
+# nei vettori (codici alti, codici bassi, contatori) senza iterare in python sulle righe.
+# I codici alti (prime k - 32 basi) sono None per k <= 32
+def parseDumpBlock(block: bytes, k: int):
+    buf = np.frombuffer(block, dtype=np.uint8)
+    ends = np.flatnonzero(buf == ord('\n'))
+    starts = np.empty(len(ends), dtype=np.int64)
+    if (len(ends) > 0):
+        starts[0] = 0
+        starts[1:] = ends[:-1] + 1
+
+    lo = encodeKmers(buf, starts, max(0, k - 32), k)
+    hi = encodeKmers(buf, starts, 0, k - 32) if k > 32 else None
+
+    # le cifre del contatore vanno da starts + k + 1 a ends (escluso)
+    cnts = np.zeros(len(ends), dtype=np.uint64)
+    for d in range(maxDigits):
+        pos = starts + k + 1 + d
+        valid = pos < ends
+        if (not valid.any()):
+            break
+        digit = buf[np.minimum(pos, len(buf) - 1)].astype(np.uint64) - np.uint64(ord('0'))
+        cnts = np.where(valid, cnts * np.uint64(10) + digit, cnts)
+
+    return (hi, lo, cnts)
+
+
+
+
+# ricava D2Z e EuclideanZ (z-score con media e deviazione standard campionaria calcolate
+# sulle n righe del full outer join) da D2 e dai momenti dei due istogrammi:
+#   sum (c1 - m1)(c2 - m2) = D2 - sum1 * sum2 / n
+#   sum (z2 - z1)^2 = sum z1^2 + sum z2^2 - 2 D2Z
+def standardizedMeasures(D2: int, n: int, momentsA: HistogramMoments, momentsB: HistogramMoments):
+    std1 = momentsA.std(n)
+    if (std1 == 0):
+        std1 = 10**-40
+    std2 = momentsB.std(n)
+    if (std2 == 0):
+        std2 = 10**-40
+
+    D2Z = ((n * D2 - momentsA.sum * momentsB.sum) / n) / (std1 * std2)
+    EuclideanZ = momentsA.sumSqDev(n) / (std1 * std1) + momentsB.sumSqDev(n) / (std2 * std2) - 2 * D2Z
+    return (D2Z, max(EuclideanZ, 0.0))
+
+
+
+
+def writeHeader( writer):#
+    columns0 = ['sequenceA', 'sequenceB', 'start time', 'real time', 'Theta', 'k'] # dati 0
+    columns1 = [ 'A', 'B', 'C', 'D', 'N', 'A/N',
+               'Anderberg', 'Antidice', 'Dice', 'Gower', 'Hamman', 'Hamming',
+                'Jaccard', 'Kulczynski', 'Matching', 'Ochiai',
+                'Phi', 'Russel', 'Sneath', 'Tanimoto', 'Yule']
+
+    columns2 = []
+    for ss in sketchSizes:
+        columns2.append( f"Mash Pv ({ss})")
+        columns2.append( f"Mash Distance({ss})")
+        columns2.append( f"A ({ss})")
+        columns2.append( f"N ({ss})")
+
+    columns3 = [ 'D2', 'D2Z', 'Euclidean', 'EuclideanZ']
+
+    columns4 = ['NKeysA', '2*totalCntA', 'deltaA', 'HkA', 'errorA',
+                'NKeysB', '2*totalCntB', 'deltaB', 'HkB', 'errorB']
+
+    writer.writerow(columns0 + columns1 + columns2 + columns3 + columns4)
@@ -0,0 +1,33 @@
+#! /bin/bash
+
+# confronto di due sequenze su una sola macchina (senza HDFS e Spark)
+# con istogrammi ordinati su disco locale e memoria limitata a memGB
+
+scriptDir='/home/cattaneo/spark/power_statistics/Py-Scripts'
+dataDir=/mnt/VolumeDati1/Dataset/PresentAbsentDatasets/ncbi_dataset
+memGB=64
+
+
+if (( $# < 2)) || (($# > 4)); then
+    echo "Usage: $0 seq1 seq2 [memGB [k]]"
+    exit -1
+else
+    seq1=${dataDir}/$1
+    seq2=${dataDir}/$2
+    if (($# >= 3)) ; then
+	memGB=$3
+    fi
+    kValue=""
+    if (($# >= 4)) ; then
+	kValue=$4
+    fi
+fi
+
+
+cmd="python3 ${scriptDir}/PyPASingleSequenceExtMemory.py $seq1 $seq2 0.0 $memGB $kValue"
+
+logFile="run-$(date '+%s').log"
+
+echo $cmd > $logFile
+
+$cmd >> $logFile 2>&1
@@ -24,4 +24,7 @@ while ((k < kMax)); do
     ((k += 2))
 done # while k
 
+# righe scritte dai singoli processi negli shard di ${model}-Jaccard.csv
+resultSink.py merge ${model}-Jaccard.csv
+
 rm $tmp
@@ -0,0 +1,21 @@
+#! /bin/bash
+
+scDir='/home/cattaneo/spark/PowerStatistics/scripts'
+
+if [ "$#" -lt 1 ]; then
+    models='Uniform MotifRepl-U PatTransf-U Uniform-T1'
+else
+    models=$@
+fi
+
+results=JaccardData.csv
+
+# un processo jaccard-kmc.py per modello, ognuno scrive il proprio shard di $results
+for model in $models; do
+    echo "$(date) Jaccard (kmc) for $model"
+    $scDir/jaccard-kmc.py $model > jaccard-kmc-$model.log 2>&1 &
+done
+wait
+
+# righe scritte dai singoli processi negli shard di $results
+$scDir/resultSink.py merge $results
@@ -0,0 +1,11 @@
+#! /bin/bash
+
+scDir='/home/cattaneo/spark/PowerStatistics/scripts'
+
+results=PresentAbsentData.csv
+
+# PresentAbsent.py scrive le righe nel proprio shard di $results
+$scDir/PresentAbsent.py "$@"
+
+# righe scritte negli shard di $results, solo quando il processo e' terminato
+$scDir/resultSink.py merge $results
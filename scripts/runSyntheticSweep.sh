@@ -0,0 +1,40 @@
+#! /bin/bash
+
+# come runSynthetic.sh ma con una sola applicazione spark per tutti i valori di theta:
+# le sequenze sintetiche sono prodotte da PyPASingleSequenceOutMemory.py (seq2 = synthetic)
+# e l'istogramma della sequenza di riferimento e' calcolato una sola volta per ogni k
+
+scriptDir='/home/cattaneo/spark/power_statistics/Py-Scripts'
+dataDir='/home/cattaneo/spark/power_statistics/Datasets'
+remoteDataDir=Synthetics
+thetaValues='0.005,0.01,0.02,0.03,0.04,0.05,0.06,0.07,0.08,0.09,0.10,0.20,0.30,0.40,0.50,0.60,0.70,0.80,0.90,0.95'
+kValue=""
+
+
+if (( $# < 2)) || (($# > 4)); then
+    echo "Usage: $0 sequence remoteDataDir [theta[,theta...] [k]]"
+    exit -1
+else
+    baseSeq=$1
+    remoteDataDir=$2
+    if (($# >= 3)) ; then
+	thetaValues=$3
+    fi
+    if (($# >= 4)) ; then
+	kValue=$4
+    fi
+fi
+
+seq1=${dataDir}/$baseSeq
+
+logFile="run-$(date '+%s').log"
+echo "Start Log file: $(date)" > $logFile
+echo "Log file: $logFile"
+
+cmd="spark-submit --master yarn --deploy-mode client --driver-memory 27g \
+	     --num-executors 48 --executor-memory 27g --executor-cores 7 \
+	     ${scriptDir}/PyPASingleSequenceOutMemory.py $seq1 synthetic $thetaValues $remoteDataDir $kValue"
+
+echo "$(date) Sweeping $seq1 theta = $thetaValues"
+echo $cmd >> $logFile
+$cmd >> $logFile 2>&1
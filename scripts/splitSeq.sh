@@ -1,19 +1,15 @@
 #! /bin/bash
 
 inFile=$1
-len=2000000
+scriptDir=$(dirname $0)/../Py-Scripts
 
 if test ! -f $inFile; then
     echo "Cannot find input file: $inFile"
     exit -1
 fi
 winSize=100
-i=1
-j=1
-while ((i < ((len - i)) && ((j <= 10)))) ; do
-    echo $i
-    # salta la prima riga con l'intestazione
-    awk ' NR==2 { print $1}' $inFile | tail -c +$i   | head -c $winSize > $(basename $inFile .fasta)-${j}.fasta
-    ((i+=winSize))
-    ((j++))
-done
+nWindows=10
+
+# 10 finestre consecutive di winSize basi della prima sequenza, lette tramite l'indice del dataset
+# (inFile.pai, creato se manca) senza rileggere il file per ogni finestra
+python3 ${scriptDir}/fastaIndex.py window $inFile $winSize $nWindows
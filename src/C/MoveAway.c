@@ -1,15 +1,198 @@
-
 #include <stdio.h>
 #include <libgen.h>
 #include <string.h>
 #include <ctype.h>
 #include <stdlib.h>
+#include <stdint.h>
+#include <time.h>
+#include <fcntl.h>
 #include <unistd.h>
+#include <pthread.h>
 #include <sys/types.h>
 #include <sys/stat.h>
 
+//
+// Usage: MoveAway InputSequence thetaProbability [nThreads [seed]]
+//
+// Il file di input viene diviso in blocchi di bufDim byte estesi fino a fine riga:
+// ogni blocco usa un proprio generatore (splitmix64 di seed e indice del blocco) e
+// viene scritto con pwrite nella stessa posizione del file di output (preallocato),
+// quindi il risultato dipende solo da seed e theta e non dal numero di thread.
+// Le righe di intestazione ('>') sono copiate senza modifiche.
+//
+
+#define bufDim 16777216 // 16 Mb
+
+typedef struct {
+  int fi, fo;
+  off_t start, end;
+  uint64_t seed;
+  long index;
+  int t2;
+  long subst;
+} Chunk;
+
+static Chunk *chunks;
+static long nChunks, nextChunk = 0;
+static pthread_mutex_t chunkLock = PTHREAD_MUTEX_INITIALIZER;
+
+
+
+static uint64_t splitmix64(uint64_t *state) {
+  uint64_t z = (*state += 0x9E3779B97F4A7C15ULL);
+  z = (z ^ (z >> 30)) * 0xBF58476D1CE4E5B9ULL;
+  z = (z ^ (z >> 27)) * 0x94D049BB133111EBULL;
+  return z ^ (z >> 31);
+}
+
+
+
+// legge size byte a partire da offset (pread puo' restituire meno byte)
+static int readFully(int fd, char *buf, size_t size, off_t offset) {
+  size_t done = 0;
+  ssize_t nr;
+
+  while (done < size) {
+    if ((nr = pread(fd, buf + done, size - done, offset + done)) <= 0)
+      return -1;
+    done += nr;
+  }
+  return 0;
+}
+
+
+
+static int writeFully(int fd, char *buf, size_t size, off_t offset) {
+  size_t done = 0;
+  ssize_t nw;
+
+  while (done < size) {
+    if ((nw = pwrite(fd, buf + done, size - done, offset + done)) <= 0)
+      return -1;
+    done += nw;
+  }
+  return 0;
+}
+
+
+
+static void mutateChunk(Chunk *ck, char *buf) {
+  size_t nr = ck->end - ck->start;
+  uint64_t state = ck->seed ^ splitmix64(&(uint64_t){ (uint64_t) ck->index });
+  int header = 0;
+  char *pi;
+
+  if (readFully(ck->fi, buf, nr, ck->start) < 0) {
+    perror("errore di lettura");
+    exit(-1);
+  }
+
+  for( pi = buf; pi < buf + nr; pi++) {
+
+    if (*pi == '>')
+      header = 1;
+    if (*pi == '\n') {
+      header = 0;
+      continue;
+    }
+    if (header)
+      continue;  // intestazione copiata senza modifiche
+
+    char c = toupper(*pi);
+    uint64_t r = splitmix64(&state);
+    if ((r % 1000) < ck->t2) {
+
+      int j = (r >> 32) % 3;
+
+      switch ( c) {
+      case 'A':
+	c = "CGT"[j];
+	break;
+
+      case 'C':
+	c = "AGT"[j];
+	break;
+
+      case 'G':
+	c = "ACT"[j];
+	break;
+
+      case 'T':
+	c = "ACG"[j];
+	break;
+
+      default:
+	ck->subst--;  // altri caratteri 'N'
+	break;
+      }
+      ck->subst++;
+    }
+    *pi = c;
+  } // chiude il for
+
+  if (writeFully(ck->fo, buf, nr, ck->start) < 0) {
+    fprintf(stderr, "Errore di scrittura nel file di output\n");
+    perror("errore di scrittura");
+    exit(-1);
+  }
+  write(1, ".", 1);
+}
+
 
 
+static void *worker(void *arg) {
+  char *buf = malloc( bufDim + 65536);
+  long i;
+
+  if (buf == NULL) {
+    fprintf(stderr, "Errore di allocazione memoria\n");
+    exit(-2);
+  }
+
+  while (1) {
+    pthread_mutex_lock(&chunkLock);
+    i = nextChunk++;
+    pthread_mutex_unlock(&chunkLock);
+    if (i >= nChunks)
+      break;
+    if (chunks[i].end - chunks[i].start > bufDim + 65536) {
+      free(buf);
+      if ((buf = malloc( chunks[i].end - chunks[i].start)) == NULL) {
+	fprintf(stderr, "Errore di allocazione memoria\n");
+	exit(-2);
+      }
+    }
+    mutateChunk(&chunks[i], buf);
+  }
+  free(buf);
+  return NULL;
+}
+
+
+
+// confini dei blocchi: ogni blocco termina dopo il primo '\n' successivo a start + bufDim
+static long chunkBoundaries(int fi, off_t size, off_t **bounds) {
+  long n = 0, max = size / bufDim + 2;
+  off_t pos = 0;
+  char c;
+
+  *bounds = malloc( (max + 1) * sizeof(off_t));
+  (*bounds)[n++] = 0;
+  while (pos < size) {
+    pos += bufDim;
+    while (pos < size && pread(fi, &c, 1, pos - 1) == 1 && c != '\n')
+      pos++;
+    if (pos > size)
+      pos = size;
+    if (n > max) {
+      max *= 2;
+      *bounds = realloc(*bounds, (max + 1) * sizeof(off_t));
+    }
+    (*bounds)[n++] = pos;
+  }
+  return n - 1;
+}
+
 
 
 int main(int argc, char *argv[]) {
@@ -17,13 +200,20 @@ int main(int argc, char *argv[]) {
   char outFile[1000], *inputFile, ext[100] = "";
   char *dirc, *basec, *bname, *dname;
   double theta;
-    
-  if (argc != 3) {
-    printf("Errore nei parametri:\nUsage: %s InputSequence thetaProbability", argv[0]);
+  int nThreads = 1;
+  uint64_t seed;
+
+  if (argc < 3 || argc > 5) {
+    printf("Errore nei parametri:\nUsage: %s InputSequence thetaProbability [nThreads [seed]]\n", argv[0]);
     exit(-1);
   }
   inputFile = argv[1];
   theta = atof(argv[2]);
+  if (argc >= 4)
+    nThreads = atoi(argv[3]);
+  if (nThreads < 1)
+    nThreads = sysconf(_SC_NPROCESSORS_ONLN);
+  seed = (argc == 5) ? strtoull(argv[4], NULL, 10) : (uint64_t) time(NULL) ^ ((uint64_t) getpid() << 32);
 
   dirc = strdup(inputFile);
   basec = strdup(inputFile);
@@ -37,7 +227,7 @@ int main(int argc, char *argv[]) {
   printf("ext:%s\n", ext);
 
   bname[strlen(bname)-strlen(ext)] = '\0';
-  printf("basename:%s\n", bname);  
+  printf("basename:%s\n", bname);
   sprintf(outFile, "%s/%s-T=%.3f%s", dname, bname, theta, ext);
 
   struct stat stat1, stat2;
@@ -46,96 +236,59 @@ int main(int argc, char *argv[]) {
     fprintf(stderr, "Input file %s not available\nExiting.\n", inputFile);
     exit(-1);
   }
-  
+
   if ((stat( outFile, &stat2) == 0) && (stat2.st_size == stat1.st_size)) {
     fprintf(stderr, "Output file %s is already present and has the same size: %ld byte\nSkipping.\n", outFile, stat1.st_size);
     exit(0);
   }
-  
+
   printf( "*********************************************************\n");
-  printf( "Creating sequence: %s from sequence: %s theta: %.3f\n", outFile, bname, theta);
+  printf( "Creating sequence: %s from sequence: %s theta: %.3f threads: %d seed: %llu\n",
+	  outFile, bname, theta, nThreads, (unsigned long long) seed);
   printf( "*********************************************************\n");
-    
-  long written = 0, subst = 0, totLen = 0;
-  char n, *pi, *po;
-  FILE *fo, *fi;
-  size_t bufDim = 1048576; // 1 Mb
-  int  nr, i;
-  
-  if ((fo = fopen(outFile, "w")) == NULL) {
+
+  int fi, fo;
+
+  if ((fi = open(inputFile, O_RDONLY)) < 0) {
+    fprintf(stderr, "Opening input file: %s\n", inputFile);
+    exit(-1);
+  }
+
+  if ((fo = open(outFile, O_WRONLY | O_CREAT | O_TRUNC, 0644)) < 0) {
     fprintf(stderr, "Opening output file: %s\n", outFile);
     exit(-1);
   }
 
-  if ((fi = fopen(inputFile, "rb")) == NULL) {
-    fprintf(stderr, "Opening input file: %s\n", inputFile);
+  // il file di output ha la stessa dimensione dell'input: preallocato e scritto per blocchi
+  if (ftruncate(fo, stat1.st_size) < 0) {
+    perror("ftruncate");
     exit(-1);
   }
 
-  char * bufin = malloc( bufDim);
+  off_t *bounds;
+  long i, subst = 0;
+  int t2 = theta * 1000; // 0.005 -> 5, 0.05 -> 50, 0.5 -> 500
 
-  if (bufin == NULL) {
-    fprintf(stderr, "Errore di allocazione memoria\n");
-    exit(-2);
+  nChunks = chunkBoundaries(fi, stat1.st_size, &bounds);
+  chunks = calloc( nChunks, sizeof(Chunk));
+  for( i = 0; i < nChunks; i++) {
+    chunks[i] = (Chunk) { fi, fo, bounds[i], bounds[i+1], seed, i, t2, 0 };
   }
 
-  char * bufout = malloc( bufDim);
+  pthread_t *threads = malloc( nThreads * sizeof(pthread_t));
+  for( i = 0; i < nThreads; i++)
+    pthread_create(&threads[i], NULL, worker, NULL);
+  for( i = 0; i < nThreads; i++)
+    pthread_join(threads[i], NULL);
 
-  if (bufout == NULL) {
-    fprintf(stderr, "Errore di allocazione memoria\n");
-    exit(-2);
-  }
+  for( i = 0; i < nChunks; i++)
+    subst += chunks[i].subst;
 
-  int t2 = theta * 1000; // 0.005 -> 5, 0.05 -> 50, 0.5 -> 500
-  while((nr = fread(bufin, (size_t) 1, bufDim, fi)) > 0) {
-      
-      po = bufout;
-      for( pi = bufin, i = 0; i < nr; i++, pi++) {
-      
-	char c = toupper(*pi);
-	if ((random() % 1000) < t2) {
-	  
-	  int j = random() % 3;
-	  
-	  switch ( c) {
-	  case 'A':
-	    n = "CGT"[j];
-	    break;
-	    
-       	  case 'C':
-	    n = "AGT"[j];
-	    break;
-	    
-	  case 'G':
-	    n = "ACT"[j];
-	    break;
-	    
-	  case 'T':
-	    n = "ACG"[j];
-	    break;
-	    
-	  default:
-	    n = c;  // altri caratteri 'N' o fine linea
-	    subst--;
-	    break;
-	  }
-	  subst++;
-	}
-	else {
-	  n = c;  // lascia lo stesso carattere
-	}
-	*po = n;
-	po++;
-      } // chiude il for
-          
-      if (fwrite( bufout, (size_t) 1, nr, fo) < 0) {
-	fprintf(stderr, "Errore di scrittura nel file di output\n");
-	perror("errore di scrittura");
-	exit(-1);
-      }
-      totLen += nr;
-      write(1, ".", 1);                        
-    } // while !eof
+  close(fi);
+  if (close(fo) < 0) {
+    perror("errore di scrittura");
+    exit(-1);
+  }
 
-  printf("\n%s -> %ld/%ld substitutions\n", outFile, subst, totLen);
+  printf("\n%s -> %ld/%ld substitutions\n", outFile, subst, (long) stat1.st_size);
 }